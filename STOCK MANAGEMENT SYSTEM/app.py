@@ -1,305 +1,727 @@
-from flask import Flask, jsonify, send_from_directory, render_template, request
-from portfolio import PortfolioManager
-# --- THIS IS THE FIX ---
-from data_loader import (
-    load_transactions_from_excel, 
-    load_portfolio_from_excel,
-    save_summary_to_excel # Import our new save function
-)
-# --- END OF FIX ---
-from openpyxl import load_workbook
-# ---
-# --- NEW: Import numpy ---
-import numpy as np
-# ---
-# --- NEW: Import the calculator directly ---
-from calculator import PortfolioCalculator
-# ---
-# --- *** THIS IS THE FIX *** ---
-import pandas as pd
-# ---
-
-
-# Initialize Flask
-app = Flask(__name__)
-
-# --- Data Loading ---
-# We must wrap data loading in a function to "refresh" it after adding a transaction.
-excel_file = "data/Book 3 full final.xlsx"
-transactions_df = None
-portfolio_df = None
-pm = None
-
-def load_data():
-    """Loads all data from the Excel file and updates global variables."""
-    global transactions_df, portfolio_df, pm
-    
-    # 1. Load the new transactions from Sheet1
-    transactions_df = load_transactions_from_excel(excel_file)
-    
-    # 2. Load the price list/template from Sheet2
-    price_and_template_df = load_portfolio_from_excel(excel_file) 
-    
-    # --- THIS IS THE CRITICAL FIX ---
-    # We now call our new calculator function to generate the summary
-    # from scratch, using Sheet1 (transactions) and Sheet2 (prices).
-    
-    print("Recalculating portfolio summary from transactions...")
-    
-    portfolio_df = PortfolioCalculator.create_portfolio_summary(
-        transactions_df, 
-        price_and_template_df
-    )
-    
-    if portfolio_df is not None:
-        print("✓ Portfolio summary was successfully recalculated.")
-        
-        # --- THIS IS THE NEW STEP ---
-        try:
-            # Also save this new summary back to the Excel file
-            save_summary_to_excel(portfolio_df, excel_file, "Calculated_Summary")
-            print(f"✓ Saved updated summary to 'Calculated_Summary' sheet.")
-        except Exception as e:
-            print(f"❌ Warning: Could not save summary to Excel. {e}")
-        # --- END OF NEW STEP ---
-            
-    else:
-        print("❌ ERROR: Portfolio summary calculation failed. Check data.")
-        # Create an empty dataframe to avoid crashes
-        portfolio_df = pd.DataFrame(columns=[
-            'Company Symbol', 'Company Name', 'Total Bought (PKR)', 'Total Sold(PKR)', 
-            'Net Shares', 'Average Buy Price(PKR)', 'Current Market Price (PKR)', 
-            'Market Value (PKR)', 'Profit/Loss (PKR)', 'Status'
-        ])
-    # --- END OF FIX ---
-    
-    # 3. Initialize the manager with the *newly calculated* data
-    pm = PortfolioManager(transactions_df, portfolio_df)
-    
-    print("✓ Data reloaded from Excel.")
-
-# Load data on initial server start
-load_data()
-
-
-# --- Serve Frontend HTML Pages ---
-
-@app.route("/")
-def home():
-    return render_template("index.html") 
-
-@app.route('/login')
-def login():
-    return render_template('login.html')
-
-@app.route('/index2_seeinvestments')
-def see_investments():
-    return render_template('index2_seeinvestment.html')
-
-@app.route('/analysis')
-def analysis():
-    return render_template('analysis.html')
-
-# --- NEW: Route to serve the "Add Stock" page ---
-@app.route('/add_stock')
-def add_stock_page():
-    return render_template('add_stock.html')
-
-
-# --- API Endpoints ---
-
-@app.route("/summary")
-def summary():
-    # FIX: Convert all NumPy-derived financial totals to standard Python float() 
-    # to prevent "TypeError: Object of type int64 is not JSON serializable".
-    
-    # We use the global, recalculated dataframes
-    total_investment = 0.0
-    total_sales = 0.0
-    portfolio_value = 0.0
-    net_profit_loss = 0.0
-
-    if transactions_df is not None:
-        total_investment = float(PortfolioCalculator.calculate_total_investment(transactions_df))
-        total_sales = float(PortfolioCalculator.calculate_total_sales(transactions_df))
-    
-    if portfolio_df is not None:
-        portfolio_value = float(PortfolioCalculator.calculate_portfolio_value(portfolio_df))
-        net_profit_loss = float(PortfolioCalculator.calculate_net_profit_loss(portfolio_df))
-
-    return jsonify({
-        "total_investment": total_investment,
-        "total_sales": total_sales,
-        "portfolio_value": portfolio_value,
-        "net_profit_loss": net_profit_loss
-    })
-
-@app.route("/holdings")
-def holdings():
-    # This endpoint now returns the *recalculated* portfolio_df from load_data()
-    
-    # Handle case where portfolio is empty
-    if portfolio_df is None or portfolio_df.empty:
-        return jsonify([])
-
-    # --- FINAL FIX FOR int64 ERROR ---
-    # 1. Replace NaN with None (for JSON null)
-    df_clean = portfolio_df.replace({np.nan: None})
-    
-    # 2. Convert DataFrame to a list of dicts
-    records = df_clean.to_dict(orient="records")
-    
-    # 3. Manually convert all numpy types to python types
-    clean_records = []
-    for record in records:
-        clean_record = {}
-        for key, value in record.items():
-            if isinstance(value, (np.int64, np.int32, np.int16)):
-                clean_record[key] = int(value)
-            elif isinstance(value, (np.float64, np.float32)):
-                clean_record[key] = float(value)
-            elif pd.isna(value):
-                clean_record[key] = None
-            else:
-                clean_record[key] = value
-        clean_records.append(clean_record)
-    
-    return jsonify(clean_records)
-    # --- END OF FIX ---
-
-# --- NEW: API Endpoint to handle adding a transaction ---
-@app.route("/api/add_transaction", methods=['POST'])
-def add_transaction():
-    try:
-        data = request.json
-        print(f"Received data: {data}")
-
-        # --- Logic to write to the Excel file ---
-        
-        # 1. Load the workbook
-        wb = load_workbook(excel_file)
-        
-        # 2. Get the "PSX Transactions" sheet (assuming it's 'Sheet1')
-        ws = wb['Sheet1'] 
-        
-        # --- THIS IS THE FIX ---
-        # Find the next empty row after the last data row, not just max_row
-        next_row = ws.max_row
-        # Iterate backwards to find the last cell with actual data
-        for row in range(ws.max_row, 1, -1):
-            if ws.cell(row=row, column=1).value:
-                next_row = row + 1
-                break
-        else:
-            # If loop finishes, it means sheet is empty or only has a header
-            if ws.cell(row=1, column=1).value:
-                 next_row = ws.max_row + 1 # Use max_row + 1 if header exists
-            else:
-                 next_row = 1 # Sheet is completely empty
-        
-        # If next_row is still 1 (empty sheet), but we skipped row 1 (header=1),
-        # we should start at row 2.
-        if next_row < 3: # Assuming row 1 is title, row 2 is header
-             # Let's find the first empty row after the header (row 2)
-             next_row = 2 
-             while ws.cell(row=next_row, column=1).value:
-                   next_row += 1
-        # --- END OF FIX ---
-
-        # 3. Create the new row list from the 'data' object.
-        #    Ensure the order matches your Excel columns
-        new_row_data = [
-            data['date'],
-            data['symbol'],
-            data['companyName'],
-            data['transactionType'],
-            data['quantity'],
-            data['price'],
-            data['totalAmount'],
-            data['remarks']
-        ]
-        
-        # 4. Write the new row cell by cell to the correct row
-        for col_idx, cell_value in enumerate(new_row_data, start=1):
-            ws.cell(row=next_row, column=col_idx, value=cell_value)
-        
-        # 5. Save the workbook
-        wb.save(excel_file)
-        
-        # --- IMPORTANT ---
-        # Now that the file is saved, we re-run all calculations.
-        
-        # This function re-reads the Excel file and re-populates all variables
-        load_data()
-
-        # If all went well, send success
-        return jsonify({"success": True})
-
-    except Exception as e:
-        print(f"Error adding transaction: {e}")
-        import traceback
-        traceback.print_exc()
-        # Send a specific error back to the frontend
-        return jsonify({"success": False, "error": str(e)}), 500
-
-
-@app.route("/top-performers")
-def top_performers():
-    # This uses the global portfolio_df, which is now recalculated
-    top = PortfolioCalculator.get_top_performers(portfolio_df)
-    
-    if top is not None:
-        # --- FIX: Need to clean numpy types here too ---
-        df_clean = top.replace({np.nan: None})
-        records = df_clean.to_dict(orient="records")
-        clean_records = []
-        for record in records:
-            clean_record = {}
-            for key, value in record.items():
-                if isinstance(value, (np.int64, np.int32, np.int16)):
-                    clean_record[key] = int(value)
-                elif isinstance(value, (np.float64, np.float32)):
-                    clean_record[key] = float(value)
-                elif pd.isna(value):
-                    clean_record[key] = None
-                else:
-                    clean_record[key] = value
-            clean_records.append(clean_record)
-        return jsonify(clean_records)
-        # --- END OF FIX ---
-    return jsonify([])
-
-@app.route("/company/<symbol>")
-def company(symbol):
-    # This uses the global portfolio_df, which is now recalculated
-    data = PortfolioCalculator.get_company_analysis(portfolio_df, symbol)
-    
-    if not data:
-        return jsonify({})
-
-    # --- THIS IS THE NEW FIX ---
-    # Loop through the dictionary and cast all numpy types to standard python types
-    clean_data = {}
-    for key, value in data.items():
-        if isinstance(value, (np.int64, np.int32, np.int16)):
-            clean_data[key] = int(value)  # Cast int64 to python int
-        elif isinstance(value, (np.float64, np.float32)):
-            clean_data[key] = float(value) # Cast float64 to python float
-        elif pd.isna(value):
-            clean_data[key] = None         # Handle NaN
-        else:
-            clean_data[key] = value
-    # --- END OF FIX ---
-    
-    return jsonify(clean_data)
-
-@app.route("/transactions")
-def transactions():
-    # This just uses the transactions_df, which is fine
-    if transactions_df is None:
-        return jsonify({})
-    return jsonify(PortfolioCalculator.analyze_transactions_by_company(transactions_df) or {})
-
-# Run Flask
-if __name__ == "__main__":
+import os
+import threading
+import time
+from flask import Flask, jsonify, render_template, request, abort, g
+# --- THIS IS THE FIX ---
+from data_loader import (
+    load_transactions_from_excel, 
+    load_portfolio_from_excel,
+    save_summary_to_excel, # Import our new save function
+    TRANSACTION_COLUMNS
+)
+# --- END OF FIX ---
+# --- Versioned, read-only portfolio snapshots (built by the incremental ledger) ---
+from portfolio_state import PortfolioState
+from shared_state import SharedPortfolioState
+# ---
+# --- Several portfolios under /p/<portfolio_id>/ (loaded on demand, LRU) ---
+from portfolios import LoadedPortfolio, PortfolioRegistry, load_state, new_state
+# ---
+# --- Background loading at start-up (/healthz, /readyz) ---
+from warmup import WarmUp
+# ---
+# --- Timing spans, request metrics (/metrics) and optional profiling ---
+from metrics import metrics, start_profile, save_profile
+# ---
+# --- Storage backend (Excel workbook + journal, or SQLite) ---
+from storage import create_storage
+# ---
+# --- Added transactions are stored by a background writer ---
+from write_queue import TransactionQueue, QUEUED
+# ---
+# --- Bulk upload parsing/validation ---
+from bulk_import import read_upload, validate_rows
+# ---
+# --- Price list updates (API + prices.py CLI) ---
+from prices import price_pairs, validate_prices
+# ---
+# --- ETags + serialized bodies cached per snapshot version ---
+from http_cache import ResponseCache
+# ---
+# --- Column-at-a-time JSON conversion ---
+from serialization import LAYOUTS, serialize_frame, to_native
+# ---
+# --- Top/bottom-N rankings kept with each snapshot ---
+from leaderboard import LEADERBOARD_METRICS
+# ---
+# --- Server-Sent Events: live deltas for the dashboards ---
+from live_updates import LiveBroadcaster
+# ---
+# --- NEW: Import the calculator directly ---
+from calculator import COST_METHODS, PortfolioCalculator, PORTFOLIO_COLUMNS
+# ---
+# --- *** THIS IS THE FIX *** ---
+import pandas as pd
+# ---
+
+
+# Initialize Flask
+app = Flask(__name__)
+
+# --- Data Loading ---
+# The portfolio lives in a PortfolioState: every rebuild or new transaction
+# publishes a new, read-only PortfolioSnapshot, and the routes below always
+# work on one snapshot (current_state().snapshot), never on half-updated globals.
+excel_file = "data/Book 3 full final.xlsx"
+
+# PORTFOLIO_BACKEND=sqlite keeps the data in PORTFOLIO_DB (default
+# data/Book 3 full final.db, filled from the workbook on first start).
+# With the default Excel backend, new transactions go to a journal next to
+# the workbook and are compacted into Sheet1 every JOURNAL_COMPACT_INTERVAL
+# seconds, or as soon as JOURNAL_COMPACT_ROWS rows are waiting.
+compact_interval = float(os.environ.get("JOURNAL_COMPACT_INTERVAL", "30"))
+compact_rows = int(os.environ.get("JOURNAL_COMPACT_ROWS", "200"))
+storage = create_storage(
+    excel_file,
+    backend=os.environ.get("PORTFOLIO_BACKEND"),
+    db_path=os.environ.get("PORTFOLIO_DB"),
+    compact_interval=compact_interval,
+    compact_rows=compact_rows
+)
+
+# Load data on initial server start, on a background thread: the server
+# answers at once, /readyz reports when the data is in, and the data
+# endpoints answer 503 (with Retry-After) until then.
+# With PORTFOLIO_SHARED_SNAPSHOTS=1 (several worker processes, e.g.
+# gunicorn -w 4) only one worker loads the data and runs the compactor;
+# it shares every snapshot with the others through shared memory.
+shared_snapshots = os.environ.get("PORTFOLIO_SHARED_SNAPSHOTS") == "1"
+state = new_state(storage, excel_file, shared_snapshots)
+warmup = WarmUp(lambda: load_state(state)).start()
+
+# /api/add_transaction only queues the row and answers 202 with its id;
+# one writer thread stores whatever is queued (per portfolio, one journal
+# write and one recompute for the lot). GET /api/transactions/<id>?wait=<s>
+# tells when a row is durable.
+transaction_queue = TransactionQueue()
+
+# Longest ?wait= a status request may block for
+MAX_STATUS_WAIT = 30
+
+# Seconds a client is asked to wait (Retry-After) while the data loads
+WARMUP_RETRY_AFTER = 5
+
+# Endpoints that don't need the default portfolio's data: the pages, the
+# health checks, metrics and the registry (/p/<id>/ portfolios load on demand)
+WARMUP_EXEMPT = {
+    'static', 'home', 'login', 'see_investments', 'analysis', 'add_stock_page',
+    'healthz', 'readyz', 'prometheus_metrics', 'loaded_portfolios', 'transaction_status'
+}
+
+# More portfolios: /p/<portfolio_id>/... serves PORTFOLIO_DIR/<portfolio_id>.xlsx
+# (or .db with the SQLite backend) with the same endpoints as the default one.
+# At most PORTFOLIO_CACHE_SIZE of them, and PORTFOLIO_CACHE_MB of data, stay
+# loaded; the least recently used, and any idle for PORTFOLIO_IDLE_SECONDS,
+# are unloaded and read from disk again when next asked for.
+def portfolio_unloaded(loaded):
+    response_cache.forget(loaded.state.snapshot.epoch)
+    with portfolio_streams_lock:
+        broadcaster = portfolio_streams.pop(loaded.portfolio_id, None)
+    if broadcaster is not None:
+        broadcaster.stop()
+
+portfolios = PortfolioRegistry(
+    os.environ.get("PORTFOLIO_DIR", "data/portfolios"),
+    backend=os.environ.get("PORTFOLIO_BACKEND"),
+    shared=shared_snapshots,
+    max_loaded=int(os.environ.get("PORTFOLIO_CACHE_SIZE", "16")),
+    max_bytes=int(float(os.environ.get("PORTFOLIO_CACHE_MB", "512")) * 2**20),
+    idle_timeout=float(os.environ.get("PORTFOLIO_IDLE_SECONDS", "900")),
+    on_evict=portfolio_unloaded,
+    compact_interval=compact_interval,
+    compact_rows=compact_rows
+)
+
+def current_portfolio():
+    """
+    The LoadedPortfolio of a /p/<portfolio_id>/ request, None for the default one
+    """
+    portfolio_id = g.get('portfolio_id')
+    if portfolio_id is None:
+        return None
+    if 'portfolio' not in g:
+        # Checked out for the rest of the request (see release_portfolio),
+        # so it can't be unloaded while this request uses it
+        try:
+            g.portfolio = portfolios.checkout(portfolio_id)
+        except KeyError:
+            abort(404, f"Unknown portfolio '{portfolio_id}'")
+    return g.portfolio
+
+def current_state():
+    loaded = current_portfolio()
+    return state if loaded is None else loaded.state
+
+# Read endpoints answer If-None-Match with 304 and reuse their JSON body
+# until the next snapshot is published
+response_cache = ResponseCache(app, lambda: current_state().snapshot)
+
+# One broadcaster per process (and loaded portfolio): it builds each
+# version's delta once and every open dashboard (/api/stream) gets the same message
+live_updates = LiveBroadcaster(lambda: state.snapshot)
+portfolio_streams = {}
+portfolio_streams_lock = threading.Lock()
+
+def current_live_updates():
+    loaded = current_portfolio()
+    if loaded is None:
+        return live_updates
+    with portfolio_streams_lock:
+        broadcaster = portfolio_streams.get(loaded.portfolio_id)
+        if broadcaster is None:
+            broadcaster = LiveBroadcaster(lambda: loaded.state.snapshot)
+            portfolio_streams[loaded.portfolio_id] = broadcaster
+    return broadcaster
+
+@app.url_value_preprocessor
+def pick_portfolio(endpoint, values):
+    # /p/<portfolio_id>/ routes: the id is taken out of the arguments here,
+    # so every view reads its portfolio through current_state()
+    g.portfolio_id = values.pop('portfolio_id', None) if values else None
+    if g.portfolio_id is not None and not portfolios.exists(g.portfolio_id):
+        abort(404, f"Unknown portfolio '{g.portfolio_id}'")
+
+@app.teardown_request
+def release_portfolio(exc):
+    loaded = g.pop('portfolio', None)
+    if loaded is not None:
+        portfolios.checkin(loaded)
+
+# Sizes the default portfolio's snapshots for /metrics (hosted ones measure themselves)
+default_portfolio = LoadedPortfolio('default', state)
+
+# PORTFOLIO_PROFILE=1 lets any request add ?profile=1: it is run under
+# cProfile and the stats are written to PORTFOLIO_PROFILE_DIR (default
+# profiles/); the X-Profile response header names the file.
+profiling_enabled = os.environ.get("PORTFOLIO_PROFILE") == "1"
+profile_dir = os.environ.get("PORTFOLIO_PROFILE_DIR", "profiles")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiling_enabled and request.args.get('profile') == '1':
+        try:
+            g.profile = start_profile()
+        except ValueError:
+            pass  # another request is being profiled right now
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        route=route, method=request.method)
+    metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile'] = save_profile(profile, profile_dir, request.endpoint or 'request')
+    return response
+
+@app.before_request
+def wait_for_warmup():
+    if warmup.ready or request.url_rule is None or g.get('portfolio_id') is not None:
+        return None
+    if request.endpoint in WARMUP_EXEMPT:
+        return None
+    response = jsonify({
+        "success": False,
+        "error": "The portfolio is still loading, try again shortly.",
+        "retry_after": WARMUP_RETRY_AFTER
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(WARMUP_RETRY_AFTER)
+    return response
+
+def url_base():
+    # URL prefix of the portfolio being served ('' for the default one)
+    portfolio_id = g.get('portfolio_id')
+    return f"/p/{portfolio_id}" if portfolio_id else ''
+
+@app.context_processor
+def portfolio_base():
+    # The pages call the endpoints of the portfolio they were opened for
+    return {'base': url_base()}
+
+
+# --- Serve Frontend HTML Pages ---
+
+@app.route("/")
+def home():
+    return render_template("index.html") 
+
+@app.route('/login')
+def login():
+    return render_template('login.html')
+
+@app.route('/index2_seeinvestments')
+def see_investments():
+    return render_template('index2_seeinvestment.html')
+
+@app.route('/analysis')
+def analysis():
+    return render_template('analysis.html')
+
+# --- NEW: Route to serve the "Add Stock" page ---
+@app.route('/add_stock')
+def add_stock_page():
+    return render_template('add_stock.html')
+
+
+# --- Health checks ---
+
+@app.route("/healthz")
+def healthz():
+    # The process is up and serving requests
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    # Ready once the default portfolio is loaded: {"ready", "version", "seconds" (load time), ...}
+    status = warmup.status()
+    status['version'] = state.snapshot.version
+    response = jsonify(status)
+    if not status['ready']:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(WARMUP_RETRY_AFTER)
+    return response
+
+
+# --- API Endpoints ---
+
+def json_abort(status, message):
+    """
+    Stops the request with the API's JSON error body ({"success": false, "error": ...})
+    """
+    response = jsonify({"success": False, "error": message})
+    response.status_code = status
+    abort(response)
+
+def response_layout():
+    """
+    ?layout=records (default, a list of row objects) or ?layout=columnar
+    """
+    layout = request.args.get('layout', 'records')
+    if layout not in LAYOUTS:
+        abort(400, f"Unknown layout '{layout}'")
+    return layout
+
+@app.route("/summary")
+@response_cache.cached
+def summary(snapshot):
+    # Everything comes from one snapshot, so the totals always match.
+    # ?method=fifo|lifo|average adds the realized/unrealized split of the
+    # P/L (lot matching over the whole ledger, once per version)
+    method = cost_method(default=None)
+    if method is None:
+        return snapshot.summary
+    return snapshot.lot_summary(method)
+
+def page_query():
+    """
+    Paging/sorting/filtering parameters of a list endpoint, or None if the
+    request has none (then the full list is returned, as before):
+    ?limit=&offset= ?sort=<column or alias>&order=asc|desc ?prefix=<symbol prefix> ?pl=positive|negative|zero
+    """
+    if not any(name in request.args for name in ('limit', 'offset', 'sort', 'order', 'prefix', 'pl')):
+        return None
+    try:
+        # int() here, not args.get(type=int): that one quietly ignores a bad value
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        offset = int(request.args.get('offset', 0))
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError
+    except ValueError:
+        json_abort(400, "limit and offset must be non-negative integers")
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        json_abort(400, "order must be 'asc' or 'desc'")
+    return {
+        'sort': request.args.get('sort'),
+        'descending': order == 'desc',
+        'prefix': request.args.get('prefix'),
+        'sign': request.args.get('pl'),
+        'offset': offset,
+        'limit': limit
+    }
+
+def paged_response(index, query, format_page):
+    """
+    Cuts one page out of a snapshot's SortedIndex:
+    {"total", "offset", "limit", "next_offset", "items"}
+    """
+    try:
+        page_df, total = index.page(**query)
+    except ValueError as e:
+        json_abort(400, str(e))
+    end = query['offset'] + len(page_df)
+    return {
+        "total": total,
+        "offset": query['offset'],
+        "limit": query['limit'],
+        "next_offset": end if end < total else None,
+        "items": format_page(page_df)
+    }
+
+@app.route("/holdings")
+@response_cache.cached
+def holdings(snapshot):
+    # This endpoint returns the recalculated summary of the current snapshot
+    portfolio_df = snapshot.portfolio_df
+
+    # Paged/sorted/filtered requests are cut out of the snapshot's sorted index
+    query = page_query()
+    if query is not None:
+        layout = response_layout()
+        return paged_response(
+            snapshot.holdings_index, query,
+            lambda page: serialize_frame(PortfolioCalculator.format_summary(page), layout)
+        )
+    
+    # Handle case where portfolio is empty
+    if portfolio_df is None or portfolio_df.empty:
+        return []
+
+    # Format 'Status' from the numeric P/L % and convert each column to
+    # JSON types in one go (?layout=columnar sends column lists instead of rows)
+    return serialize_frame(PortfolioCalculator.format_summary(portfolio_df), response_layout())
+
+# --- NEW: API Endpoint to handle adding a transaction ---
+@app.route("/api/add_transaction", methods=['POST'])
+def add_transaction():
+    try:
+        data = request.json
+        print(f"Received data: {data}")
+
+        # 1. Create the new row from the 'data' object.
+        #    Ensure the order matches your Excel columns
+        new_row_data = [
+            data['date'],
+            data['symbol'],
+            data['companyName'],
+            data['transactionType'],
+            data['quantity'],
+            data['price'],
+            data['totalAmount'],
+            data['remarks']
+        ]
+        accepted, rejected = validate_rows([(1, dict(zip(TRANSACTION_COLUMNS, new_row_data)))])
+        if rejected:
+            return jsonify({"success": False, "error": rejected[0]['reason']}), 400
+
+        # 2. Queue it for the background writer, which stores it durably
+        #    (Excel: one small fsync'd journal write that the background
+        #    compactor moves into Sheet1 later; SQLite: one INSERT) and
+        #    applies it to the ledger, which publishes a new snapshot.
+        #    Rows queued together are written and applied together.
+        #
+        # --- IMPORTANT ---
+        # We only apply the new row to the ledger.
+        # The full rebuild is only needed at startup or through /api/rebuild.
+        # A hosted portfolio stays loaded until the writer is done with the row
+        loaded = current_portfolio()
+        on_done = None
+        if loaded is not None:
+            portfolios.hold(loaded)
+            on_done = lambda: portfolios.checkin(loaded)
+        txn_id = transaction_queue.submit(current_state(), accepted[0], on_done)
+
+        # Accepted: the caller can follow it at status_url
+        return jsonify({
+            "success": True,
+            "transaction_id": txn_id,
+            "status": QUEUED,
+            "status_url": f"{url_base()}/api/transactions/{txn_id}"
+        }), 202
+
+    except Exception as e:
+        print(f"Error adding transaction: {e}")
+        import traceback
+        traceback.print_exc()
+        # Send a specific error back to the frontend
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/api/transactions/<txn_id>")
+def transaction_status(txn_id):
+    # queued -> durable (stored and in the snapshot 'version') or failed.
+    # ?wait=<seconds> holds the request until it is no longer queued.
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_STATUS_WAIT)
+    except ValueError:
+        abort(400, "wait should be a number of seconds")
+
+    if wait > 0:
+        status = transaction_queue.wait(txn_id, wait)
+    else:
+        status = transaction_queue.status(txn_id)
+    if status is None:
+        abort(404, f"Unknown transaction '{txn_id}'")
+    return jsonify(status)
+
+
+# --- Bulk import: JSON array, CSV or XLSX upload ---
+@app.route("/api/transactions/bulk", methods=['POST'])
+def bulk_add_transactions():
+    try:
+        # Rows are parsed and validated one at a time as the upload is read
+        accepted, rejected = validate_rows(read_upload(request))
+    except Exception as e:
+        print(f"Error reading bulk upload: {e}")
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        if accepted:
+            # One durable write for the whole batch, then one recompute
+            current_state().add_transactions(accepted)
+
+        print(f"✓ Bulk import: {len(accepted)} rows added, {len(rejected)} rejected.")
+        return jsonify({
+            "success": True,
+            "accepted": len(accepted),
+            "rejected": rejected
+        })
+
+    except Exception as e:
+        print(f"Error adding bulk transactions: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# --- Price-only updates: {symbol: price}, no re-aggregation ---
+@app.route("/api/prices", methods=['POST'])
+def update_prices():
+    try:
+        prices, rejected = validate_prices(price_pairs(request.get_json()))
+    except Exception as e:
+        print(f"Error reading prices: {e}")
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if rejected or not prices:
+        # All or nothing, so a typo doesn't leave half the prices updated
+        return jsonify({"success": False, "error": "No valid prices" if not rejected else "Invalid prices",
+                        "rejected": rejected}), 400
+
+    try:
+        changed = current_state().update_prices(prices)
+        print(f"✓ Prices updated: {len(prices)} symbols, {changed} holdings repriced.")
+        return jsonify({"success": True, "updated": len(prices), "changed": changed})
+    except Exception as e:
+        print(f"Error updating prices: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# --- Live updates (Server-Sent Events) ---
+@app.route("/api/stream")
+def stream():
+    # 'hello' with the current version, then one 'delta' per new version:
+    # {"base", "tag", "holdings": changed rows, "removed", "summary", "leaderboard"}
+    response = app.response_class(current_live_updates().stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let a reverse proxy hold the events back
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Full rebuild from the Excel file, on request ---
+@app.route("/api/rebuild", methods=['POST'])
+def rebuild():
+    try:
+        current_state().rebuild()
+        return jsonify({"success": True})
+    except Exception as e:
+        print(f"Error rebuilding portfolio: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Latency histograms, counters and the current snapshot's size in the
+    Prometheus text format
+    """
+    loaded = current_portfolio() or default_portfolio
+    snapshot = loaded.state.snapshot
+    base, new_row_count = snapshot.transactions_parts()
+    portfolio = loaded.portfolio_id
+    metrics.set('portfolio_snapshot_version', snapshot.version, portfolio=portfolio)
+    metrics.set('portfolio_transactions', (0 if base is None else len(base)) + new_row_count, portfolio=portfolio)
+    metrics.set('portfolio_symbols', 0 if snapshot.portfolio_df is None else len(snapshot.portfolio_df),
+                portfolio=portfolio)
+    metrics.set('portfolio_snapshot_bytes', loaded.measure(), portfolio=portfolio)
+
+    hosted = portfolios.stats()
+    metrics.set('portfolio_hosted_loaded', len(hosted['loaded']))
+    metrics.clear('portfolio_hosted_bytes')
+    for entry in hosted['loaded']:
+        metrics.set('portfolio_hosted_bytes', entry['bytes'], portfolio=entry['id'])
+
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/top-performers")
+@response_cache.cached
+def top_performers(snapshot):
+    """
+    ?n=3 (how many), ?metric=pl|return|value|invested, ?direction=top|bottom
+    """
+    n = request.args.get('n', 3, type=int)
+    metric = request.args.get('metric', 'pl')
+    direction = request.args.get('direction', 'top')
+    if metric not in LEADERBOARD_METRICS:
+        abort(400, f"Unknown metric '{metric}'")
+    if direction not in ('top', 'bottom'):
+        abort(400, "direction must be 'top' or 'bottom'")
+
+    # The snapshot's leaderboard is already sorted, so this only reads n rows
+    portfolio_df = snapshot.portfolio_df
+    if portfolio_df is None or portfolio_df.empty:
+        return []
+    board = snapshot.leaderboard
+    positions = board.top(metric, n) if direction == 'top' else board.bottom(metric, n)
+
+    columns = ['Company Symbol', 'Company Name', 'Profit/Loss (PKR)', 'Profit/Loss %']
+    if LEADERBOARD_METRICS[metric] not in columns:
+        columns.append(LEADERBOARD_METRICS[metric])
+    return serialize_frame(portfolio_df.iloc[positions][columns], response_layout())
+
+def company_response(data):
+    if not data:
+        return {}
+    return {key: to_native(value) for key, value in data.items()}
+
+def cost_method(default='fifo'):
+    """
+    ?method=fifo (default), lifo or average: how sales are matched to lots
+    """
+    method = request.args.get('method', default)
+    if method is None:
+        return None
+    if method not in COST_METHODS:
+        abort(400, f"Unknown cost method '{method}'")
+    return method
+
+def with_lots(data, book, price):
+    # Adds the lot-based split of the P/L to a company's details
+    if data:
+        lots = book.company(data['symbol'], price)
+        data['cost_method'] = lots['method']
+        data['realized_pl'] = lots['realized_pl']
+        data['unrealized_pl'] = lots['unrealized_pl']
+        data['lot_cost_basis'] = lots['cost_basis']
+    return data
+
+@app.route("/company/<symbol>")
+@response_cache.cached
+def company(snapshot, symbol):
+    # This uses the recalculated summary of the current snapshot
+    data = PortfolioCalculator.get_company_analysis(
+        snapshot.portfolio_df, symbol, snapshot.symbol_index
+    )
+    # The lot split (?method=) matches this company's rows only when asked for
+    method = cost_method(default=None)
+    if data and method is not None:
+        data = with_lots(data, snapshot.lots(method, [data['symbol']]), data['current_price'])
+    return company_response(data)
+
+@app.route("/company")
+@response_cache.cached
+def companies(snapshot):
+    """
+    Several companies in one response: /company?symbols=ENGRO,LUCK gives
+    {"ENGRO": {...}, "LUCK": {...}} ({} for a symbol that isn't held)
+    """
+    symbols = [symbol.strip() for symbol in request.args.get('symbols', '').split(',') if symbol.strip()]
+    if not symbols:
+        abort(400, "Pass the symbols as ?symbols=A,B,C")
+
+    details = PortfolioCalculator.get_companies_analysis(
+        snapshot.portfolio_df, symbols, snapshot.symbol_index
+    )
+    method = cost_method(default=None)
+    if method is not None:
+        book = snapshot.lots(method, [symbol for symbol, data in details.items() if data])
+        for data in details.values():
+            if data:
+                with_lots(data, book, data['current_price'])
+    return {symbol: company_response(data) for symbol, data in details.items()}
+
+@app.route("/lots/<symbol>")
+@response_cache.cached
+def lots(snapshot, symbol):
+    """
+    Open lots and realized/unrealized P/L of one company (?method=fifo|lifo|average)
+    """
+    symbol = symbol.upper()
+    book = snapshot.lots(cost_method(), [symbol])
+    if symbol not in book.companies:
+        return {}
+    row = snapshot.symbol_index.get(symbol) or {}
+    lots = book.company(symbol, row.get('Current Market Price (PKR)'))
+    lots['lots'] = [company_response(lot) for lot in lots['lots']]
+    return company_response(lots)
+
+@app.route("/history")
+@response_cache.cached
+def history(snapshot):
+    """
+    Portfolio totals over time: ?freq=daily|weekly, ?start= / ?end= (dates).
+    Returns {"points": [date + totals], "holdings": [date + net shares per company],
+    "undated": transactions left out}
+    """
+    freq = request.args.get('freq', 'daily')
+    try:
+        start = pd.Timestamp(request.args['start']) if request.args.get('start') else None
+        end = pd.Timestamp(request.args['end']) if request.args.get('end') else None
+        totals, holdings = PortfolioCalculator.portfolio_history(snapshot.history, freq, start, end)
+    except ValueError as e:
+        abort(400, str(e))
+
+    layout = response_layout()
+    dates = totals.index.strftime('%Y-%m-%d')
+    return {
+        'freq': freq,
+        # Transactions without a date can't be placed on the timeline
+        'undated': totals.attrs.get('undated', 0),
+        'points': serialize_frame(with_dates(totals, dates), layout),
+        'holdings': serialize_frame(with_dates(holdings, dates), layout)
+    }
+
+def with_dates(df, dates):
+    # The date index as a first 'Date' column of strings
+    frame = df.reset_index(drop=True)
+    frame.insert(0, 'Date', dates)
+    return frame
+
+@app.route("/transactions")
+@response_cache.cached
+def transactions(snapshot):
+    # Paged requests get a list of {"symbol", aggregates...} in the asked order
+    query = page_query()
+    if query is not None:
+        if query['sign']:
+            json_abort(400, "The pl filter is only available on /holdings")
+        return paged_response(snapshot.analysis_index, query, serialize_frame)
+
+    # The ledger already keeps the per-company analysis up to date
+    return snapshot.analysis or {}
+
+# --- Every route again under /p/<portfolio_id>/ for the hosted portfolios ---
+for rule in list(app.url_map.iter_rules()):
+    if rule.endpoint != 'static':
+        app.add_url_rule(
+            '/p/<portfolio_id>' + rule.rule, rule.endpoint,
+            methods=rule.methods - {'HEAD', 'OPTIONS'}
+        )
+
+@app.route("/api/portfolios")
+def loaded_portfolios():
+    # Which hosted portfolios are in memory, their estimated size and the limits
+    return jsonify(portfolios.stats())
+
+# Run Flask
+if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
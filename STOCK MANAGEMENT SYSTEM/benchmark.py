@@ -0,0 +1,255 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from calculator import PortfolioCalculator
+from data_loader import load_transactions_from_excel, load_portfolio_from_excel, memory_report
+from synthetic_data import generate_workbook
+
+# Scales measured when none are given: <transactions>x<symbols>
+DEFAULT_SCALES = ['1000x20', '10000x100', '100000x500']
+
+# Endpoints timed through the test client ({symbol} / {symbols} are filled in)
+ROUTES = [
+    '/summary',
+    '/holdings',
+    '/holdings?sort=pl&order=desc&limit=50',
+    '/transactions',
+    '/top-performers?n=10',
+    '/company/{symbol}',
+    '/company?symbols={symbols}',
+    '/lots/{symbol}',
+    '/history',
+    '/history?freq=weekly'
+]
+
+
+def parse_scale(text):
+    """
+    '10000x100' -> (10000, 100)
+    """
+    try:
+        transactions, symbols = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Scale '{text}' should look like 10000x100 (transactions x symbols)")
+    return transactions, symbols
+
+
+@contextlib.contextmanager
+def quiet():
+    # The loaders print a line per call; keep the benchmark output readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(run, repeat=5, setup=None):
+    """
+    Calls run() `repeat` times (setup() before each call, not timed).
+    Returns {'min', 'median', 'mean', 'runs'} in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with quiet():
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'runs': repeat
+    }
+
+
+def bench_functions(file_path, repeat):
+    """
+    Times the loaders (parsing the workbook, then from the snapshot cache)
+    and the calculator functions
+    """
+    results = {}
+    results['load_transactions_from_excel'] = measure(
+        lambda: load_transactions_from_excel(file_path, use_cache=False), repeat)
+    results['load_portfolio_from_excel'] = measure(
+        lambda: load_portfolio_from_excel(file_path, use_cache=False), repeat)
+
+    with quiet():
+        # Writes the snapshot cache
+        transactions_df = load_transactions_from_excel(file_path)
+        price_df = load_portfolio_from_excel(file_path)
+    results['load_transactions_from_excel (cached)'] = measure(
+        lambda: load_transactions_from_excel(file_path), repeat)
+    results['load_portfolio_from_excel (cached)'] = measure(
+        lambda: load_portfolio_from_excel(file_path), repeat)
+
+    results['create_portfolio_summary'] = measure(
+        lambda: PortfolioCalculator.create_portfolio_summary(transactions_df, price_df), repeat)
+    portfolio_df = PortfolioCalculator.create_portfolio_summary(transactions_df, price_df)
+    results['analyze_transactions_by_company'] = measure(
+        lambda: PortfolioCalculator.analyze_transactions_by_company(transactions_df), repeat)
+    results['get_top_performers'] = measure(
+        lambda: PortfolioCalculator.get_top_performers(portfolio_df), repeat)
+    return results
+
+
+def bench_routes(app_module, portfolio_id, symbols, repeat):
+    """
+    Times every route in ROUTES for one hosted portfolio (/p/<portfolio_id>/):
+    the first request, building the body (response cache emptied before each
+    call) and answering from the response cache
+    """
+    client = app_module.app.test_client()
+    results = {}
+
+    with quiet():
+        start = time.perf_counter()
+        loaded = app_module.portfolios.get(portfolio_id)
+        elapsed = time.perf_counter() - start
+    results['load portfolio'] = {'min': elapsed, 'median': elapsed, 'mean': elapsed, 'runs': 1}
+    epoch = loaded.state.snapshot.epoch
+
+    for route in ROUTES:
+        path = f"/p/{portfolio_id}" + route.format(symbol=symbols[0], symbols=','.join(symbols[:5]))
+
+        def get():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+        results[f"GET {route} (first)"] = measure(get, 1)
+        results[f"GET {route}"] = measure(get, repeat, setup=lambda: app_module.response_cache.forget(epoch))
+        results[f"GET {route} (cached)"] = measure(get, repeat)
+    return results
+
+
+def run_benchmarks(scales, repeat=5, routes=True, seed=0):
+    """
+    Generates a synthetic workbook per scale and times everything on it.
+    Returns the results as a JSON-ready dict.
+    """
+    folder = tempfile.mkdtemp(prefix='portfolio-bench-')
+    app_module = None
+    if routes:
+        # The hosted portfolios are read from the benchmark folder
+        os.environ['PORTFOLIO_DIR'] = folder
+        os.environ.setdefault('PORTFOLIO_IDLE_SECONDS', '86400')
+        with quiet():
+            import app as app_module
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'scales': []
+    }
+    try:
+        for scale in scales:
+            transactions, symbols = parse_scale(scale)
+            portfolio_id = f"bench-{transactions}x{symbols}"
+            file_path = os.path.join(folder, portfolio_id + '.xlsx')
+
+            print(f"Generating {transactions} transactions over {symbols} companies...")
+            start = time.perf_counter()
+            transactions_df, prices_df = generate_workbook(file_path, transactions, symbols, seed=seed)
+            print(f"✓ Workbook written in {time.perf_counter() - start:.1f}s.")
+
+            results = bench_functions(file_path, repeat)
+            with quiet():
+                memory = memory_report(load_transactions_from_excel(file_path))
+            if app_module is not None:
+                held = prices_df['Company Symbol'].tolist()
+                results.update(bench_routes(app_module, portfolio_id, held, repeat))
+                with quiet():
+                    app_module.portfolios.close()
+
+            report['scales'].append({
+                'scale': f"{transactions}x{symbols}",
+                'transactions': transactions,
+                'symbols': symbols,
+                'memory': memory,
+                'results': results
+            })
+            print(f"  {'transactions frame':<55} {memory['total_bytes'] / 2**20:10.2f} MB "
+                  f"({memory['bytes_per_row']} bytes/row)")
+            for name, stats in results.items():
+                print(f"  {name:<55} {stats['median'] * 1000:10.2f} ms")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return report
+
+
+def find_regressions(report, baseline, tolerance=0.25, min_time=0.001):
+    """
+    Timings (by median) more than `tolerance` slower than in `baseline`.
+    Anything under `min_time` seconds counts as `min_time`, so noise on
+    very fast calls isn't reported. Returns [(scale, name, old, new)].
+    """
+    old_scales = {scale['scale']: scale['results'] for scale in baseline.get('scales', [])}
+    regressions = []
+    for scale in report['scales']:
+        old_results = old_scales.get(scale['scale'], {})
+        for name, stats in scale['results'].items():
+            if name not in old_results:
+                continue
+            old = max(old_results[name]['median'], min_time)
+            new = max(stats['median'], min_time)
+            if new > old * (1 + tolerance):
+                regressions.append((scale['scale'], name, old_results[name]['median'], stats['median']))
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmark.py                                  (default scales, results to benchmark_results.json)
+    # python benchmark.py --scale 1000x20 --scale 1000000x2000 --output run.json
+    # python benchmark.py --compare baseline.json --tolerance 0.2   (exit code 1 on a regression)
+    parser = argparse.ArgumentParser(description="Benchmark the loader, calculator and endpoints on synthetic data")
+    parser.add_argument('--scale', action='append',
+                        help=f"<transactions>x<symbols>, repeatable (default: {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-routes', action='store_true', help="Skip the endpoint timings")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Results of an earlier run to check against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown before a timing counts as a regression (default: %(default)s)")
+    parser.add_argument('--min-time', type=float, default=0.001,
+                        help="Timings below this many seconds are compared as this value")
+    args = parser.parse_args()
+
+    try:
+        scales = args.scale or DEFAULT_SCALES
+        for scale in scales:
+            parse_scale(scale)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = run_benchmarks(scales, args.repeat, routes=not args.no_routes, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved to {args.output}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance, args.min_time)
+        for scale, name, old, new in regressions:
+            print(f"❌ {scale} {name}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions against {args.compare}.")
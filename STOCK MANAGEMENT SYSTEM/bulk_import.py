@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+
+from data_loader import TRANSACTION_COLUMNS, coerce_transaction
+
+# Field names accepted in uploads -> Sheet1 column. Both the Sheet1 headers
+# and the keys used by the add-transaction form work (case-insensitive).
+FIELD_ALIASES = {col.lower(): col for col in TRANSACTION_COLUMNS}
+FIELD_ALIASES.update({
+    'date': 'Date',
+    'symbol': 'Company Symbol',
+    'companyname': 'Company Name',
+    'transactiontype': 'Transaction Type',
+    'quantity': 'Quantity',
+    'price': 'Price Per Share (pkr)',
+    'totalamount': 'Total Amount(pkr)',
+    'remarks': 'Remarks'
+})
+
+XLSX_MIMETYPES = (
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-excel'
+)
+
+
+def _column_for(field):
+    if field is None:
+        return None
+    return FIELD_ALIASES.get(str(field).strip().lower())
+
+
+def _to_record(item):
+    """
+    Maps one uploaded row (any accepted field names) to the Sheet1 columns.
+    Empty strings count as missing, like empty cells in the workbook.
+    """
+    record = {}
+    for field, value in item.items():
+        col = _column_for(field)
+        if col is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if value == '':
+                value = None
+        record[col] = value
+    return record
+
+
+def _native(value):
+    """
+    numpy scalars -> Python numbers, so the rows can go into the journal as JSON
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+
+def iter_json_rows(items):
+    """
+    Yields (row_number, record) for a JSON array of transaction objects
+    """
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of transactions")
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            yield number, None
+            continue
+        yield number, _to_record(item)
+
+
+def iter_csv_rows(stream):
+    """
+    Yields (row_number, record) from a CSV upload, one line at a time.
+    The first line must be the header.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    for number, item in enumerate(reader, start=1):
+        yield number, _to_record(item)
+
+
+def iter_xlsx_rows(stream):
+    """
+    Yields (row_number, record) from an XLSX upload, read in read-only mode.
+    Uses Sheet1 if there is one (so an exported workbook can be uploaded
+    as-is), and skips anything above the header row (like the title row).
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        ws = wb['Sheet1'] if 'Sheet1' in wb.sheetnames else wb.active
+        header = None
+        number = 0
+        for values in ws.iter_rows(values_only=True):
+            if header is None:
+                columns = [_column_for(v) for v in values]
+                if 'Company Symbol' in columns:
+                    header = columns
+                continue
+            if all(v is None for v in values):
+                continue
+            number += 1
+            yield number, _to_record({
+                col: value for col, value in zip(header, values) if col is not None
+            })
+        if header is None:
+            raise ValueError("No header row with 'Company Symbol' found")
+    finally:
+        wb.close()
+
+
+def validate_rows(rows):
+    """
+    Runs the loader's coercion rules (coerce_transaction) over (row_number,
+    record) pairs. Returns (accepted_records, rejections), where each
+    rejection is {'row': row_number, 'reason': ...}.
+    """
+    accepted = []
+    rejected = []
+    for number, record in rows:
+        if record is None:
+            rejected.append({'row': number, 'reason': "Row is not an object"})
+            continue
+        row, reason = coerce_transaction(record)
+        if row is None:
+            rejected.append({'row': number, 'reason': reason})
+            continue
+        accepted.append({col: _native(value) for col, value in row.items()})
+    return accepted, rejected
+
+
+def read_upload(req):
+    """
+    Picks the parser for a Flask request: a multipart 'file' field (by file
+    extension), or a raw body (by Content-Type). Returns the row iterator.
+    """
+    upload = req.files.get('file')
+    if upload is not None:
+        name = (upload.filename or '').lower()
+        mimetype = upload.mimetype
+        stream = upload.stream
+    else:
+        name = ''
+        mimetype = req.mimetype
+        stream = req.stream
+
+    if name.endswith('.json') or mimetype == 'application/json':
+        return iter_json_rows(json.load(stream))
+    if name.endswith('.csv') or mimetype in ('text/csv', 'application/csv'):
+        return iter_csv_rows(stream)
+    if name.endswith(('.xlsx', '.xlsm')) or mimetype in XLSX_MIMETYPES:
+        if not stream.seekable():
+            # openpyxl needs to seek inside the zip file
+            stream = io.BytesIO(stream.read())
+        return iter_xlsx_rows(stream)
+    raise ValueError(f"Unsupported upload type '{mimetype}' (use JSON, CSV or XLSX)")
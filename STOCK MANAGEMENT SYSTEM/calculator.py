@@ -1,6 +1,41 @@
+from collections import deque
+
 import numpy as np
 import pandas as pd
 
+from metrics import metrics
+
+# Column layout of the calculated portfolio summary (Sheet2 / Calculated_Summary)
+SUMMARY_COLUMNS = [
+    'Company Symbol', 
+    'Company Name', 
+    'Total Bought (PKR)', 
+    'Total Sold(PKR)', 
+    'Net Shares', 
+    'Average Buy Price(PKR)', 
+    'Current Market Price (PKR)', 
+    'Market Value (PKR)', 
+    'Profit/Loss (PKR)', 
+    'Status'
+]
+
+# Column layout of the in-memory portfolio DataFrame. The return % is kept
+# as a number ('Profit/Loss %') and only turned into the 'Status' string
+# (e.g. "5.50%") by format_summary() when the data leaves the app.
+PORTFOLIO_COLUMNS = SUMMARY_COLUMNS[:-1] + ['Profit/Loss %']
+
+# Columns of the totals returned by build_history / portfolio_history
+HISTORY_COLUMNS = ['Invested (PKR)', 'Proceeds (PKR)', 'Cost Basis (PKR)']
+
+# portfolio_history frequencies -> pandas date_range frequency
+HISTORY_FREQUENCIES = {
+    'daily': 'D',
+    'weekly': 'W'
+}
+
+# Cost-basis methods of the lot engine (PortfolioCalculator.match_lots)
+COST_METHODS = ('fifo', 'lifo', 'average')
+
 class PortfolioCalculator:
     """
     Handles all portfolio calculations - UPDATED with new create_summary function
@@ -9,12 +44,18 @@ class PortfolioCalculator:
     # --- NEW FUNCTION ---
     # This is the new function that does the full calculation.
     @staticmethod
-    def create_portfolio_summary(transactions_df, price_template_df):
+    @metrics.timed('calculator.create_portfolio_summary')
+    def create_portfolio_summary(transactions_df, price_template_df, aggregates=None):
         """
         Generates a fresh portfolio summary dataframe from raw transactions
         and a price template.
+
+        `aggregates` can be passed in when the per-company totals were already
+        computed (e.g. by the SQLite backend, or merge_aggregates for several
+        workbooks), in the aggregate_transactions layout; then transactions_df
+        may be None.
         """
-        if transactions_df is None or transactions_df.empty:
+        if (aggregates is None or aggregates.empty) and (transactions_df is None or transactions_df.empty):
             print("No transactions found.")
             return pd.DataFrame()
             
@@ -22,15 +63,12 @@ class PortfolioCalculator:
             print("No price template found.")
             return pd.DataFrame()
 
-        # 1. Analyze transactions to get totals and net shares
-        tx_analysis = PortfolioCalculator.analyze_transactions_by_company(transactions_df)
-        
-        # 2. Convert analysis dict to a DataFrame
-        summary_df = pd.DataFrame.from_dict(tx_analysis, orient='index')
-        summary_df.reset_index(inplace=True)
-        summary_df.rename(columns={'index': 'Company Symbol'}, inplace=True)
+        # 1. Aggregate transactions to get totals and net shares (one row per company)
+        if aggregates is None:
+            aggregates = PortfolioCalculator.aggregate_transactions(transactions_df)
+        summary_df = aggregates.reset_index()
 
-        # 3. Merge with the price/template data from Sheet2
+        # 2. Merge with the price/template data from Sheet2
         # We need 'Company Name' and 'Current Market Price (PKR)' from this file.
         price_df = price_template_df[['Company Symbol', 'Company Name', 'Current Market Price (PKR)']].copy()
         
@@ -40,16 +78,16 @@ class PortfolioCalculator:
         # Merge analysis with price data
         summary_df = pd.merge(summary_df, price_df, on='Company Symbol', how='left')
 
-        # 4. Calculate final portfolio columns
+        # 3. Calculate final portfolio columns (whole columns at once, no row-wise apply)
         summary_df['Total Bought (PKR)'] = summary_df['total_bought']
         summary_df['Total Sold(PKR)'] = summary_df['total_sold']
         summary_df['Net Shares'] = summary_df['net_quantity']
         
-        # Calculate Average Buy Price, handle division by zero
-        summary_df['Average Buy Price(PKR)'] = summary_df.apply(
-            lambda row: (row['total_bought'] / row['total_buy_quantity']) if row['total_buy_quantity'] > 0 else 0,
-            axis=1
-        )
+        # Calculate Average Buy Price, 0 where nothing was bought
+        has_buys = summary_df['total_buy_quantity'] > 0
+        summary_df['Average Buy Price(PKR)'] = (
+            summary_df['total_bought'] / summary_df['total_buy_quantity'].where(has_buys)
+        ).where(has_buys, 0)
         
         # Calculate Market Value
         summary_df['Market Value (PKR)'] = summary_df['Net Shares'] * summary_df['Current Market Price (PKR)']
@@ -58,27 +96,13 @@ class PortfolioCalculator:
         # P/L = (Current Value of Net Shares + Total Sales) - Total Investment
         summary_df['Profit/Loss (PKR)'] = (summary_df['Market Value (PKR)'] + summary_df['Total Sold(PKR)']) - summary_df['Total Bought (PKR)']
 
-        # Calculate Status (Return %)
-        summary_df['Status'] = summary_df.apply(
-            lambda row: (row['Profit/Loss (PKR)'] / row['Total Bought (PKR)']) * 100 if row['Total Bought (PKR)'] > 0 else 0,
-            axis=1
+        # Calculate the Return % as a number; format_summary() turns it into 'Status'
+        summary_df['Profit/Loss %'] = PortfolioCalculator.calculate_return_percentage(
+            summary_df['Profit/Loss (PKR)'], summary_df['Total Bought (PKR)']
         )
-        # Format 'Status' to match the old 'Status' column (which was P/L %)
-        summary_df['Status'] = summary_df['Status'].apply(lambda x: f"{x:.2f}%")
-
-        # 5. Clean up columns to match the exact output format
-        final_columns = [
-            'Company Symbol', 
-            'Company Name', 
-            'Total Bought (PKR)', 
-            'Total Sold(PKR)', 
-            'Net Shares', 
-            'Average Buy Price(PKR)', 
-            'Current Market Price (PKR)', 
-            'Market Value (PKR)', 
-            'Profit/Loss (PKR)', 
-            'Status'
-        ]
+
+        # 4. Clean up columns to match the exact output format
+        final_columns = PORTFOLIO_COLUMNS
         
         # Add any missing columns with 0 or NaN
         for col in final_columns:
@@ -87,6 +111,36 @@ class PortfolioCalculator:
 
         return summary_df[final_columns]
 
+    @staticmethod
+    def calculate_return_percentage(profit_loss, total_bought):
+        """
+        Return % (P/L / Total Bought * 100) for whole columns, 0 where nothing was bought
+        """
+        invested = total_bought > 0
+        return ((profit_loss / total_bought.where(invested)) * 100).where(invested, 0).astype('float64')
+
+    @staticmethod
+    def format_summary(portfolio_df):
+        """
+        Turns the in-memory portfolio into the Calculated_Summary layout,
+        formatting the numeric 'Profit/Loss %' into the 'Status' string.
+        """
+        if portfolio_df is None or 'Profit/Loss %' not in portfolio_df.columns:
+            return portfolio_df
+
+        display_df = portfolio_df.drop(columns=['Profit/Loss %'])
+        display_df['Status'] = PortfolioCalculator.format_status(portfolio_df['Profit/Loss %'])
+        return display_df[SUMMARY_COLUMNS]
+
+    @staticmethod
+    def format_status(return_pct):
+        """
+        Formats Return % numbers as "5.50%" strings (the 'Status' column)
+        """
+        if np.ndim(return_pct) == 0:
+            return f"{return_pct:.2f}%"
+        return np.char.mod('%.2f%%', np.asarray(return_pct, dtype='float64')).astype(object)
+
     # --- END OF NEW FUNCTION ---
 
     @staticmethod
@@ -145,48 +199,67 @@ class PortfolioCalculator:
         return portfolio_df['Market Value (PKR)'].sum()
     
     @staticmethod
+    @metrics.timed('calculator.get_top_performers')
     def get_top_performers(portfolio_df, top_n=3):
         """
         Get top performing stocks by profit/loss
         """
         if portfolio_df is None or len(portfolio_df) == 0:
             return None
-            
-        # Create a copy to avoid modifying original data
-        df = portfolio_df.copy()
-        
-        # Note: The 'Status' column now holds the string representation, e.g., "5.50%"
-        # We need to create a numeric version for sorting
-        df['Profit/Loss % Numeric'] = df.apply(
-            lambda row: (row['Profit/Loss (PKR)'] / row['Total Bought (PKR)']) * 100 if row['Total Bought (PKR)'] > 0 else 0,
-            axis=1
-        )
 
-        # Sort by profit/loss
-        top_performers = df.nlargest(top_n, 'Profit/Loss (PKR)')
-        
-        # Add the numeric P/L % column for display
-        top_performers['Profit/Loss %'] = top_performers['Profit/Loss % Numeric']
+        # 'Profit/Loss %' is already numeric in the portfolio, so no copy or
+        # per-row recalculation is needed here
+        top_performers = portfolio_df.nlargest(top_n, 'Profit/Loss (PKR)')
         
         return top_performers[['Company Symbol', 'Company Name', 'Profit/Loss (PKR)', 'Profit/Loss %']]
     
     @staticmethod
-    def get_company_analysis(portfolio_df, company_symbol):
+    def build_symbol_index(portfolio_df):
+        """
+        Maps each 'Company Symbol' to its summary row as a dict (the first
+        row if a symbol appears twice). The table is converted once here, so
+        lookups neither scan it nor build a row each time.
+        """
+        if portfolio_df is None or 'Company Symbol' not in portfolio_df.columns:
+            return {}
+        index = {}
+        for row in portfolio_df.to_dict(orient='records'):
+            index.setdefault(row['Company Symbol'], row)
+        return index
+
+    @staticmethod
+    def get_company_analysis(portfolio_df, company_symbol, symbol_index=None):
         """
         Get detailed analysis for a specific company
         """
+        return PortfolioCalculator.get_companies_analysis(
+            portfolio_df, [company_symbol], symbol_index
+        ).get(company_symbol.upper())
+
+    @staticmethod
+    def get_companies_analysis(portfolio_df, company_symbols, symbol_index=None):
+        """
+        Detailed analysis for several companies at once: {SYMBOL: details},
+        with None for symbols that are not in the portfolio.
+
+        Pass the symbol_index of portfolio_df (build_symbol_index) to avoid
+        building it on every call.
+        """
+        symbols = [symbol.upper() for symbol in company_symbols]
         if portfolio_df is None:
-            return None
-            
-        company_data = portfolio_df[portfolio_df['Company Symbol'] == company_symbol.upper()]
-        
-        if company_data.empty:
-            return None
-        
-        # Use .iloc[0] to get the first (and only) row's data as a dictionary
-        data_dict = company_data.iloc[0].to_dict()
-        
-        # Remap to the expected keys
+            return {symbol: None for symbol in symbols}
+        if symbol_index is None:
+            symbol_index = PortfolioCalculator.build_symbol_index(portfolio_df)
+
+        details = {}
+        for symbol in symbols:
+            row = symbol_index.get(symbol)
+            details[symbol] = PortfolioCalculator._company_details(row) if row is not None else None
+        return details
+
+    @staticmethod
+    def _company_details(data_dict):
+        # Remap a summary row to the expected keys
         return {
             'symbol': data_dict.get('Company Symbol'),
             'name': data_dict.get('Company Name'),
@@ -197,57 +270,366 @@ class PortfolioCalculator:
             'current_price': data_dict.get('Current Market Price (PKR)'),
             'market_value': data_dict.get('Market Value (PKR)'),
             'profit_loss': data_dict.get('Profit/Loss (PKR)'),
-            'status': data_dict.get('Status', 'Unknown') # 'Status' is now the P/L % string
+            'return_pct': data_dict.get('Profit/Loss %'),
+            # 'status' stays the P/L % string, formatted from the numeric column
+            'status': PortfolioCalculator.format_status(data_dict['Profit/Loss %']) if 'Profit/Loss %' in data_dict else 'Unknown'
         }
     
     @staticmethod
+    def _transaction_amounts(transactions_df):
+        """
+        (quantity, amount, is_buy, is_sell) columns of the transactions.
+        Whole quantities (int32 in the loader's layout) are summed as int64,
+        and a categorical 'Transaction Type' is compared by its codes.
+        """
+        quantity = transactions_df['Quantity']
+        if quantity.dtype.kind in 'iu':
+            quantity = quantity.astype('int64')
+        line_total = quantity * transactions_df['Price Per Share (pkr)']
+
+        # Use 'Total Amount(pkr)' where it is filled in, otherwise Quantity * Price
+        if 'Total Amount(pkr)' in transactions_df.columns:
+            amount = transactions_df['Total Amount(pkr)']
+            amount = amount.where(amount.notna() & (amount != 0), line_total)
+        else:
+            amount = line_total
+
+        is_buy = transactions_df['Transaction Type'] == 'Buy'
+        is_sell = transactions_df['Transaction Type'] == 'Sell'
+        return quantity, amount, is_buy, is_sell
+
+    @staticmethod
+    def _symbol_codes(transactions_df):
+        """
+        (codes, symbols): an integer code per row (-1 where the symbol is
+        missing) and the symbols the codes stand for. The loader's
+        categorical 'Company Symbol' already is this pair, so it is used as
+        it is; any other column is factorized.
+        """
+        column = transactions_df['Company Symbol']
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            return column.cat.codes.to_numpy(), column.cat.categories
+        return pd.factorize(column)
+
+    @staticmethod
+    @metrics.timed('calculator.aggregate_transactions')
+    def aggregate_transactions(transactions_df):
+        """
+        Aggregate transactions by company in a single pass.
+
+        Returns a DataFrame indexed by 'Company Symbol' (in order of first
+        appearance) with the columns total_bought, total_sold, net_quantity,
+        total_buy_quantity, buy_count and sell_count.
+        """
+        quantity, amount, is_buy, is_sell = PortfolioCalculator._transaction_amounts(transactions_df)
+
+        # Masked columns, so one groupby gives both the Buy and the Sell totals
+        masked = pd.DataFrame({
+            'total_bought': amount.where(is_buy, 0),
+            'total_sold': amount.where(is_sell, 0),
+            'total_buy_quantity': quantity.where(is_buy, 0),
+            'total_sell_quantity': quantity.where(is_sell, 0),
+            'buy_count': is_buy.astype('int64'),
+            'sell_count': is_sell.astype('int64')
+        })
+
+        # Grouped by the symbol codes; rows without a symbol are left out
+        codes, symbols = PortfolioCalculator._symbol_codes(transactions_df)
+        has_symbol = codes >= 0
+        if not has_symbol.all():
+            masked, codes = masked[has_symbol], codes[has_symbol]
+        grouped = masked.groupby(codes, sort=False).sum()
+        grouped.index = symbols.take(grouped.index)
+        grouped['net_quantity'] = grouped['total_buy_quantity'] - grouped['total_sell_quantity']
+        grouped.index.name = 'Company Symbol'
+
+        return grouped[['total_bought', 'total_sold', 'net_quantity',
+                        'total_buy_quantity', 'buy_count', 'sell_count']]
+
+    @staticmethod
+    def merge_aggregates(aggregate_frames):
+        """
+        Adds up the per-company aggregates (aggregate_transactions layout) of
+        several ledgers, e.g. one per workbook. Companies keep the order in
+        which they first appear.
+        """
+        frames = [frame for frame in aggregate_frames if frame is not None and not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=['total_bought', 'total_sold', 'net_quantity',
+                                         'total_buy_quantity', 'buy_count', 'sell_count'])
+        merged = pd.concat(frames).groupby(level=0, sort=False).sum()
+        merged.index.name = 'Company Symbol'
+        return merged
+
+    @staticmethod
+    @metrics.timed('calculator.build_history')
+    def build_history(transactions_df):
+        """
+        Running totals of the ledger over time, for portfolio_history.
+
+        The transactions are sorted by date once and every running total is
+        a cumulative sum per company. Returns (totals, holdings), both with
+        one row per transaction date holding the state at the end of that day:
+        totals has the columns in HISTORY_COLUMNS, holdings the net shares of
+        every company. Rows without a valid date are left out (their number
+        is in totals.attrs['undated']).
+        """
+        if transactions_df is None or transactions_df.empty:
+            empty = pd.DatetimeIndex([], name='Date')
+            return pd.DataFrame(columns=HISTORY_COLUMNS, index=empty, dtype=float), pd.DataFrame(index=empty)
+
+        quantity, amount, is_buy, is_sell = PortfolioCalculator._transaction_amounts(transactions_df)
+        codes, symbols = PortfolioCalculator._symbol_codes(transactions_df)
+        ledger = pd.DataFrame({
+            'Date': pd.to_datetime(transactions_df['Date'], errors='coerce', format='mixed').dt.normalize(),
+            # Symbol codes; the pivots below turn them back into symbols
+            'Company Symbol': codes,
+            'bought': amount.where(is_buy, 0),
+            'sold': amount.where(is_sell, 0),
+            'buy_quantity': quantity.where(is_buy, 0),
+            'sell_quantity': quantity.where(is_sell, 0)
+        })
+        dated = ledger['Date'].notna()
+        ledger = ledger[dated].sort_values('Date', kind='stable')
+
+        # Per-company running totals after every transaction
+        running = ledger.groupby('Company Symbol', sort=False)[
+            ['bought', 'buy_quantity', 'sell_quantity']
+        ].cumsum()
+        net_shares = running['buy_quantity'] - running['sell_quantity']
+        # Cost basis of the shares held, at the average buy price so far
+        # (the same average the summary uses)
+        avg_price = (running['bought'] / running['buy_quantity']).where(running['buy_quantity'] > 0, 0)
+        state = pd.DataFrame({
+            'Date': ledger['Date'],
+            'Company Symbol': ledger['Company Symbol'],
+            'net_shares': net_shares,
+            'cost_basis': net_shares * avg_price
+        }).drop_duplicates(['Date', 'Company Symbol'], keep='last')
+        state = state[state['Company Symbol'] >= 0]
+
+        # Dates x companies, each company's last state carried forward
+        holdings = state.pivot(index='Date', columns='Company Symbol', values='net_shares').ffill().fillna(0)
+        cost_basis = state.pivot(index='Date', columns='Company Symbol', values='cost_basis').ffill().fillna(0)
+        holdings.columns = symbols.take(holdings.columns)
+        holdings = holdings.sort_index(axis=1)
+
+        daily = ledger.groupby('Date')[['bought', 'sold']].sum().cumsum()
+        totals = pd.DataFrame({
+            'Invested (PKR)': daily['bought'],
+            'Proceeds (PKR)': daily['sold'],
+            'Cost Basis (PKR)': cost_basis.sum(axis=1)
+        })
+        totals.attrs['undated'] = int((~dated).sum())
+        holdings.columns.name = None
+        return totals, holdings
+
+    @staticmethod
+    def portfolio_history(history, freq='daily', start=None, end=None):
+        """
+        Invested capital, realized proceeds, cost basis and holdings at the
+        end of every day ('daily') or week ('weekly') from start to end
+        (default: the first to the last transaction date).
+
+        `history` is the result of build_history. Each point is a binary
+        search plus one row per table, so it costs O(companies) however long
+        the ledger is. Returns (totals, holdings) indexed by date.
+        """
+        totals, holdings = history
+        if freq not in HISTORY_FREQUENCIES:
+            raise ValueError(f"Unknown frequency '{freq}' (use 'daily' or 'weekly')")
+        if totals.empty:
+            return totals, holdings
+
+        start = pd.Timestamp(start).normalize() if start is not None else totals.index[0]
+        end = pd.Timestamp(end).normalize() if end is not None else totals.index[-1]
+        points = pd.date_range(start, end, freq=HISTORY_FREQUENCIES[freq], name='Date')
+        if freq == 'weekly' and start <= end and (points.empty or points[-1] < end):
+            # The last, unfinished week ends at `end`
+            points = points.append(pd.DatetimeIndex([end], name='Date'))
+
+        # Last transaction date on or before each point (-1: none yet)
+        positions = totals.index.searchsorted(points, side='right') - 1
+        before_first = positions < 0
+        positions[before_first] = 0
+
+        point_totals = totals.iloc[positions].set_axis(points)
+        point_holdings = holdings.iloc[positions].set_axis(points)
+        point_totals.loc[before_first] = 0
+        point_holdings.loc[before_first] = 0
+        return point_totals, point_holdings
+
+    @staticmethod
+    @metrics.timed('calculator.analyze_transactions_by_company')
     def analyze_transactions_by_company(transactions_df):
         """
         Analyze transactions by company
         """
         if transactions_df is None:
             return None
-            
-        analysis = {}
-        
-        # --- THIS IS THE CORRECTION ---
-        # We create a copy to avoid modifying the original dataframe
-        transactions_copy = transactions_df.copy()
-
-        # Fill NaN 'Total Amount(pkr)' by calculating from Quantity * Price
-        # This makes sure we use the most accurate total amount for every transaction
-        if 'Total Amount(pkr)' in transactions_copy.columns:
-            transactions_copy['Total Amount(pkr)'] = transactions_copy.apply(
-                lambda row: (row['Quantity'] * row['Price Per Share (pkr)']) 
-                            if (pd.isna(row['Total Amount(pkr)']) or row['Total Amount(pkr)'] == 0) 
-                            else row['Total Amount(pkr)'],
-                axis=1
+
+        # Same dict layout as before, built from the single-pass aggregation:
+        # {symbol: {'total_bought': ..., 'total_sold': ..., 'net_quantity': ...,
+        #           'total_buy_quantity': ..., 'buy_count': ..., 'sell_count': ...}}
+        return PortfolioCalculator.aggregate_transactions(transactions_df).to_dict(orient='index')
+
+    @staticmethod
+    @metrics.timed('calculator.match_lots')
+    def match_lots(transactions_df, method='fifo', symbols=None):
+        """
+        Matches every Sell against the open Buy lots of its company, in one
+        pass over the ledger in date order (undated rows last), and returns
+        a LotBook with the realized P/L and the open lots per company.
+
+        method: 'fifo' (oldest lots are sold first), 'lifo' (newest first)
+        or 'average' (one pooled lot at the average cost). Each company's
+        lots are a deque, so a sale only touches the lots it uses up and the
+        whole pass stays linear in the number of transactions.
+
+        With `symbols`, only those companies' rows are matched: they are
+        picked out by their codes first, so the Python loop only sees them.
+        """
+        if method not in COST_METHODS:
+            raise ValueError(f"Unknown cost method '{method}' (use 'fifo', 'lifo' or 'average')")
+        book = LotBook(method)
+        if transactions_df is None or transactions_df.empty:
+            return book
+        if symbols is not None:
+            codes, known = PortfolioCalculator._symbol_codes(transactions_df)
+            wanted = known.get_indexer(list(symbols))
+            transactions_df = transactions_df[np.isin(codes, wanted[wanted >= 0])]
+
+        quantity, amount, is_buy, is_sell = PortfolioCalculator._transaction_amounts(transactions_df)
+        dates = pd.to_datetime(transactions_df['Date'], errors='coerce', format='mixed')
+        codes, symbols = PortfolioCalculator._symbol_codes(transactions_df)
+
+        # One stable sort by (company, date): each company's rows become one
+        # date-ordered run (same date: ledger order; undated rows last)
+        date_keys = dates.to_numpy(dtype='datetime64[ns]').view('int64').copy()
+        date_keys[dates.isna().to_numpy()] = np.iinfo('int64').max
+        order = np.lexsort((date_keys, codes))
+        codes = codes[order]
+        kinds = np.where(is_buy.to_numpy(dtype=bool), 1, np.where(is_sell.to_numpy(dtype=bool), -1, 0))[order]
+        quantities = quantity.to_numpy(dtype=float)[order]
+        amounts = amount.to_numpy(dtype=float)[order]
+        date_values = dates.to_numpy()[order]
+
+        starts = np.flatnonzero(np.diff(codes)) + 1
+        for run in np.split(np.arange(len(codes)), starts):
+            if not len(run) or codes[run[0]] < 0:
+                continue
+            book.companies[symbols[codes[run[0]]]] = LotBook.match_company(
+                method, kinds[run].tolist(), quantities[run].tolist(),
+                amounts[run].tolist(), date_values[run]
             )
-        else:
-            # If the column doesn't exist at all, create it
-            transactions_copy['Total Amount(pkr)'] = transactions_copy['Quantity'] * transactions_copy['Price Per Share (pkr)']
-        # --- END OF CORRECTION ---
+        return book
 
-        for symbol in transactions_copy['Company Symbol'].unique():
-            company_txs = transactions_copy[transactions_copy['Company Symbol'] == symbol]
-            
-            buy_txs = company_txs[company_txs['Transaction Type'] == 'Buy']
-            sell_txs = company_txs[company_txs['Transaction Type'] == 'Sell']
-            
-            # Now we can safely sum the 'Total Amount(pkr)' column
-            total_bought = buy_txs['Total Amount(pkr)'].sum()
-            total_sold = sell_txs['Total Amount(pkr)'].sum()
 
-            total_buy_quantity = buy_txs['Quantity'].sum()
-            net_quantity = total_buy_quantity - sell_txs['Quantity'].sum()
-            
-            analysis[symbol] = {
-                'total_bought': total_bought,
-                'total_sold': total_sold,
-                'net_quantity': net_quantity,
-                'total_buy_quantity': total_buy_quantity, # Needed for Avg Buy Price
-                'buy_count': len(buy_txs),
-                'sell_count': len(sell_txs)
-            }
-        
-        return analysis
\ No newline at end of file
+class LotBook:
+    """
+    Open lots and realized P/L per company, built by
+    PortfolioCalculator.match_lots.
+
+    Each company has a deque of open lots [quantity, unit cost, date]. A
+    sale takes shares from the left end (FIFO) or the right end (LIFO), or
+    from the single pooled lot ('average'). Shares sold beyond what is held
+    are counted as unmatched and left out of the realized P/L.
+    """
+
+    def __init__(self, method='fifo'):
+        self.method = method
+        # symbol -> [lots deque, realized P/L, unmatched sold quantity]
+        self.companies = {}
+
+    @staticmethod
+    def match_company(method, kinds, quantities, amounts, dates):
+        """
+        Runs one company's date-ordered rows (kind 1 = Buy, -1 = Sell)
+        through its lot deque. Returns [lots, realized P/L, unmatched sold
+        quantity]; a lot is [quantity, unit cost, date].
+        """
+        lots = deque()
+        realized = 0.0
+        unmatched = 0.0
+        average = method == 'average'
+        take_newest = method == 'lifo'
+
+        for i, (kind, quantity, amount) in enumerate(zip(kinds, quantities, amounts)):
+            if not quantity > 0:
+                continue
+            if kind == 1:
+                if average and lots:
+                    # One pooled lot: the new shares move its average unit cost
+                    pooled = lots[0]
+                    total_quantity = pooled[0] + quantity
+                    pooled[1] = (pooled[0] * pooled[1] + amount) / total_quantity
+                    pooled[0] = total_quantity
+                else:
+                    lots.append([quantity, amount / quantity, i])
+            elif kind == -1:
+                remaining = quantity
+                cost = 0.0
+                while remaining > 0 and lots:
+                    lot = lots[-1] if take_newest else lots[0]
+                    if lot[0] > remaining:
+                        cost += remaining * lot[1]
+                        lot[0] -= remaining
+                        remaining = 0
+                        break
+                    cost += lot[0] * lot[1]
+                    remaining -= lot[0]
+                    if take_newest:
+                        lots.pop()
+                    else:
+                        lots.popleft()
+                realized += (quantity - remaining) * (amount / quantity) - cost
+                unmatched += remaining
+
+        # Lots remember their row; only the few still open need a date string
+        for lot in lots:
+            date = dates[lot[2]]
+            lot[2] = None if pd.isna(date) else pd.Timestamp(date).strftime('%Y-%m-%d')
+        return [lots, realized, unmatched]
+
+    def company(self, symbol, price=None):
+        """
+        Lot position of one company: realized and (with a current price)
+        unrealized P/L, open quantity, cost basis and the open lots
+        """
+        lots, realized, unmatched = self.companies.get(symbol, (deque(), 0.0, 0.0))
+        open_quantity = sum((lot[0] for lot in lots), 0.0)
+        cost_basis = sum((lot[0] * lot[1] for lot in lots), 0.0)
+        has_price = price is not None and price == price
+        return {
+            'symbol': symbol,
+            'method': self.method,
+            'realized_pl': realized,
+            'unrealized_pl': open_quantity * price - cost_basis if has_price else None,
+            'open_quantity': open_quantity,
+            'cost_basis': cost_basis,
+            'unmatched_sell_quantity': unmatched,
+            'lots': [
+                {'date': date, 'quantity': quantity, 'unit_cost': unit_cost,
+                 'cost': quantity * unit_cost}
+                for quantity, unit_cost, date in lots
+            ]
+        }
+
+    def totals(self, prices):
+        """
+        Realized P/L, unrealized P/L (at `prices`, {symbol: price}) and
+        cost basis of the open lots over all companies
+        """
+        realized = unrealized = cost_basis = 0.0
+        for symbol, (lots, company_realized, _) in self.companies.items():
+            realized += company_realized
+            company_cost = sum(lot[0] * lot[1] for lot in lots)
+            cost_basis += company_cost
+            price = prices.get(symbol)
+            if price is not None and price == price:
+                unrealized += sum(lot[0] for lot in lots) * price - company_cost
+        return {
+            'realized_pl': realized,
+            'unrealized_pl': unrealized,
+            'cost_basis': cost_basis
+        }
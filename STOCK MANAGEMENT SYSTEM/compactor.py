@@ -0,0 +1,106 @@
+import threading
+import time
+
+from data_loader import WORKBOOK_LOCK, append_transactions_to_excel
+from journal import file_lock, read_journal_checkpoint
+from metrics import metrics
+
+
+@metrics.timed('journal.compact')
+def compact_journal(journal, through_seq=None):
+    """
+    Moves all pending journal rows (up to through_seq, if given) into Sheet1,
+    and the pending price updates into Sheet2, in one atomic workbook save,
+    then trims them from the journal.
+    Returns the number of journal entries moved.
+
+    New transactions and prices can still be appended while the workbook is
+    being saved; they stay in the journal for the next round.
+    """
+    # Only one compaction at a time, across processes too
+    with WORKBOOK_LOCK, file_lock(journal.path + '.compact.lock'):
+        checkpoint = read_journal_checkpoint(journal.workbook_path)
+        with journal.locked():
+            entries = journal.read_entries(after_seq=checkpoint)
+            price_entries = journal.read_prices(after_seq=checkpoint)
+        if through_seq is not None:
+            entries = [entry for entry in entries if entry[0] <= through_seq]
+            price_entries = [entry for entry in price_entries if entry[0] <= through_seq]
+        if not entries and not price_entries:
+            return 0
+
+        # Later updates of a symbol win, as they did in the served prices
+        prices = {}
+        for _, changed in price_entries:
+            prices.update(changed)
+
+        last_seq = max(entry[0] for entry in entries[-1:] + price_entries[-1:])
+        append_transactions_to_excel(
+            journal.workbook_path,
+            [row for _, row in entries],
+            journal_seq=last_seq,
+            prices=prices
+        )
+
+        # The workbook now says it contains everything up to last_seq, so
+        # even if we crash before this point no row is applied twice.
+        with journal.locked():
+            journal.truncate_through(last_seq)
+
+    return len(entries) + len(price_entries)
+
+
+class JournalCompactor(threading.Thread):
+    """
+    Background thread that compacts the journal into the workbook every
+    `interval` seconds, or sooner once `max_pending` entries (rows or price
+    updates) are waiting.
+    If `limit` is set (a callable returning a seq), rows after it are left
+    in the journal.
+    """
+
+    def __init__(self, journal, interval=30.0, max_pending=200, limit=None):
+        super().__init__(name='journal-compactor', daemon=True)
+        self.journal = journal
+        self.interval = interval
+        self.max_pending = max_pending
+        self.limit = limit
+        self._pending = len(journal.pending_entries()) + len(journal.pending_prices())
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self, new_rows=1):
+        """
+        Called after rows or price updates were appended to the journal
+        """
+        self._pending += new_rows
+        if self._pending >= self.max_pending:
+            self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.compact_now()
+
+    def compact_now(self):
+        """
+        Runs one compaction right away (also used on shutdown)
+        """
+        try:
+            started = time.perf_counter()
+            moved = compact_journal(
+                self.journal, self.limit() if self.limit is not None else None
+            )
+            self._pending = max(0, self._pending - moved)
+            if moved:
+                print(f"✓ Compacted {moved} journal entries into the workbook "
+                      f"in {time.perf_counter() - started:.2f}s.")
+            return moved
+        except Exception as e:
+            print(f"❌ Warning: Journal compaction failed. {e}")
+            return 0
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
@@ -1,33 +1,212 @@
+import os
+import threading
+import numpy as np
 import pandas as pd
-# --- THIS IS THE NEW IMPORT ---
-from openpyxl import load_workbook
-# --- END OF NEW IMPORT ---
+# (openpyxl's load_workbook is imported where a workbook is edited, so
+# importing this module doesn't load openpyxl)
+# --- Binary snapshot cache, so we don't re-parse an unchanged workbook ---
+from snapshot_cache import cached_load, snapshot_is_current, rekey_snapshot
+# ---
+# --- Transaction journal (rows not yet compacted into Sheet1) ---
+from journal import (
+    JOURNAL_CHECKPOINT_SHEET,
+    journal_path_for,
+    read_journal_checkpoint,
+    read_journal_entries
+)
+# ---
+# --- Timing spans for /metrics ---
+from metrics import metrics
+# ---
 
+# Held by everything in this process that rewrites the workbook file
+WORKBOOK_LOCK = threading.RLock()
 
-def load_transactions_from_excel(file_path):
+# Column order of the 'PSX Transactions' sheet (Sheet1)
+TRANSACTION_COLUMNS = [
+    'Date',
+    'Company Symbol',
+    'Company Name',
+    'Transaction Type',
+    'Quantity',
+    'Price Per Share (pkr)',
+    'Total Amount(pkr)',
+    'Remarks'
+]
+
+# Text columns kept as categoricals: a small integer code per row and every
+# distinct value stored once ('Transaction Type' has two values, so its
+# codes are int8 - a side flag that still reads as 'Buy'/'Sell')
+CATEGORY_COLUMNS = ['Company Symbol', 'Company Name', 'Transaction Type']
+
+
+@metrics.timed('loader.load_transactions')
+def load_transactions_from_excel(file_path, use_cache=True, include_journal=True):
     """
     Load transaction data from Excel file - FIXED for your specific format
+
+    With use_cache=True the cleaned data is read from the snapshot cache
+    next to the workbook, and Excel is only parsed when the file changed.
+    With include_journal=True, rows still waiting in the transaction journal
+    (not compacted into Sheet1 yet) are added at the end.
+    """
+    if use_cache:
+        df = cached_load(file_path, 'transactions', _read_transactions_sheet)
+    else:
+        df = _read_transactions_sheet(file_path)
+
+    if include_journal and df is not None:
+        df = merge_journal_tail(df, file_path)
+    return df
+
+def clean_transactions(df):
+    """
+    Cleaning rules for transaction rows, shared by Sheet1 and the journal
+    """
+    # Clean the data - remove empty rows
+    df = df.dropna(subset=['Company Symbol'])
+    
+    # Convert quantity and price to numeric (handle any text values)
+    df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce')
+    df['Price Per Share (pkr)'] = pd.to_numeric(df['Price Per Share (pkr)'], errors='coerce')
+    
+    # Force the Total Amount column to be numeric, handling errors
+    # This prevents crashes if a 'null' value is saved from the form
+    if 'Total Amount(pkr)' in df.columns:
+        df['Total Amount(pkr)'] = pd.to_numeric(df['Total Amount(pkr)'], errors='coerce')
+    
+    # We drop rows where EITHER Quantity or Price is invalid.
+    df = df.dropna(subset=['Quantity', 'Price Per Share (pkr)'])
+    
+    return compact_transactions(df)
+
+def compact_transactions(df):
+    """
+    Stores the transaction columns in compact types: dates as datetime64,
+    CATEGORY_COLUMNS as categoricals, whole share quantities as int32, and
+    Remarks as a categorical when its values repeat (plain strings otherwise).
+    The numbers and the values read back are the same as before.
+    """
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce', format='mixed')
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    if 'Remarks' in df.columns and df['Remarks'].nunique() <= len(df) // 2:
+        df['Remarks'] = df['Remarks'].astype('category')
+
+    # Fractional quantities (or huge ones) stay float64
+    if 'Quantity' in df.columns:
+        quantity = df['Quantity'].to_numpy(dtype=float)
+        if np.all(quantity == np.floor(quantity)) and np.all(np.abs(quantity) < 2**31):
+            df['Quantity'] = quantity.astype('int32')
+    return df
+
+def transactions_frame(rows):
+    """
+    Rows that were already cleaned (coerce_transaction), as a DataFrame in
+    the compact layout
+    """
+    return compact_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+def concat_transactions(frames):
+    """
+    pd.concat for transaction frames that keeps the compact layout. Where the
+    first frame has a categorical column, the others are brought to the same
+    categories first (the union, the first frame's own ones unchanged), since
+    pd.concat turns categoricals with different categories into objects.
+    """
+    frames = list(frames)
+    for col in frames[0].columns:
+        if not isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            continue
+        parts = [
+            df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype('category')
+            for df in frames
+        ]
+        categories = parts[0].cat.categories
+        for part in parts[1:]:
+            categories = categories.append(part.cat.categories.difference(categories))
+        frames = [
+            df.assign(**{col: part.cat.set_categories(categories)})
+            for df, part in zip(frames, parts)
+        ]
+    return pd.concat(frames, ignore_index=True)
+
+def memory_report(df):
+    """
+    Memory used by a DataFrame, per column and in total (strings and
+    categories included): {'rows', 'total_bytes', 'bytes_per_row',
+    'columns': {name: {'dtype', 'bytes'}}}
+    """
+    if df is None:
+        return {'rows': 0, 'total_bytes': 0, 'bytes_per_row': 0, 'columns': {}}
+    usage = df.memory_usage(index=True, deep=True)
+    total = int(usage.sum())
+    return {
+        'rows': len(df),
+        'total_bytes': total,
+        'bytes_per_row': round(total / len(df), 1) if len(df) else 0,
+        'columns': {
+            str(col): {'dtype': str(df[col].dtype), 'bytes': int(usage[col])}
+            for col in df.columns
+        }
+    }
+
+def coerce_transaction(record):
+    """
+    Single-row version of clean_transactions, for rows that arrive one at a
+    time (the form, bulk uploads). Returns (row, None) for a valid row, or
+    (None, reason) if clean_transactions would have dropped it.
+    """
+    symbol = record.get('Company Symbol')
+    if symbol is None or pd.isna(symbol) or symbol == '':
+        return None, "Missing 'Company Symbol'"
+
+    row = {col: record.get(col) for col in TRANSACTION_COLUMNS}
+    row['Quantity'] = pd.to_numeric(row['Quantity'], errors='coerce')
+    row['Price Per Share (pkr)'] = pd.to_numeric(row['Price Per Share (pkr)'], errors='coerce')
+    row['Total Amount(pkr)'] = pd.to_numeric(row['Total Amount(pkr)'], errors='coerce')
+
+    if pd.isna(row['Quantity']):
+        return None, f"Invalid 'Quantity': {record.get('Quantity')!r}"
+    if pd.isna(row['Price Per Share (pkr)']):
+        return None, f"Invalid 'Price Per Share (pkr)': {record.get('Price Per Share (pkr)')!r}"
+    return row, None
+
+def merge_journal_tail(transactions_df, file_path):
+    """
+    Appends the journal rows the workbook doesn't contain yet
+    """
+    checkpoint = transactions_df.attrs.get('journal_checkpoint', 0)
+    entries = read_journal_entries(journal_path_for(file_path), after_seq=checkpoint)
+    if not entries:
+        return transactions_df
+
+    journal_df = clean_transactions(
+        pd.DataFrame([row for _, row in entries], columns=TRANSACTION_COLUMNS)
+    )
+    merged = concat_transactions([transactions_df, journal_df])
+    merged.attrs = dict(transactions_df.attrs, journal_checkpoint=entries[-1][0])
+    return merged
+
+def _read_transactions_sheet(file_path):
+    """
+    Parses and cleans Sheet1 (the transactions) from the Excel file
     """
     try:
         # Read the transactions sheet, skip the first row (header title)
-        df = pd.read_excel(file_path, sheet_name='Sheet1', skiprows=1)
+        with metrics.span('excel.read_transactions'):
+            df = pd.read_excel(file_path, sheet_name='Sheet1', skiprows=1)
         
         print("✅ Successfully loaded transactions data!")
         
-        # Clean the data - remove empty rows
-        df = df.dropna(subset=['Company Symbol'])
-        
-        # Convert quantity and price to numeric (handle any text values)
-        df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce')
-        df['Price Per Share (pkr)'] = pd.to_numeric(df['Price Per Share (pkr)'], errors='coerce')
-        
-        # Force the Total Amount column to be numeric, handling errors
-        # This prevents crashes if a 'null' value is saved from the form
-        if 'Total Amount(pkr)' in df.columns:
-            df['Total Amount(pkr)'] = pd.to_numeric(df['Total Amount(pkr)'], errors='coerce')
-        
-        # We drop rows where EITHER Quantity or Price is invalid.
-        df = df.dropna(subset=['Quantity', 'Price Per Share (pkr)'])
+        df = clean_transactions(df)
+
+        # Last journal entry already written into Sheet1 (see journal.py)
+        df.attrs['journal_checkpoint'] = read_journal_checkpoint(file_path)
         
         return df
         
@@ -35,14 +214,61 @@ def load_transactions_from_excel(file_path):
         print(f"❌ Error loading transactions: {e}")
         return None
 
-def load_portfolio_from_excel(file_path):
+@metrics.timed('loader.load_prices')
+def load_portfolio_from_excel(file_path, use_cache=True, include_journal=True):
     """
     Load portfolio summary from Excel file - FIXED for your specific format
     This file is used as a TEMPLATE for prices and company names.
+
+    Uses the snapshot cache the same way as load_transactions_from_excel.
+    With include_journal=True, price updates still waiting in the journal
+    (not compacted into Sheet2 yet) are applied on top.
+    """
+    if use_cache:
+        df = cached_load(file_path, 'portfolio', _read_portfolio_sheet)
+    else:
+        df = _read_portfolio_sheet(file_path)
+
+    if include_journal and df is not None:
+        df = merge_journal_prices(df, file_path)
+    return df
+
+def merge_journal_prices(price_df, file_path):
+    """
+    Applies the journal price updates the workbook doesn't contain yet.
+    Symbols that are not listed get a new row, like in Sheet2.
+    """
+    checkpoint = price_df.attrs.get('journal_checkpoint', 0)
+    entries = read_journal_entries(journal_path_for(file_path), after_seq=checkpoint, kind='prices')
+    if not entries:
+        return price_df
+
+    prices = {}
+    for _, changed in entries:
+        prices.update(changed)
+
+    merged = price_df.copy()
+    listed = merged['Company Symbol'].isin(list(prices))
+    merged.loc[listed, 'Current Market Price (PKR)'] = merged.loc[listed, 'Company Symbol'].map(prices)
+    known = set(merged['Company Symbol'])
+    new_symbols = [symbol for symbol in prices if symbol not in known]
+    if new_symbols:
+        merged = pd.concat([merged, pd.DataFrame({
+            'Company Symbol': new_symbols,
+            'Company Name': [None] * len(new_symbols),
+            'Current Market Price (PKR)': [float(prices[symbol]) for symbol in new_symbols]
+        })], ignore_index=True)
+    merged.attrs = dict(price_df.attrs, journal_checkpoint=entries[-1][0])
+    return merged
+
+def _read_portfolio_sheet(file_path):
+    """
+    Parses and cleans Sheet2 (the price list/template) from the Excel file
     """
     try:
         # Read the portfolio sheet, skip the first row (header title)
-        df = pd.read_excel(file_path, sheet_name='Sheet2', skiprows=1)
+        with metrics.span('excel.read_prices'):
+            df = pd.read_excel(file_path, sheet_name='Sheet2', skiprows=1)
         
         print("✅ Successfully loaded portfolio template data!")
         
@@ -62,8 +288,11 @@ def load_portfolio_from_excel(file_path):
             if col not in df.columns:
                 print(f"❌ Error: Missing required column '{col}' in Sheet2.")
                 return None
-                
-        return df[required_cols]
+
+        df = df[required_cols]
+        # Last journal entry already written into the workbook (see journal.py)
+        df.attrs['journal_checkpoint'] = read_journal_checkpoint(file_path)
+        return df
         
     except Exception as e:
         print(f"❌ Error loading portfolio: {e}")
@@ -90,19 +319,136 @@ def display_data_preview(transactions_df, portfolio_df):
         print("No portfolio data loaded")
 
 # --- THIS IS THE NEW FUNCTION ---
+@metrics.timed('excel.save_summary')
 def save_summary_to_excel(summary_df, file_path, sheet_name="Calculated_Summary"):
     """
     Saves the calculated summary DataFrame to a specific sheet in the Excel file,
     without destroying other sheets.
     """
     try:
-        # Load the existing workbook
-        with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            # Write the summary dataframe to the new sheet
-            # index=False means we don't save the pandas row numbers
-            summary_df.to_excel(writer, sheet_name=sheet_name, index=False)
+        with WORKBOOK_LOCK:
+            # Snapshots of Sheet1/Sheet2 that match the file now are still valid
+            # after we rewrite the summary sheet, so we re-key them afterwards.
+            current_snapshots = []
+            if sheet_name not in ('Sheet1', 'Sheet2'):
+                current_snapshots = [
+                    name for name in ('transactions', 'portfolio')
+                    if snapshot_is_current(file_path, name)
+                ]
+
+            # Load the existing workbook
+            with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+                # Write the summary dataframe to the new sheet
+                # index=False means we don't save the pandas row numbers
+                summary_df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+            for name in current_snapshots:
+                rekey_snapshot(file_path, name)
             
     except Exception as e:
         print(f"❌ Error saving summary to Excel: {e}")
         # Re-raise the exception so the app.py can catch it
-        raise
\ No newline at end of file
+        raise
+
+def find_next_transaction_row(ws):
+    """
+    Finds the first empty row after the last transaction in Sheet1
+    """
+    # Find the next empty row after the last data row, not just max_row
+    next_row = ws.max_row
+    # Iterate backwards to find the last row with actual data.
+    # We check every column, not just the Date, because a row without a
+    # Date is still a transaction and must not be overwritten (the ledger
+    # assumes rows are only ever appended).
+    for row in range(ws.max_row, 1, -1):
+        if any(ws.cell(row=row, column=col).value for col in range(1, len(TRANSACTION_COLUMNS) + 1)):
+            next_row = row + 1
+            break
+    else:
+        # If loop finishes, it means sheet is empty or only has a header
+        if ws.cell(row=1, column=1).value:
+             next_row = ws.max_row + 1 # Use max_row + 1 if header exists
+        else:
+             next_row = 1 # Sheet is completely empty
+    
+    # If next_row is still 1 (empty sheet), but we skipped row 1 (header=1),
+    # we should start at row 2.
+    if next_row < 3: # Assuming row 1 is title, row 2 is header
+         # Let's find the first empty row after the header (row 2)
+         next_row = 2 
+         while ws.cell(row=next_row, column=1).value:
+               next_row += 1
+    return next_row
+
+def append_transactions_to_excel(file_path, rows, journal_seq=None, prices=None):
+    """
+    Appends transaction rows (dicts keyed by TRANSACTION_COLUMNS) to Sheet1
+    and writes new current prices ({symbol: price}, see set_sheet_prices)
+    into Sheet2, in a single save. If journal_seq is given, it is stored as
+    the workbook's journal checkpoint in the same save.
+
+    The workbook is written to a temp file and renamed over the original,
+    so a crash never leaves a half-written .xlsx behind.
+    """
+    with WORKBOOK_LOCK:
+        # Without new prices Sheet2 is untouched, so its snapshot can be kept
+        keep_portfolio_snapshot = not prices and snapshot_is_current(file_path, 'portfolio')
+
+        from openpyxl import load_workbook
+        with metrics.span('excel.load_workbook'):
+            wb = load_workbook(file_path)
+        if rows:
+            ws = wb['Sheet1']
+            with metrics.span('excel.find_next_row'):
+                next_row = find_next_transaction_row(ws)
+            for offset, row in enumerate(rows):
+                for col_idx, col in enumerate(TRANSACTION_COLUMNS, start=1):
+                    ws.cell(row=next_row + offset, column=col_idx, value=row.get(col))
+        if prices:
+            set_sheet_prices(wb['Sheet2'], prices)
+
+        if journal_seq is not None:
+            if JOURNAL_CHECKPOINT_SHEET in wb.sheetnames:
+                checkpoint_ws = wb[JOURNAL_CHECKPOINT_SHEET]
+            else:
+                checkpoint_ws = wb.create_sheet(JOURNAL_CHECKPOINT_SHEET)
+                checkpoint_ws.sheet_state = 'hidden'
+            checkpoint_ws['A1'] = 'Last journal seq'
+            checkpoint_ws['B1'] = journal_seq
+
+        with metrics.span('excel.save'):
+            tmp_path = file_path + '.tmp'
+            wb.save(tmp_path)
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+
+        if keep_portfolio_snapshot:
+            rekey_snapshot(file_path, 'portfolio')
+
+def set_sheet_prices(ws, prices):
+    """
+    Writes current prices ({symbol: price}) into the Sheet2 worksheet.
+    Symbols that are not listed yet get a new row. The other columns
+    (e.g. the Market Value formulas) are left as they are.
+    """
+    # Row 1 is the title, row 2 the header
+    header = [cell.value for cell in ws[2]]
+    symbol_col = header.index('Company Symbol') + 1
+    price_col = header.index('Current Market Price (PKR)') + 1
+
+    rows = {}
+    last_row = 2
+    for row in range(3, ws.max_row + 1):
+        symbol = ws.cell(row=row, column=symbol_col).value
+        if symbol is not None and symbol != '':
+            rows.setdefault(symbol, row)
+            last_row = row
+
+    for symbol, price in prices.items():
+        row = rows.get(symbol)
+        if row is None:
+            last_row += 1
+            row = rows[symbol] = last_row
+            ws.cell(row=row, column=symbol_col, value=symbol)
+        ws.cell(row=row, column=price_col, value=price)
@@ -0,0 +1,100 @@
+import functools
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+
+class ResponseCache:
+    """
+    Serialized JSON bodies of the read endpoints, kept for the current
+    snapshot version only.
+
+    Every response gets an ETag made from the snapshot's version, so a
+    client that already has it gets a 304 without the body being built.
+    Anything else is built once per version and then served from here.
+
+    Each portfolio's snapshots have their own epoch, so bodies are kept per
+    epoch: a new version of one portfolio only drops that portfolio's bodies.
+    """
+
+    def __init__(self, app, get_snapshot, max_entries=1024):
+        self.app = app
+        self.get_snapshot = get_snapshot
+        self.max_entries = max_entries
+        self._tags = {}  # epoch -> tag of the bodies kept for it
+        self._bodies = OrderedDict()  # (tag, key) -> body, least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag_for(snapshot):
+        return f"{snapshot.epoch}-{snapshot.version}"
+
+    def _get(self, tag, key):
+        with self._lock:
+            body = self._bodies.get((tag, key))
+            if body is not None:
+                self._bodies.move_to_end((tag, key))
+            return body
+
+    def _put(self, snapshot, tag, key, body):
+        if tag != self.etag_for(self.get_snapshot()):
+            return  # built from a version that has been replaced meanwhile
+        with self._lock:
+            old_tag = self._tags.get(snapshot.epoch)
+            if tag != old_tag:
+                # A new version: everything cached for the old one is stale
+                self._tags[snapshot.epoch] = tag
+                if old_tag is not None:
+                    self._drop(lambda cached_tag: cached_tag == old_tag)
+            self._bodies[(tag, key)] = body
+            if len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def _drop(self, stale):
+        for cached in [cached for cached in self._bodies if stale(cached[0])]:
+            del self._bodies[cached]
+
+    def forget(self, epoch):
+        """
+        Drops the bodies of a portfolio that is no longer loaded
+        """
+        with self._lock:
+            tag = self._tags.pop(epoch, None)
+            if tag is not None:
+                self._drop(lambda cached_tag: cached_tag == tag)
+
+    def respond(self, key, build):
+        """
+        Returns the response for `key` (the request path), calling
+        build(snapshot) only if the body isn't cached for this version
+        """
+        snapshot = self.get_snapshot()
+        tag = self.etag_for(snapshot)
+
+        if request.if_none_match.contains(tag):
+            response = self.app.response_class(status=304)
+        else:
+            body = self._get(tag, key)
+            if body is None:
+                body = self.app.json.dumps(build(snapshot)) + "\n"
+                self._put(snapshot, tag, key, body)
+            response = self.app.response_class(body, mimetype='application/json')
+
+        response.set_etag(tag)
+        # Let browsers keep the body, but ask us (cheaply) every time
+        response.cache_control.no_cache = True
+        return response
+
+    def cached(self, view):
+        """
+        Decorator for a read endpoint. The view gets the snapshot as its
+        first argument and returns the data to send as JSON.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            return self.respond(
+                request.full_path,
+                lambda snapshot: view(snapshot, *args, **kwargs)
+            )
+        return wrapper
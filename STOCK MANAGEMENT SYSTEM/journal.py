@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process file locks, the thread locks still apply
+    fcntl = None
+
+# Hidden sheet where the workbook remembers the last journal entry it contains
+JOURNAL_CHECKPOINT_SHEET = 'Journal_Checkpoint'
+
+
+def journal_path_for(file_path):
+    """
+    data/Book.xlsx -> data/Book.xlsx.journal
+    """
+    return f"{file_path}.journal"
+
+
+def read_journal_checkpoint(file_path):
+    """
+    Last journal seq that has already been compacted into the workbook (0 if none)
+    """
+    if not os.path.exists(file_path):
+        return 0
+    # openpyxl is only imported once a workbook is actually opened
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        if JOURNAL_CHECKPOINT_SHEET not in wb.sheetnames:
+            return 0
+        value = wb[JOURNAL_CHECKPOINT_SHEET]['B1'].value
+        return int(value or 0)
+    finally:
+        wb.close()
+
+
+def _read_journal_lines(journal_path):
+    """
+    Every complete entry in the journal, as dicts, in file order
+    """
+    if not os.path.exists(journal_path):
+        return []
+
+    entries = []
+    with open(journal_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # torn write, ignore
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def read_journal_entries(journal_path, after_seq=0, kind='row'):
+    """
+    Returns [(seq, row), ...] for the journal entries with seq > after_seq.
+    With kind='prices' it returns the price updates instead:
+    [(seq, {symbol: price}), ...]
+    """
+    return [
+        (entry['seq'], entry[kind])
+        for entry in _read_journal_lines(journal_path)
+        # Entries of the other kind, and seq markers left by truncate_through, are skipped
+        if kind in entry and entry['seq'] > after_seq
+    ]
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock shared by every process using the same journal
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TransactionJournal:
+    """
+    Append-only, fsync'd log of new transactions (one JSON object per line),
+    kept next to the workbook. Price updates are logged the same way.
+
+    Appending a row costs one small write + fsync instead of rewriting the
+    whole .xlsx file. The JournalCompactor (compactor.py) later moves the
+    rows into Sheet1 and the prices into Sheet2.
+    Every entry has a sequence number; the workbook remembers the last one
+    it contains (see read_journal_checkpoint), so an entry is never counted
+    twice even if we crash between saving the workbook and trimming the journal.
+    """
+
+    def __init__(self, workbook_path):
+        self.workbook_path = workbook_path
+        self.path = journal_path_for(workbook_path)
+        self.lock_path = self.path + '.lock'
+        self._lock = threading.Lock()
+
+        with self._lock, file_lock(self.lock_path):
+            self._repair_torn_tail()
+
+    def _repair_torn_tail(self):
+        """
+        Drops a half-written last line (from a crash during append)
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _last_seq(self):
+        """
+        Sequence number of the last line in the journal (only the end of the
+        file is read). An empty journal continues from the workbook checkpoint.
+        """
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                chunk = 4096
+                while True:
+                    f.seek(max(0, size - chunk))
+                    tail = f.read()
+                    lines = tail.splitlines()
+                    # The first line may be cut off unless we read from the start
+                    if len(lines) > 1 or size <= chunk:
+                        break
+                    chunk *= 2
+            if lines:
+                return json.loads(lines[-1])['seq']
+        return read_journal_checkpoint(self.workbook_path)
+
+    def append(self, records):
+        """
+        Durably appends transactions (dicts keyed by the Sheet1 column names)
+        with a single fsync.
+        Returns the sequence numbers given to them.
+        """
+        return self._append([{'row': record} for record in records])
+
+    def append_prices(self, prices):
+        """
+        Durably appends one price update ({symbol: price}).
+        Returns its sequence number.
+        """
+        return self._append([{'prices': dict(prices)}])[0]
+
+    def _append(self, payloads):
+        with self._lock, file_lock(self.lock_path):
+            seq = self._last_seq()
+            lines = []
+            seqs = []
+            for payload in payloads:
+                seq += 1
+                lines.append(json.dumps({'seq': seq, **payload}, default=str) + '\n')
+                seqs.append(seq)
+
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+        return seqs
+
+    def read_entries(self, after_seq=0):
+        """
+        Returns [(seq, row), ...] for entries with seq > after_seq
+        """
+        return read_journal_entries(self.path, after_seq)
+
+    def read_prices(self, after_seq=0):
+        """
+        Returns [(seq, {symbol: price}), ...] for price updates with seq > after_seq
+        """
+        return read_journal_entries(self.path, after_seq, kind='prices')
+
+    def truncate_through(self, seq):
+        """
+        Removes every entry with seq <= `seq` (they are in the workbook now)
+        """
+        remaining = [
+            entry for entry in _read_journal_lines(self.path)
+            if entry['seq'] > seq and ('row' in entry or 'prices' in entry)
+        ]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # A marker line keeps the last seq, so numbering never restarts
+            f.write(json.dumps({'seq': seq}) + '\n')
+            for entry in remaining:
+                f.write(json.dumps(entry, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def pending_entries(self):
+        """
+        Entries that are not in the workbook yet
+        """
+        return self.read_entries(after_seq=read_journal_checkpoint(self.workbook_path))
+
+    def pending_prices(self):
+        """
+        Price updates that are not in the workbook yet
+        """
+        return self.read_prices(after_seq=read_journal_checkpoint(self.workbook_path))
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the append lock (threads and processes) for a short critical section
+        """
+        with self._lock, file_lock(self.lock_path):
+            yield
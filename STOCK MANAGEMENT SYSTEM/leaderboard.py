@@ -0,0 +1,94 @@
+from bisect import bisect_left, insort
+
+import numpy as np
+
+# Metrics a leaderboard can rank by -> summary column
+LEADERBOARD_METRICS = {
+    'pl': 'Profit/Loss (PKR)',
+    'return': 'Profit/Loss %',
+    'value': 'Market Value (PKR)',
+    'invested': 'Total Bought (PKR)'
+}
+
+
+class Leaderboard:
+    """
+    Companies ranked by each metric in LEADERBOARD_METRICS, kept sorted as
+    rows change.
+
+    Every metric has a sorted list of (value, row position) keys. When one
+    company's summary row changes, update() moves only its keys (a binary
+    search plus one list insert), so the full table is never re-sorted.
+    Rows with a missing value are left out of that metric's ranking.
+    """
+
+    def __init__(self):
+        self._ranked = {metric: [] for metric in LEADERBOARD_METRICS}
+        self._keys = {}  # row position -> {metric: key}
+
+    @classmethod
+    def from_frame(cls, portfolio_df):
+        """
+        Builds the rankings for a whole summary table (sorted once)
+        """
+        board = cls()
+        positions = np.arange(len(portfolio_df)).tolist()
+        for metric, column in LEADERBOARD_METRICS.items():
+            if column not in portfolio_df.columns:
+                continue
+            values = portfolio_df[column].to_numpy(dtype=float).tolist()
+            keys = [(value, pos) for value, pos in zip(values, positions) if value == value]
+            keys.sort()
+            board._ranked[metric] = keys
+            for key in keys:
+                board._keys.setdefault(key[1], {})[metric] = key
+        return board
+
+    def update(self, position, row):
+        """
+        Re-ranks one summary row (`row` maps column names to the new values)
+        """
+        keys = self._keys.setdefault(position, {})
+        for metric, column in LEADERBOARD_METRICS.items():
+            ranked = self._ranked[metric]
+            old = keys.pop(metric, None)
+            if old is not None:
+                del ranked[bisect_left(ranked, old)]
+
+            value = float(row[column])
+            if value == value:  # NaN is not ranked
+                key = (value, position)
+                insort(ranked, key)
+                keys[metric] = key
+
+    def top(self, metric, n):
+        """
+        Row positions of the n highest values (ties: earlier rows first,
+        like DataFrame.nlargest)
+        """
+        ranked = self._ranked[metric]
+        if n <= 0 or not ranked:
+            return []
+        start = max(0, len(ranked) - n)
+        # Include every row tied with the cut-off value, then order the few
+        # candidates by (value desc, position asc)
+        while start > 0 and ranked[start - 1][0] == ranked[start][0]:
+            start -= 1
+        candidates = sorted(ranked[start:], key=lambda key: (-key[0], key[1]))
+        return [pos for _, pos in candidates[:n]]
+
+    def bottom(self, metric, n):
+        """
+        Row positions of the n lowest values (ties: earlier rows first)
+        """
+        return [pos for _, pos in self._ranked[metric][:max(n, 0)]]
+
+    def frozen_copy(self):
+        """
+        Copy of the rankings for a read-only snapshot (top/bottom only,
+        it can't be updated)
+        """
+        board = Leaderboard()
+        board._ranked = {metric: list(ranked) for metric, ranked in self._ranked.items()}
+        board._keys = None
+        return board
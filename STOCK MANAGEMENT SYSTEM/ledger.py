@@ -0,0 +1,313 @@
+import numpy as np
+import pandas as pd
+
+from calculator import PortfolioCalculator, PORTFOLIO_COLUMNS
+from data_loader import coerce_transaction, concat_transactions, transactions_frame
+from leaderboard import Leaderboard
+
+
+class IncrementalLedger:
+    """
+    Keeps the per-company transaction aggregates and the portfolio summary
+    in memory, so a single new Buy/Sell can be applied without re-reading
+    the Excel file or re-aggregating every transaction.
+
+    A full rebuild (rebuild()) is only needed at startup or when asked for.
+    """
+
+    def __init__(self, transactions_df, price_template_df, aggregates=None):
+        self.rebuild(transactions_df, price_template_df, aggregates)
+
+    def rebuild(self, transactions_df, price_template_df, aggregates=None):
+        """
+        Recalculates everything from scratch (same result as the calculator).
+        `aggregates` are precomputed per-company totals (see
+        PortfolioCalculator.aggregate_transactions), if the storage has them.
+        """
+        self._base_transactions = transactions_df
+        self._pending_rows = []
+        self._transactions_cache = transactions_df
+
+        # Per-company aggregates: {symbol: {'total_bought': ..., ...}}
+        # Stored as plain Python numbers so they can be updated in place and
+        # sent straight to jsonify.
+        if aggregates is None and transactions_df is not None and not transactions_df.empty:
+            aggregates = PortfolioCalculator.aggregate_transactions(transactions_df)
+        analysis = aggregates.to_dict(orient='index') if aggregates is not None else {}
+        self.analysis = {
+            symbol: {
+                'total_bought': float(stats['total_bought']),
+                'total_sold': float(stats['total_sold']),
+                'net_quantity': float(stats['net_quantity']),
+                'total_buy_quantity': float(stats['total_buy_quantity']),
+                'buy_count': int(stats['buy_count']),
+                'sell_count': int(stats['sell_count'])
+            }
+            for symbol, stats in analysis.items()
+        }
+        # Symbols whose aggregates changed since take_touched() (None: all of them)
+        self._touched = None
+
+        # Ledger-wide totals for /summary (same rules as the calculator's
+        # calculate_total_investment / calculate_total_sales), kept up to date
+        # row by row so the summary never needs the whole transactions table
+        self.totals = {
+            'total_investment': float(PortfolioCalculator.calculate_total_investment(transactions_df)),
+            'total_sales': float(PortfolioCalculator.calculate_total_sales(transactions_df))
+        }
+
+        # Symbol -> (Company Name, Current Market Price) lookup from Sheet2
+        self._prices = {}
+        if price_template_df is not None and not price_template_df.empty:
+            prices = pd.to_numeric(price_template_df['Current Market Price (PKR)'], errors='coerce').fillna(0)
+            for symbol, name, price in zip(price_template_df['Company Symbol'],
+                                           price_template_df['Company Name'],
+                                           prices):
+                # Keep the first row for a symbol, like the merge would show it first
+                self._prices.setdefault(symbol, (name, float(price)))
+        self._has_prices = bool(self._prices)
+
+        self.portfolio_df = PortfolioCalculator.create_portfolio_summary(
+            transactions_df, price_template_df, aggregates
+        )
+        if self.portfolio_df is None:
+            self.portfolio_df = pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+
+        # Symbol -> row position in portfolio_df, so we can refresh a single row
+        self._rows = {}
+        if 'Company Symbol' in self.portfolio_df.columns:
+            self.portfolio_df = self.portfolio_df.reset_index(drop=True)
+            for pos, symbol in enumerate(self.portfolio_df['Company Symbol']):
+                self._rows.setdefault(symbol, pos)
+
+        # Rankings by P/L, P/L %, market value and invested amount,
+        # updated row by row in _refresh_row
+        self.leaderboard = Leaderboard.from_frame(self.portfolio_df)
+
+    @property
+    def transactions_df(self):
+        """
+        The full transactions table, including rows applied since the last rebuild.
+        New rows are only concatenated when somebody actually asks for the table.
+        """
+        if self._pending_rows:
+            new_rows = transactions_frame(self._pending_rows)
+            if self._base_transactions is None or self._base_transactions.empty:
+                self._transactions_cache = new_rows
+            else:
+                self._transactions_cache = concat_transactions([self._base_transactions, new_rows])
+            self._base_transactions = self._transactions_cache
+            self._pending_rows = []
+        return self._transactions_cache
+
+    def transactions_parts(self):
+        """
+        (transactions at the last rebuild, list of rows applied since) without
+        concatenating them. The list is only ever appended to, so a reader
+        that remembers its length sees a fixed set of rows.
+        """
+        return self._base_transactions, self._pending_rows
+
+    def take_touched(self):
+        """
+        The symbols whose aggregates changed since the last call, or None
+        if everything did (a rebuild). Starts a new, empty set.
+        """
+        touched, self._touched = self._touched, set()
+        return touched
+
+    @staticmethod
+    def clean_transaction(record):
+        """
+        Applies the same cleaning rules as load_transactions_from_excel to a
+        single row. Returns None if the row would have been dropped.
+        """
+        return coerce_transaction(record)[0]
+
+    def apply_transaction(self, record):
+        """
+        Applies one new transaction (a dict keyed by the Sheet1 column names)
+        to the aggregates and refreshes only that company's summary row.
+        Returns True if the row was applied, False if it was not valid.
+        """
+        cleaned = self.clean_transaction(record)
+        if cleaned is None:
+            return False
+
+        self._refresh_row(self._add_to_aggregates(cleaned))
+        return True
+
+    def apply_transactions(self, records):
+        """
+        Applies many transactions at once (bulk import): the aggregates are
+        updated row by row, but each company's summary row is refreshed
+        only once at the end. Returns the number of rows applied.
+        """
+        touched = {}
+        applied = 0
+        for record in records:
+            cleaned = self.clean_transaction(record)
+            if cleaned is not None:
+                touched.setdefault(self._add_to_aggregates(cleaned), None)
+                applied += 1
+
+        for symbol in touched:
+            self._refresh_row(symbol)
+        return applied
+
+    def update_prices(self, prices):
+        """
+        Sets new current prices ({symbol: price}) and recomputes only the
+        price-dependent columns (price, market value, P/L, return %) of the
+        affected summary rows, as array operations on the summary's own
+        Total Bought / Total Sold / Net Shares columns. The transaction
+        aggregates are not touched. Returns the number of rows that changed.
+        """
+        for symbol, price in prices.items():
+            name = self._prices.get(symbol, (None, 0.0))[0]
+            self._prices[symbol] = (name, float(price))
+
+        if not self._has_prices:
+            # Without a price list there was no summary at all: build it now
+            self._has_prices = True
+            for symbol in self.analysis:
+                self._refresh_row(symbol)
+            return len(self._rows)
+
+        symbols = [symbol for symbol in prices if symbol in self._rows]
+        if not symbols:
+            return 0
+        positions = np.array([self._rows[symbol] for symbol in symbols])
+        price = np.array([self._prices[symbol][1] for symbol in symbols])
+
+        df = self.portfolio_df
+        total_bought = df['Total Bought (PKR)'].to_numpy(dtype=float)[positions]
+        total_sold = df['Total Sold(PKR)'].to_numpy(dtype=float)[positions]
+        net_shares = df['Net Shares'].to_numpy(dtype=float)[positions]
+
+        market_value = net_shares * price
+        profit_loss = (market_value + total_sold) - total_bought
+        return_pct = np.divide(profit_loss * 100, total_bought,
+                               out=np.zeros(len(positions)), where=total_bought > 0)
+
+        columns = ['Current Market Price (PKR)', 'Market Value (PKR)', 'Profit/Loss (PKR)', 'Profit/Loss %']
+        values = np.column_stack([price, market_value, profit_loss, return_pct])
+        df.iloc[positions, df.columns.get_indexer(columns)] = values
+
+        if len(positions) > len(df) // 8:
+            # Most of the table moved: one sort is cheaper than many moves
+            self.leaderboard = Leaderboard.from_frame(df)
+        else:
+            for pos, row, bought in zip(positions.tolist(), values.tolist(), total_bought.tolist()):
+                row = dict(zip(columns, row))
+                row['Total Bought (PKR)'] = bought
+                self.leaderboard.update(pos, row)
+        return len(symbols)
+
+    def _add_to_aggregates(self, cleaned):
+        """
+        Adds one cleaned row to its company's aggregates. Returns the symbol.
+        """
+        self._pending_rows.append(cleaned)
+
+        symbol = cleaned['Company Symbol']
+        quantity = float(cleaned['Quantity'])
+        amount = cleaned['Total Amount(pkr)']
+
+        # The totals take 'Total Amount(pkr)' as entered (missing: nothing)
+        if not pd.isna(amount):
+            if cleaned['Transaction Type'] == 'Buy':
+                self.totals['total_investment'] += float(amount)
+            elif cleaned['Transaction Type'] == 'Sell':
+                self.totals['total_sales'] += float(amount)
+
+        # Same rule as analyze_transactions_by_company: missing or 0 -> Quantity * Price
+        if pd.isna(amount) or amount == 0:
+            amount = quantity * float(cleaned['Price Per Share (pkr)'])
+
+        if self._touched is not None:
+            self._touched.add(symbol)
+        stats = self.analysis.setdefault(symbol, {
+            'total_bought': 0.0,
+            'total_sold': 0.0,
+            'net_quantity': 0.0,
+            'total_buy_quantity': 0.0,
+            'buy_count': 0,
+            'sell_count': 0
+        })
+
+        if cleaned['Transaction Type'] == 'Buy':
+            stats['total_bought'] += amount
+            stats['total_buy_quantity'] += quantity
+            stats['net_quantity'] += quantity
+            stats['buy_count'] += 1
+        elif cleaned['Transaction Type'] == 'Sell':
+            stats['total_sold'] += amount
+            stats['net_quantity'] -= quantity
+            stats['sell_count'] += 1
+
+        return symbol
+
+    def _match_column_types(self, row):
+        """
+        Brings a summary row (list in PORTFOLIO_COLUMNS order) to the dtypes
+        of the summary columns, so a refreshed row serializes like the rows
+        of a rebuild: whole share counts stay ints in an integer column. A
+        fractional value turns its column into float64, as a rebuild would.
+        """
+        for i, col in enumerate(PORTFOLIO_COLUMNS):
+            if col not in self.portfolio_df.columns or self.portfolio_df[col].dtype.kind not in 'iu':
+                continue
+            if float(row[i]).is_integer():
+                row[i] = int(row[i])
+            else:
+                self.portfolio_df[col] = self.portfolio_df[col].astype('float64')
+
+    def _refresh_row(self, symbol):
+        """
+        Recomputes the summary columns for one company from its aggregates.
+        """
+        stats = self.analysis[symbol]
+
+        if not self._has_prices:
+            # create_portfolio_summary returns nothing without a price template
+            return
+
+        name, price = self._prices.get(symbol, (None, float('nan')))
+
+        total_bought = stats['total_bought']
+        total_sold = stats['total_sold']
+        net_shares = stats['net_quantity']
+        avg_buy_price = (total_bought / stats['total_buy_quantity']) if stats['total_buy_quantity'] > 0 else 0
+        market_value = net_shares * price
+        profit_loss = (market_value + total_sold) - total_bought
+        return_pct = (profit_loss / total_bought) * 100 if total_bought > 0 else 0
+
+        row = [
+            symbol,
+            name,
+            total_bought,
+            total_sold,
+            net_shares,
+            avg_buy_price,
+            price,
+            market_value,
+            profit_loss,
+            float(return_pct)
+        ]
+        self._match_column_types(row)
+
+        pos = self._rows.get(symbol)
+        if pos is None:
+            # New company: this is the only case that has to grow the frame
+            new_row = pd.DataFrame([row], columns=PORTFOLIO_COLUMNS)
+            if self.portfolio_df.empty:
+                self.portfolio_df = new_row
+            else:
+                self.portfolio_df = pd.concat([self.portfolio_df, new_row], ignore_index=True)
+            pos = len(self.portfolio_df) - 1
+            self._rows[symbol] = pos
+        else:
+            self.portfolio_df.loc[pos, PORTFOLIO_COLUMNS] = row
+
+        self.leaderboard.update(pos, dict(zip(PORTFOLIO_COLUMNS, row)))
@@ -0,0 +1,177 @@
+import json
+import threading
+from collections import deque
+
+import pandas as pd
+
+from calculator import PortfolioCalculator, PORTFOLIO_COLUMNS
+from http_cache import ResponseCache
+from leaderboard import LEADERBOARD_METRICS
+from serialization import to_records
+
+# How many companies of each ranking a delta carries
+LIVE_TOP_N = 5
+
+
+def _same_value(a, b):
+    # NaN counts as equal to NaN, so unpriced rows don't look changed every time
+    return a == b or (a != a and b != b)
+
+
+def _changed_rows(old_index, new_index):
+    """
+    Rows of new_index ({symbol: summary row}) that differ from old_index,
+    and the symbols that are gone
+    """
+    changed = [
+        row for symbol, row in new_index.items()
+        if symbol not in old_index
+        or not all(_same_value(value, old_index[symbol].get(col)) for col, value in row.items())
+    ]
+    removed = [symbol for symbol in old_index if symbol not in new_index]
+    return changed, removed
+
+
+def _rankings(snapshot):
+    portfolio_df = snapshot.portfolio_df
+    if portfolio_df is None or portfolio_df.empty:
+        return {metric: [] for metric in LEADERBOARD_METRICS}
+    symbols = portfolio_df['Company Symbol'].tolist()
+    return {
+        metric: [symbols[pos] for pos in snapshot.leaderboard.top(metric, LIVE_TOP_N)]
+        for metric in LEADERBOARD_METRICS
+    }
+
+
+def build_delta(old, new):
+    """
+    What changed from snapshot `old` to snapshot `new`: the changed summary
+    rows (in the /holdings format), removed symbols, the new /summary totals
+    and the rankings (top LIVE_TOP_N symbols per metric) that moved
+    """
+    changed, removed = _changed_rows(old.symbol_index, new.symbol_index)
+    holdings = []
+    if changed:
+        changed_df = pd.DataFrame(changed, columns=PORTFOLIO_COLUMNS)
+        holdings = to_records(PortfolioCalculator.format_summary(changed_df))
+
+    old_rankings = _rankings(old)
+    new_rankings = _rankings(new)
+    return {
+        'base': ResponseCache.etag_for(old),
+        'tag': ResponseCache.etag_for(new),
+        'version': new.version,
+        'holdings': holdings,
+        'removed': removed,
+        'summary': new.summary,
+        'leaderboard': {
+            metric: symbols for metric, symbols in new_rankings.items()
+            if symbols != old_rankings[metric]
+        }
+    }
+
+
+def sse_message(event, data, event_id=None):
+    """
+    One Server-Sent Events message
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class LiveBroadcaster:
+    """
+    Pushes portfolio changes to every open dashboard (Server-Sent Events).
+
+    One background thread per process watches for new snapshots (published
+    here or, with shared snapshots, by another worker). For each new version
+    it builds the delta once and serializes it once; every connected stream
+    just picks the same message out of a short shared buffer. A client that
+    falls too far behind is told to reload instead.
+
+    The thread only runs while at least one stream is open: it stops after
+    the last client disconnects, and the next stream() starts it again.
+    """
+
+    def __init__(self, get_snapshot, poll_interval=0.25, keepalive=15.0, buffer_size=64):
+        self.get_snapshot = get_snapshot
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self._messages = deque(maxlen=buffer_size)  # (seq, message)
+        self._seq = 0
+        self._clients = 0
+        self._changed = threading.Condition()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def client_count(self):
+        return self._clients
+
+    def _ensure_started(self):
+        # Called with self._changed held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        last = self.get_snapshot()
+        while not self._stopping.wait(self.poll_interval):
+            with self._changed:
+                if not self._clients:
+                    # Nobody is listening: no deltas to build
+                    self._thread = None
+                    return
+            try:
+                snapshot = self.get_snapshot()
+                if ResponseCache.etag_for(snapshot) == ResponseCache.etag_for(last):
+                    continue
+                delta = build_delta(last, snapshot)
+                self.publish(sse_message('delta', delta, delta['tag']))
+                last = snapshot
+            except Exception as e:
+                print(f"❌ Warning: Live update failed. {e}")
+
+    def publish(self, message):
+        with self._changed:
+            self._seq += 1
+            self._messages.append((self._seq, message))
+            self._changed.notify_all()
+
+    def stream(self):
+        """
+        Generator of SSE messages for one client: a 'hello' with the current
+        version, then the deltas as they come, and a comment line every
+        `keepalive` seconds so dead connections are noticed
+        """
+        with self._changed:
+            self._clients += 1
+            seen = self._seq
+            self._ensure_started()
+        try:
+            tag = ResponseCache.etag_for(self.get_snapshot())
+            yield sse_message('hello', {'tag': tag}, tag)
+            while not self._stopping.is_set():
+                with self._changed:
+                    self._changed.wait_for(lambda: self._seq > seen, timeout=self.keepalive)
+                    pending = [message for seq, message in self._messages if seq > seen]
+                    missed = self._seq - seen > len(pending)
+                    seen = self._seq
+                if missed:
+                    yield sse_message('reset', {})
+                elif pending:
+                    yield ''.join(pending)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._changed:
+                self._clients -= 1
+
+    def stop(self):
+        self._stopping.set()
+        with self._changed:
+            self._changed.notify_all()
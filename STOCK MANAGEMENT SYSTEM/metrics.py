@@ -0,0 +1,165 @@
+import cProfile
+import datetime
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and latency histograms of this process, rendered in the
+    Prometheus text format by render().
+
+    Each worker process keeps its own numbers (Prometheus adds them up per
+    instance). Recording a value is one dict lookup and one list update
+    under a lock, so spans can wrap hot functions.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._kinds = {}  # name -> (type, help text)
+        self._values = {}  # (name, labels) -> number, or [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._kinds[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def clear(self, name):
+        """
+        Drops every series of a metric (e.g. gauges of things that are gone)
+        """
+        with self._lock:
+            for key in [key for key in self._values if key[0] == name]:
+                del self._values[key]
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(self.buckets) + 2)
+            # Counted in its own bucket only; render() makes them cumulative
+            histogram[bisect_left(self.buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        Times the block into the portfolio_stage_seconds histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('portfolio_stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def timed(self, stage):
+        """
+        Decorator version of span()
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def render(self):
+        """
+        Everything recorded so far, in the Prometheus text format
+        """
+        with self._lock:
+            values = sorted(
+                (key, list(value) if isinstance(value, list) else value)
+                for key, value in self._values.items()
+            )
+
+        lines = []
+        described = None
+        for (name, labels), value in values:
+            if name != described:
+                kind, text = self._kinds.get(name, ('untyped', ''))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described = name
+            if not isinstance(value, list):
+                lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_label_text(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+# One registry for the whole process
+metrics = MetricsRegistry()
+metrics.describe('portfolio_stage_seconds', 'histogram',
+                 "Time spent in each loading/calculation/storage stage")
+metrics.describe('http_request_duration_seconds', 'histogram', "Time to answer a request, by route")
+metrics.describe('http_requests_total', 'counter', "Requests answered, by route and status")
+metrics.describe('portfolio_rebuilds_total', 'counter', "Full rebuilds from the storage")
+metrics.describe('portfolio_transactions_applied_total', 'counter', "Transactions applied to the ledger")
+metrics.describe('portfolio_price_updates_total', 'counter', "Price-only updates applied")
+metrics.describe('portfolio_snapshot_version', 'gauge', "Version of the current snapshot")
+metrics.describe('portfolio_transactions', 'gauge', "Transaction rows in the current snapshot")
+metrics.describe('portfolio_symbols', 'gauge', "Companies in the current summary")
+metrics.describe('portfolio_snapshot_bytes', 'gauge', "Estimated memory of the current snapshot")
+metrics.describe('portfolio_hosted_loaded', 'gauge', "Hosted portfolios (/p/<id>/) in memory")
+metrics.describe('portfolio_hosted_bytes', 'gauge', "Estimated memory of each loaded hosted portfolio")
+metrics.describe('portfolio_write_queue_depth', 'gauge', "Added transactions waiting for the background writer")
+
+
+def start_profile():
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def save_profile(profile, folder, name):
+    """
+    Stops a profile and writes it as <folder>/<time>-<name>.prof (open it
+    with pstats or snakeviz). Returns the file path.
+    """
+    profile.disable()
+    os.makedirs(folder, exist_ok=True)
+    safe_name = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in name)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(folder, f"{stamp}-{safe_name}.prof")
+    profile.dump_stats(path)
+    return path
@@ -5,10 +5,12 @@ class PortfolioManager:
     Main portfolio management class - UPDATED for your data
     """
     
-    def __init__(self, transactions_df, portfolio_df):
+    def __init__(self, transactions_df, portfolio_df, symbol_index=None):
         self.transactions_df = transactions_df
         self.portfolio_df = portfolio_df
         self.calculator = PortfolioCalculator()
+        # Symbol -> summary row (built on the first lookup)
+        self.symbol_index = symbol_index
     
     def display_portfolio_summary(self):
         """
@@ -55,7 +57,7 @@ class PortfolioManager:
                   f"Avg Buy: PKR {holding.get('Average Buy Price(PKR)', 0):8.2f} | "
                   f"Current: PKR {holding.get('Current Market Price (PKR)', 0):8.2f} | "
                   f"P&L: PKR {profit_loss:10,.2f} | "
-                  f"Status: {holding.get('Status', 'Unknown')}")
+                  f"Status: {holding.get('Profit/Loss %', 0):.2f}%")
     
     def display_top_performers(self):
         """
@@ -79,12 +81,18 @@ class PortfolioManager:
                   f"({stock.get('Profit/Loss %', 0):+.2f}%)")
             print()
     
-    def get_company_details(self, symbol):
+    def get_company_details(self, *symbols):
         """
-        Get detailed information for a specific company
+        Get detailed information for one or more companies
         """
-        company_data = self.calculator.get_company_analysis(self.portfolio_df, symbol.upper())
-        
+        if self.symbol_index is None:
+            self.symbol_index = self.calculator.build_symbol_index(self.portfolio_df)
+        details = self.calculator.get_companies_analysis(self.portfolio_df, symbols, self.symbol_index)
+
+        for symbol in symbols:
+            self._display_company(symbol, details[symbol.upper()])
+
+    def _display_company(self, symbol, company_data):
         if company_data:
             print(f"\n📊 COMPANY ANALYSIS: {company_data['symbol']} - {company_data['name']}")
             print("-" * 50)
@@ -97,10 +105,9 @@ class PortfolioManager:
             print(f"Profit/Loss:      PKR {company_data['profit_loss']:,.2f}")
             print(f"Status:           {company_data['status']}")
             
-            # Calculate return percentage
+            # Return percentage is precomputed in the summary
             if company_data['total_bought'] > 0:
-                return_pct = (company_data['profit_loss'] / company_data['total_bought']) * 100
-                print(f"Return:           {return_pct:+.2f}%")
+                print(f"Return:           {company_data['return_pct']:+.2f}%")
         else:
             print(f"Company with symbol '{symbol}' not found in portfolio.")
     
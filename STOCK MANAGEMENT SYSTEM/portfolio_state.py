@@ -0,0 +1,424 @@
+import threading
+import uuid
+
+import pandas as pd
+
+from calculator import PortfolioCalculator, PORTFOLIO_COLUMNS
+from data_loader import concat_transactions, transactions_frame
+from leaderboard import Leaderboard
+from ledger import IncrementalLedger
+from metrics import metrics
+from portfolio import PortfolioManager
+from query_index import SortedIndex
+
+
+class PortfolioSnapshot:
+    """
+    One consistent, read-only version of the portfolio: the transactions, the
+    summary and the per-company analysis all belong to the same moment.
+
+    A snapshot is never changed after it is published. Request handlers take
+    the current one once (PortfolioState.snapshot) and use only that, so they
+    never see new transactions next to an old summary.
+    """
+
+    def __init__(self, version, transactions_base, new_rows, new_row_count, portfolio_df, analysis,
+                 position=None, epoch='', leaderboard=None, totals=None):
+        self.version = version
+        # Changes whenever versions start over (new process, new owner), so
+        # (epoch, version) identifies the data, e.g. for ETags
+        self.epoch = epoch
+        # Storage position of the last transaction included (see storage.changes_since)
+        self.position = position
+        self.portfolio_df = portfolio_df
+        self.analysis = analysis
+        # The transactions table is only built when somebody asks for it.
+        # new_rows is the ledger's append-only list; this version owns the
+        # first new_row_count entries.
+        self._transactions_base = transactions_base
+        self._new_rows = new_rows
+        self._new_row_count = new_row_count
+        self._transactions_df = None
+        self._manager = None
+        self._holdings_index = None
+        self._analysis_index = None
+        self._leaderboard = leaderboard
+        # Ledger-wide totals kept by the ledger (see IncrementalLedger.totals),
+        # so /summary doesn't need the transactions table
+        self.totals = totals
+        self._symbol_index = None
+        self._history = None
+        self._summary = None
+        self._lots = {}
+        self._lot_summaries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def empty(cls, version=0):
+        return cls(version, None, [], 0, pd.DataFrame(columns=PORTFOLIO_COLUMNS), {})
+
+    @property
+    def transactions_df(self):
+        """
+        All transactions in this version (Sheet1 rows + rows added since the
+        last rebuild), concatenated on first use
+        """
+        if self._transactions_df is None:
+            with self._lock:
+                if self._transactions_df is None:
+                    self._transactions_df = self._build_transactions()
+        return self._transactions_df
+
+    def transactions_parts(self):
+        """
+        (transactions at the last rebuild, number of rows added since),
+        without building the combined table
+        """
+        return self._transactions_base, self._new_row_count
+
+    def _build_transactions(self):
+        if not self._new_row_count:
+            return self._transactions_base
+        new_rows = transactions_frame(self._new_rows[:self._new_row_count])
+        if self._transactions_base is None or self._transactions_base.empty:
+            return new_rows
+        return concat_transactions([self._transactions_base, new_rows])
+
+    @property
+    def symbol_index(self):
+        """
+        {symbol: summary row}, for company lookups
+        """
+        if self._symbol_index is None:
+            with self._lock:
+                if self._symbol_index is None:
+                    self._symbol_index = PortfolioCalculator.build_symbol_index(self.portfolio_df)
+        return self._symbol_index
+
+    @property
+    def summary(self):
+        """
+        Portfolio totals of this version (the /summary response), computed once
+        """
+        if self._summary is None:
+            # FIX: Convert all NumPy-derived financial totals to standard Python float()
+            # to prevent "TypeError: Object of type int64 is not JSON serializable".
+            total_investment = 0.0
+            total_sales = 0.0
+            portfolio_value = 0.0
+            net_profit_loss = 0.0
+
+            if self.totals is not None:
+                total_investment = float(self.totals['total_investment'])
+                total_sales = float(self.totals['total_sales'])
+            elif self.transactions_df is not None:
+                total_investment = float(PortfolioCalculator.calculate_total_investment(self.transactions_df))
+                total_sales = float(PortfolioCalculator.calculate_total_sales(self.transactions_df))
+
+            if self.portfolio_df is not None:
+                portfolio_value = float(PortfolioCalculator.calculate_portfolio_value(self.portfolio_df))
+                net_profit_loss = float(PortfolioCalculator.calculate_net_profit_loss(self.portfolio_df))
+
+
+            self._summary = {
+                "total_investment": total_investment,
+                "total_sales": total_sales,
+                "portfolio_value": portfolio_value,
+                "net_profit_loss": net_profit_loss
+            }
+        return self._summary
+
+    def lot_summary(self, method='fifo'):
+        """
+        summary plus the realized/unrealized split of the P/L from lot
+        matching with a cost method (/summary?method=), computed once per
+        method for this version
+        """
+        lot_summary = self._lot_summaries.get(method)
+        if lot_summary is None:
+            prices = {}
+            if self.portfolio_df is not None and not self.portfolio_df.empty:
+                prices = dict(zip(self.portfolio_df['Company Symbol'],
+                                  self.portfolio_df['Current Market Price (PKR)'].tolist()))
+            lot_totals = self.lots(method).totals(prices)
+            lot_summary = dict(
+                self.summary,
+                cost_method=method,
+                realized_profit_loss=float(lot_totals['realized_pl']),
+                unrealized_profit_loss=float(lot_totals['unrealized_pl'])
+            )
+            self._lot_summaries[method] = lot_summary
+        return lot_summary
+
+    def lots(self, method='fifo', symbols=None):
+        """
+        LotBook of this version for a cost method ('fifo', 'lifo' or
+        'average'). With `symbols`, only those companies' rows are matched
+        (the response cache keeps the result); the whole ledger is matched
+        once per version and kept.
+        """
+        if symbols is not None:
+            return PortfolioCalculator.match_lots(self.transactions_df, method, symbols)
+        book = self._lots.get(method)
+        if book is None:
+            transactions_df = self.transactions_df
+            with self._lock:
+                book = self._lots.get(method)
+                if book is None:
+                    book = PortfolioCalculator.match_lots(transactions_df, method)
+                    self._lots[method] = book
+        return book
+
+    @property
+    def history(self):
+        """
+        Running totals of this version's ledger by date (build_history),
+        sorted once and shared by every /history request on this version
+        """
+        if self._history is None:
+            transactions_df = self.transactions_df
+            with self._lock:
+                if self._history is None:
+                    self._history = PortfolioCalculator.build_history(transactions_df)
+        return self._history
+
+    @property
+    def holdings_index(self):
+        """
+        Sorted orders of the summary table for paged /holdings queries
+        (built on first use, then shared by every request on this version)
+        """
+        if self._holdings_index is None:
+            with self._lock:
+                if self._holdings_index is None:
+                    self._holdings_index = SortedIndex(
+                        self.portfolio_df.reset_index(drop=True),
+                        'Company Symbol',
+                        sign_column='Profit/Loss (PKR)'
+                    )
+        return self._holdings_index
+
+    @property
+    def analysis_index(self):
+        """
+        The per-company analysis as a table ('symbol' + the aggregates),
+        with sorted orders for paged /transactions queries
+        """
+        if self._analysis_index is None:
+            with self._lock:
+                if self._analysis_index is None:
+                    analysis_df = pd.DataFrame.from_dict(self.analysis, orient='index')
+                    analysis_df.insert(0, 'symbol', analysis_df.index.astype(str))
+                    self._analysis_index = SortedIndex(
+                        analysis_df.reset_index(drop=True), 'symbol'
+                    )
+        return self._analysis_index
+
+    @property
+    def leaderboard(self):
+        """
+        Rankings of the summary rows (see leaderboard.py). The ledger keeps
+        them up to date; a snapshot without one (e.g. read from shared
+        memory) sorts its summary once, on first use.
+        """
+        if self._leaderboard is None:
+            with self._lock:
+                if self._leaderboard is None:
+                    self._leaderboard = Leaderboard.from_frame(self.portfolio_df)
+        return self._leaderboard
+
+    @property
+    def manager(self):
+        """
+        PortfolioManager over this version's data
+        """
+        if self._manager is None:
+            self._manager = PortfolioManager(
+                self.transactions_df, self.portfolio_df, self.symbol_index
+            )
+        return self._manager
+
+
+class PortfolioState:
+    """
+    Owns the ledger and publishes a new PortfolioSnapshot after every change.
+
+    All changes (rebuilds, new transactions) run one at a time under a single
+    writer lock, which also keeps the storage writes in the same order as the
+    ledger. Readers only read the `snapshot` attribute, which is swapped in
+    one assignment, so they never wait for a writer.
+
+    `on_publish(snapshot)` is called (under the writer lock) for every new
+    snapshot, e.g. to share it with other processes. Version numbers start
+    after `start_version`.
+    """
+
+    def __init__(self, storage, on_publish=None, start_version=0):
+        self.storage = storage
+        self.ledger = None
+        self.position = None
+        self.snapshot = PortfolioSnapshot.empty(start_version)
+        self.on_publish = on_publish
+        self.epoch = uuid.uuid4().hex[:8]
+        self._write_lock = threading.RLock()
+
+    def rebuild(self):
+        """
+        Reloads everything from the storage and recalculates from scratch
+        """
+        with self._write_lock, metrics.span('rebuild'):
+            # 1. Load the transactions (Sheet1 / transactions table)
+            with metrics.span('rebuild.load_transactions'):
+                transactions_df = self.storage.load_transactions()
+
+            # 2. Load the price list/template (Sheet2 / prices table)
+            with metrics.span('rebuild.load_prices'):
+                price_and_template_df = self.storage.load_prices()
+
+            print("Recalculating portfolio summary from transactions...")
+
+            # The ledger runs the full calculation once and keeps the per-company
+            # aggregates, so later transactions can be applied one row at a time.
+            # (SQLite hands over the per-company aggregates from one GROUP BY)
+            with metrics.span('rebuild.calculate'):
+                ledger = IncrementalLedger(
+                    transactions_df, price_and_template_df, self.storage.aggregate_transactions()
+                )
+
+            print("✓ Portfolio summary was successfully recalculated.")
+            try:
+                # Also save this new summary back to the storage
+                # (format_summary turns the numeric 'Profit/Loss %' into 'Status')
+                with metrics.span('rebuild.save_summary'):
+                    self.storage.save_summary(PortfolioCalculator.format_summary(ledger.portfolio_df))
+                print(f"✓ Saved updated summary to 'Calculated_Summary'.")
+            except Exception as e:
+                print(f"❌ Warning: Could not save summary to {self.storage.name}. {e}")
+
+            self.ledger = ledger
+            if transactions_df is not None:
+                self.position = transactions_df.attrs.get('storage_position')
+            self._publish()
+            metrics.inc('portfolio_rebuilds_total')
+
+        print(f"✓ Data reloaded from {self.storage.name}.")
+
+    def add_transactions(self, records, on_stored=None):
+        """
+        Stores new transactions durably, applies them to the ledger (each
+        summary row is recomputed once) and publishes a new snapshot.
+        Returns the number of rows applied.
+
+        `on_stored(position)` is called as soon as the rows are durable, so
+        a caller can tell a failed write from a failure after it.
+        """
+        records = list(records)
+        with self._write_lock:
+            with metrics.span('transactions.store'):
+                position = self.storage.append_transactions(records)
+            if on_stored is not None:
+                on_stored(position)
+            with metrics.span('transactions.apply'):
+                applied = self.ledger.apply_transactions(records)
+            if position is not None:
+                self.position = position
+            if applied:
+                self._publish()
+        metrics.inc('portfolio_transactions_applied_total', applied)
+        return applied
+
+    def update_prices(self, prices):
+        """
+        Stores new current prices ({symbol: price}) and reprices the summary
+        without re-aggregating any transactions. Returns the number of
+        summary rows that changed.
+        """
+        with self._write_lock:
+            with metrics.span('prices.store'):
+                self.storage.update_prices(prices)
+            with metrics.span('prices.apply'):
+                changed = self.ledger.update_prices(prices)
+            if changed:
+                self._publish()
+        metrics.inc('portfolio_price_updates_total')
+        return changed
+
+    def reload_prices(self):
+        """
+        Re-reads the whole price list from the storage (e.g. after another
+        process changed it) and reprices the summary the same way
+        """
+        with self._write_lock:
+            price_df = self.storage.load_prices()
+            if price_df is None or price_df.empty:
+                return 0
+            prices = {}
+            for symbol, price in zip(price_df['Company Symbol'],
+                                     pd.to_numeric(price_df['Current Market Price (PKR)'], errors='coerce').fillna(0)):
+                # First row for a symbol, like the ledger's rebuild
+                prices.setdefault(symbol, float(price))
+            changed = self.ledger.update_prices(prices)
+            if changed:
+                self._publish()
+        return changed
+
+    def sync(self):
+        """
+        Applies the transactions other processes stored since our last
+        position (see storage.changes_since). Returns the number applied.
+        """
+        with self._write_lock:
+            changes = self.storage.changes_since(self.position or 0)
+            if not changes:
+                return 0
+            applied = self.ledger.apply_transactions(record for _, record in changes)
+            self.position = changes[-1][0]
+            self._publish()
+        metrics.inc('portfolio_transactions_applied_total', applied)
+        return applied
+
+    def close(self):
+        """
+        Stops the storage's background work, after any change in progress.
+        Everything stays on disk, so the portfolio can be loaded again later.
+        """
+        with self._write_lock:
+            self.storage.close()
+
+    def _publish(self):
+        """
+        Freezes the ledger's current state into a new snapshot and swaps it in.
+
+        New transaction rows are shared, since the ledger only ever appends
+        to them. The per-company analysis is shared too: only the entries of
+        the companies touched since the last publish are copied (none for a
+        price update). The summary frame and the leaderboard are still copied
+        whole, so a publish costs O(companies) - a copy of each summary
+        column plus four ranked lists, a few ms at 20k companies.
+        """
+        ledger = self.ledger
+        base, new_rows = ledger.transactions_parts()
+        with metrics.span('publish'):
+            touched = ledger.take_touched()
+            analysis = self.snapshot.analysis
+            if touched is None or analysis is None:
+                analysis = {symbol: dict(stats) for symbol, stats in ledger.analysis.items()}
+            elif touched:
+                analysis = dict(analysis)
+                for symbol in touched:
+                    analysis[symbol] = dict(ledger.analysis[symbol])
+
+            self.snapshot = PortfolioSnapshot(
+                self.snapshot.version + 1,
+                base,
+                new_rows,
+                len(new_rows),
+                ledger.portfolio_df.copy(),
+                analysis,
+                self.position,
+                self.epoch,
+                ledger.leaderboard.frozen_copy(),
+                dict(ledger.totals)
+            )
+            if self.on_publish is not None:
+                self.on_publish(self.snapshot)
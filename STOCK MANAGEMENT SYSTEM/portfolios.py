@@ -0,0 +1,319 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from portfolio_state import PortfolioState
+from shared_state import SharedPortfolioState
+from storage import create_storage
+
+# Portfolio ids become file names in the portfolio folder, so only plain
+# names are accepted (no dots or slashes)
+PORTFOLIO_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Assumed size of one transaction row before a portfolio has been measured
+DEFAULT_ROW_BYTES = 200
+
+
+def new_state(storage, excel_file, shared=False):
+    """
+    The state of a portfolio, not loaded yet (see load_state). With
+    shared=True the snapshots are shared between worker processes
+    (SharedPortfolioState).
+    """
+    if shared:
+        return SharedPortfolioState(storage, excel_file)
+    return PortfolioState(storage)
+
+
+def load_state(state):
+    """
+    Loads the data into a new state and starts its background work
+    """
+    if isinstance(state, SharedPortfolioState):
+        state.start()
+    else:
+        state.rebuild()
+        state.storage.start()
+
+
+def open_state(storage, excel_file, shared=False):
+    """
+    new_state + load_state
+    """
+    state = new_state(storage, excel_file, shared)
+    load_state(state)
+    return state
+
+
+def frame_bytes(df):
+    """
+    Memory used by a DataFrame, strings included
+    """
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class LoadedPortfolio:
+    """
+    One portfolio held in memory by the PortfolioRegistry
+    """
+
+    def __init__(self, portfolio_id, state):
+        self.portfolio_id = portfolio_id
+        self.state = state
+        self.last_used = time.monotonic()
+        # Requests and queued writes using it right now (see PortfolioRegistry.checkout)
+        self.users = 0
+        self.size = 0
+        self._measured_version = None
+        self._base = None
+        self._base_bytes = 0
+
+    def measure(self):
+        """
+        Estimated memory of the current snapshot in bytes. The transactions
+        loaded at the last rebuild are measured once; rows added since are
+        counted at the same size per row.
+        """
+        snapshot = self.state.snapshot
+        if snapshot.version == self._measured_version:
+            return self.size
+
+        base, new_row_count = snapshot.transactions_parts()
+        if base is not self._base:
+            self._base = base
+            self._base_bytes = frame_bytes(base)
+        row_bytes = self._base_bytes / len(base) if base is not None and len(base) else DEFAULT_ROW_BYTES
+
+        self.size = self._base_bytes + int(row_bytes * new_row_count) + frame_bytes(snapshot.portfolio_df)
+        self._measured_version = snapshot.version
+        return self.size
+
+
+class PortfolioRegistry:
+    """
+    The portfolios hosted next to the default one, each kept as
+    <folder>/<portfolio_id>.xlsx (or .db with the SQLite backend).
+
+    A portfolio is loaded the first time it is asked for and then kept in
+    an LRU list. When more than `max_loaded` portfolios, or more than
+    `max_bytes` of them, are in memory, the least recently used ones are
+    unloaded; so is any portfolio not used for `idle_timeout` seconds
+    (checked every `sweep_interval` seconds by a background thread, which
+    also enforces the limits again).
+    Unloading only closes the portfolio (its storage flushes pending work),
+    so the next request loads it again from disk.
+
+    A portfolio that is checked out (checkout/checkin: a request or a
+    queued write still using it) is never unloaded, so nobody writes to a
+    closed state and no second state is opened over the same files.
+
+    `on_evict(loaded)` is called for every portfolio that is unloaded.
+    """
+
+    def __init__(self, folder, backend=None, shared=False, max_loaded=16, max_bytes=512 * 2**20,
+                 idle_timeout=900.0, on_evict=None, sweep_interval=None, **storage_options):
+        self.folder = folder
+        self.backend = (backend or 'excel').lower()
+        self.shared = shared
+        self.max_loaded = max_loaded
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.sweep_interval = sweep_interval if sweep_interval is not None else min(idle_timeout / 4, 60.0)
+        self.storage_options = storage_options
+        self._loaded = OrderedDict()  # portfolio_id -> LoadedPortfolio, least recently used first
+        self._loading = {}  # portfolio_id -> lock held while it loads
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stopping = threading.Event()
+
+    def paths_for(self, portfolio_id):
+        """
+        (workbook path, SQLite path) of a portfolio
+        """
+        base = os.path.join(self.folder, portfolio_id)
+        return base + '.xlsx', base + '.db'
+
+    def exists(self, portfolio_id):
+        if not PORTFOLIO_ID.match(portfolio_id):
+            return False
+        excel_file, db_path = self.paths_for(portfolio_id)
+        return os.path.exists(excel_file) or (self.backend == 'sqlite' and os.path.exists(db_path))
+
+    def get(self, portfolio_id, hold=False):
+        """
+        The LoadedPortfolio for an id, loading it on first use.
+        Raises KeyError for a portfolio that doesn't exist.
+        With hold=True it is also checked out (see checkout).
+        """
+        with self._lock:
+            loaded = self._touch(portfolio_id, hold)
+            if loaded is None:
+                load_lock = self._loading.setdefault(portfolio_id, threading.Lock())
+        if loaded is not None:
+            return loaded
+
+        # Loading can take a while: only requests for the same portfolio wait
+        with load_lock:
+            with self._lock:
+                loaded = self._touch(portfolio_id, hold)
+            if loaded is not None:
+                return loaded
+            try:
+                loaded = self._load(portfolio_id)
+            finally:
+                with self._lock:
+                    self._loading.pop(portfolio_id, None)
+
+        with self._lock:
+            if hold:
+                loaded.users += 1
+            self._loaded[portfolio_id] = loaded
+            loaded_now = list(self._loaded.values())
+            self._start_sweeper()
+        for other in loaded_now:
+            other.measure()
+        with self._lock:
+            evicted = self._pick_over_limit(keep=portfolio_id)
+        self._close(evicted)
+        return loaded
+
+    def checkout(self, portfolio_id):
+        """
+        get() for a user that must give it back with checkin(): until then
+        the portfolio stays loaded
+        """
+        return self.get(portfolio_id, hold=True)
+
+    def hold(self, loaded):
+        """
+        One more checkout of a portfolio that is already checked out
+        (e.g. a request handing it to the write queue)
+        """
+        with self._lock:
+            loaded.users += 1
+
+    def checkin(self, loaded):
+        # Writes made while it was checked out change its size: measure it
+        # again now, so the limits are checked against what it uses
+        loaded.measure()
+        with self._lock:
+            loaded.users -= 1
+            loaded.last_used = time.monotonic()
+
+    def sweep(self):
+        """
+        Unloads the portfolios that have been idle for too long, and the
+        least recently used ones while over the limits (a portfolio that was
+        in use when another one loaded may have kept them over)
+        """
+        with self._lock:
+            loaded_now = list(self._loaded.values())
+        for loaded in loaded_now:
+            loaded.measure()
+        with self._lock:
+            evicted = self._pick_over_limit(keep=None)
+        self._close(evicted)
+
+    def _start_sweeper(self):
+        # Called with self._lock held, once something is loaded
+        if self._sweeper is None and self.idle_timeout is not None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='portfolio-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stopping.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Warning: Could not unload idle portfolios. {e}")
+
+    def _touch(self, portfolio_id, hold=False):
+        loaded = self._loaded.get(portfolio_id)
+        if loaded is not None:
+            self._loaded.move_to_end(portfolio_id)
+            loaded.last_used = time.monotonic()
+            if hold:
+                loaded.users += 1
+        return loaded
+
+    def _load(self, portfolio_id):
+        if not self.exists(portfolio_id):
+            raise KeyError(portfolio_id)
+        excel_file, db_path = self.paths_for(portfolio_id)
+        storage = create_storage(excel_file, backend=self.backend, db_path=db_path, **self.storage_options)
+        print(f"Loading portfolio '{portfolio_id}'...")
+        loaded = LoadedPortfolio(portfolio_id, open_state(storage, excel_file, self.shared))
+        print(f"✓ Portfolio '{portfolio_id}' loaded.")
+        return loaded
+
+    def _pick_idle(self, keep):
+        # Least recently used first, so the idle ones are all at the front
+        evicted = []
+        now = time.monotonic()
+        for portfolio_id, loaded in list(self._loaded.items()):
+            if portfolio_id == keep or loaded.users:
+                continue
+            if now - loaded.last_used <= self.idle_timeout:
+                break
+            evicted.append(self._loaded.pop(portfolio_id))
+        return evicted
+
+    def _pick_over_limit(self, keep):
+        evicted = self._pick_idle(keep)
+        total = sum(loaded.size for loaded in self._loaded.values())
+        for portfolio_id, loaded in list(self._loaded.items()):
+            if len(self._loaded) <= self.max_loaded and total <= self.max_bytes:
+                break
+            if portfolio_id == keep or loaded.users:
+                continue
+            evicted.append(self._loaded.pop(portfolio_id))
+            total -= loaded.size
+        return evicted
+
+    def _close(self, evicted):
+        for loaded in evicted:
+            try:
+                if self.on_evict is not None:
+                    self.on_evict(loaded)
+                loaded.state.close()
+                print(f"✓ Portfolio '{loaded.portfolio_id}' unloaded ({loaded.size / 2**20:.1f} MB).")
+            except Exception as e:
+                print(f"❌ Warning: Could not unload portfolio '{loaded.portfolio_id}'. {e}")
+
+    def stats(self):
+        """
+        The loaded portfolios (most recently used last) and the limits
+        """
+        now = time.monotonic()
+        with self._lock:
+            loaded = list(self._loaded.values())
+        return {
+            'loaded': [
+                {
+                    'id': entry.portfolio_id,
+                    'bytes': entry.size,
+                    'version': entry.state.snapshot.version,
+                    'users': entry.users,
+                    'idle_seconds': round(now - entry.last_used, 1)
+                }
+                for entry in loaded
+            ],
+            'total_bytes': sum(entry.size for entry in loaded),
+            'max_loaded': self.max_loaded,
+            'max_bytes': self.max_bytes,
+            'idle_timeout': self.idle_timeout
+        }
+
+    def close(self):
+        """
+        Unloads every portfolio (at shutdown: in use or not)
+        """
+        with self._lock:
+            evicted = list(self._loaded.values())
+            self._loaded.clear()
+        self._close(evicted)
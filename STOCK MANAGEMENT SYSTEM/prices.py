@@ -0,0 +1,127 @@
+import argparse
+import csv
+import json
+import math
+import os
+import urllib.error
+import urllib.request
+
+# Field names accepted for a price row (case-insensitive)
+SYMBOL_FIELDS = ('symbol', 'company symbol')
+PRICE_FIELDS = ('price', 'current market price (pkr)')
+
+
+def price_pairs(data):
+    """
+    (symbol, price) pairs from a request body: {"ENGRO": 301.5, ...},
+    {"prices": {...}} or [{"symbol": ..., "price": ...}, ...]
+    """
+    if isinstance(data, dict) and isinstance(data.get('prices'), (dict, list)):
+        data = data['prices']
+    if isinstance(data, dict):
+        return list(data.items())
+    if isinstance(data, list):
+        return [_row_pair(item) if isinstance(item, dict) else (None, item) for item in data]
+    raise ValueError("Expected {symbol: price, ...} or a list of {symbol, price} objects")
+
+
+def _row_pair(item):
+    fields = {str(key).strip().lower(): value for key, value in item.items()}
+    symbol = next((fields[name] for name in SYMBOL_FIELDS if name in fields), None)
+    price = next((fields[name] for name in PRICE_FIELDS if name in fields), None)
+    return symbol, price
+
+
+def validate_prices(pairs):
+    """
+    Checks (symbol, price) pairs. Returns ({SYMBOL: price}, rejections),
+    where each rejection is {'symbol': ..., 'reason': ...}. Symbols are
+    upper-cased like the company lookups; a price must be a number >= 0.
+    """
+    prices = {}
+    rejected = []
+    for symbol, price in pairs:
+        if symbol is None or str(symbol).strip() == '':
+            rejected.append({'symbol': symbol, 'reason': "Missing symbol"})
+            continue
+        symbol = str(symbol).strip().upper()
+        try:
+            value = float(price)
+        except (TypeError, ValueError):
+            value = float('nan')
+        if not math.isfinite(value) or value < 0:
+            rejected.append({'symbol': symbol, 'reason': f"Invalid price: {price!r}"})
+            continue
+        prices[symbol] = value
+    return prices, rejected
+
+
+def read_price_csv(path):
+    """
+    (symbol, price) pairs from a CSV file with a header row
+    (symbol,price or the Sheet2 column names)
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return [_row_pair(row) for row in csv.DictReader(f)]
+
+
+def post_prices(url, prices):
+    """
+    Sends the prices to a running server's /api/prices and returns its reply
+    """
+    body = json.dumps(prices).encode()
+    req = urllib.request.Request(
+        url.rstrip('/') + '/api/prices',
+        data=body,
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(req) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+
+if __name__ == "__main__":
+    # python prices.py ENGRO=301.5 LUCK=452
+    # python prices.py --csv data/prices.csv
+    # python prices.py --storage ENGRO=301.5   (server not running: write the storage directly)
+    parser = argparse.ArgumentParser(description="Update current market prices")
+    parser.add_argument('pairs', nargs='*', metavar='SYMBOL=PRICE')
+    parser.add_argument('--csv', help="CSV file with symbol,price rows")
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help="Server to send the prices to (default: %(default)s)")
+    parser.add_argument('--storage', action='store_true',
+                        help="Write to the storage instead of a running server "
+                             "(PORTFOLIO_BACKEND / PORTFOLIO_DB as for app.py)")
+    parser.add_argument('--excel-file', default="data/Book 3 full final.xlsx")
+    args = parser.parse_args()
+
+    pairs = [tuple(pair.split('=', 1)) if '=' in pair else (pair, None) for pair in args.pairs]
+    if args.csv:
+        pairs += read_price_csv(args.csv)
+    prices, rejected = validate_prices(pairs)
+    for rejection in rejected:
+        print(f"❌ {rejection['symbol']}: {rejection['reason']}")
+    if rejected or not prices:
+        # All or nothing, like /api/prices
+        parser.exit(1, "No prices were updated.\n")
+
+    if args.storage:
+        from storage import create_storage
+        storage = create_storage(
+            args.excel_file,
+            backend=os.environ.get("PORTFOLIO_BACKEND"),
+            db_path=os.environ.get("PORTFOLIO_DB")
+        )
+        storage.update_prices(prices)
+        # Flushes the update into the workbook (Excel: compacts the journal)
+        storage.close()
+        print(f"✅ Stored {len(prices)} prices. A running server picks them up on /api/rebuild.")
+    else:
+        reply = post_prices(args.url, prices)
+        if reply.get('success'):
+            print(f"✅ Updated {len(prices)} prices ({reply.get('changed', 0)} holdings repriced).")
+        else:
+            print(f"❌ Price update failed: {reply.get('error') or reply.get('rejected')}")
+            parser.exit(1)
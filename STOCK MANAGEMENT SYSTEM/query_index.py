@@ -0,0 +1,160 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Short names accepted by ?sort= (any column name works too)
+SORT_ALIASES = {
+    'symbol': 'Company Symbol',
+    'name': 'Company Name',
+    'invested': 'Total Bought (PKR)',
+    'sold': 'Total Sold(PKR)',
+    'shares': 'Net Shares',
+    'value': 'Market Value (PKR)',
+    'pl': 'Profit/Loss (PKR)',
+    'return': 'Profit/Loss %'
+}
+
+# ?pl= filters on the sign of the P/L column
+SIGN_FILTERS = {
+    'positive': np.greater,
+    'negative': np.less,
+    'zero': np.equal
+}
+
+
+class SortedIndex:
+    """
+    Row orders of one (read-only) snapshot table, so a sorted, filtered
+    page can be cut out without sorting or scanning the whole table on
+    every request.
+
+    Each sort order is computed once (argsort) the first time it is asked
+    for and then kept. A symbol prefix is a binary search in the
+    symbol-sorted order, so only the matching rows are touched.
+    """
+
+    def __init__(self, df, symbol_column, sign_column=None):
+        self.df = df
+        self.symbol_column = symbol_column
+        self.sign_column = sign_column
+        self._orders = {}
+        self._ranks = {}
+        self._filtered = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+
+        symbols = df[symbol_column].astype(str).str.upper().to_numpy(dtype=object)
+        self._symbol_order = np.argsort(symbols, kind='stable')
+        self._sorted_symbols = symbols[self._symbol_order].astype(str)
+
+    def __len__(self):
+        return len(self.df)
+
+    def column_for(self, sort):
+        column = sort if sort in self.df.columns else SORT_ALIASES.get(sort)
+        if column not in self.df.columns:
+            raise ValueError(f"Unknown sort key '{sort}'")
+        return column
+
+    def order(self, column, descending=False):
+        """
+        Row positions sorted by `column` (stable; missing values last in
+        both directions)
+        """
+        key = (column, descending)
+        order = self._orders.get(key)
+        if order is None:
+            with self._lock:
+                order = self._orders.get(key)
+                if order is None:
+                    order = self._build_order(column, descending)
+                    self._orders[key] = order
+        return order
+
+    def _build_order(self, column, descending):
+        values = self.df[column].reset_index(drop=True)
+        key = None
+        if not pd.api.types.is_numeric_dtype(values):
+            key = lambda text: text.astype(str).str.upper()
+        return values.sort_values(
+            ascending=not descending, kind='stable', na_position='last', key=key
+        ).index.to_numpy()
+
+    def _rank(self, column, descending):
+        key = (column, descending)
+        rank = self._ranks.get(key)
+        if rank is None:
+            order = self.order(column, descending)
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self._ranks[key] = rank
+        return rank
+
+    def _sign_mask(self, sign):
+        mask = self._masks.get(sign)
+        if mask is None:
+            compare = SIGN_FILTERS.get(sign)
+            if compare is None or self.sign_column is None:
+                raise ValueError(f"Unknown P/L filter '{sign}'")
+            values = pd.to_numeric(self.df[self.sign_column], errors='coerce').to_numpy(dtype=float)
+            mask = compare(values, 0)
+            self._masks[sign] = mask
+        return mask
+
+    def _sorted(self, column, descending):
+        # Table order when no sort key was asked for
+        if column is None:
+            return np.arange(len(self.df))
+        return self.order(column, descending)
+
+    def _filtered_order(self, column, descending, sign):
+        key = (column, descending, sign)
+        order = self._filtered.get(key)
+        if order is None:
+            order = self._sorted(column, descending)
+            order = order[self._sign_mask(sign)[order]]
+            self._filtered[key] = order
+        return order
+
+    def prefix_positions(self, prefix):
+        """
+        Positions of the rows whose symbol starts with `prefix` (case-insensitive),
+        in symbol order
+        """
+        prefix = prefix.upper()
+        lo = np.searchsorted(self._sorted_symbols, prefix, side='left')
+        hi = np.searchsorted(self._sorted_symbols, prefix + '\uffff', side='left')
+        return self._symbol_order[lo:hi]
+
+    def query(self, sort=None, descending=False, prefix=None, sign=None, offset=0, limit=None):
+        """
+        Returns (positions of the requested page, total matching rows).
+        Without `sort` the rows stay in table order.
+        """
+        column = self.column_for(sort) if sort else None
+
+        if prefix:
+            # Only the rows with a matching symbol are looked at
+            matches = self.prefix_positions(prefix)
+            if sign:
+                matches = matches[self._sign_mask(sign)[matches]]
+            if column is None:
+                matches = np.sort(matches)
+            elif column != self.symbol_column or descending:
+                matches = matches[np.argsort(self._rank(column, descending)[matches], kind='stable')]
+        elif sign:
+            matches = self._filtered_order(column, descending, sign)
+        else:
+            matches = self._sorted(column, descending)
+
+        total = len(matches)
+        end = total if limit is None else offset + limit
+        return matches[offset:end], total
+
+    def page(self, **query):
+        """
+        (DataFrame of the requested page, total matching rows)
+        """
+        positions, total = self.query(**query)
+        return self.df.iloc[positions], total
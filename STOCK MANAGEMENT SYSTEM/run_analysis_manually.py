@@ -4,7 +4,23 @@
 # To run:
 # python run_analysis_manually.py
 #
+# Several workbooks at once (e.g. one per account or per year): pass files,
+# folders or glob patterns. Each workbook is summarized in a worker process
+# (one per CPU core by default) and gets its own 'Calculated_Summary' sheet;
+# then everything is merged into one symbol-level summary:
+# python run_analysis_manually.py data/accounts/
+# python run_analysis_manually.py "data/2023/*.xlsx" "data/2024/*.xlsx" --output data/Consolidated.xlsx
+#
+import argparse
+import contextlib
+import glob
+import io
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
 from data_loader import (
     load_transactions_from_excel, 
     load_portfolio_from_excel, 
@@ -14,6 +30,9 @@ from calculator import PortfolioCalculator
 
 excel_file = "data/Book 3 full final.xlsx"
 
+# Where the consolidated summary goes when --output isn't given
+consolidated_file = "data/Consolidated_Summary.xlsx"
+
 def run_manual_analysis():
     print("="*60)
     print("🚀 RUNNING MANUAL PORTFOLIO ANALYSIS 🚀")
@@ -58,7 +77,11 @@ def run_manual_analysis():
     # 4. Save the new summary to the Excel file
     print("\n--- STEP 3: SAVING TO EXCEL ---")
     try:
-        save_summary_to_excel(portfolio_summary_df, excel_file, "Calculated_Summary")
+        save_summary_to_excel(
+            PortfolioCalculator.format_summary(portfolio_summary_df),
+            excel_file,
+            "Calculated_Summary"
+        )
         print(f"✅ Successfully saved new summary to 'Calculated_Summary' sheet in {excel_file}")
     except Exception as e:
         print(f"❌ FATAL ERROR during saving: {e}")
@@ -70,5 +93,168 @@ def run_manual_analysis():
     print("✅ ANALYSIS COMPLETE.")
     print("="*60)
 
+def find_workbooks(patterns, exclude=()):
+    """
+    Workbook paths from files, folders (every .xlsx in them) and glob
+    patterns, in order, without duplicates or Excel's ~$ lock files
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, '*.xlsx'))
+        else:
+            matches = glob.glob(pattern)
+        for path in sorted(matches):
+            key = os.path.abspath(path)
+            if key in seen or key in excluded or os.path.basename(path).startswith('~$'):
+                continue
+            seen.add(key)
+            paths.append(path)
+    return paths
+
+def summarize_workbook(path, save=True):
+    """
+    Loads one workbook, recalculates its summary and (with save=True)
+    writes it to the workbook's 'Calculated_Summary' sheet, all in one go.
+    Runs in a worker process, so the loaders' messages are kept quiet and
+    any error is returned rather than raised.
+
+    Returns {'path', 'rows', 'symbols', 'aggregates', 'prices', 'timings', 'error'}
+    """
+    result = {'path': path, 'rows': 0, 'symbols': 0, 'aggregates': None, 'prices': None,
+              'timings': {}, 'error': None}
+    timings = result['timings']
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            transactions_df = load_transactions_from_excel(path)
+            price_template_df = load_portfolio_from_excel(path)
+            timings['load'] = time.perf_counter() - started
+            if transactions_df is None or price_template_df is None:
+                raise ValueError("Could not load Sheet1/Sheet2")
+
+            started = time.perf_counter()
+            aggregates = PortfolioCalculator.aggregate_transactions(transactions_df)
+            portfolio_summary_df = PortfolioCalculator.create_portfolio_summary(
+                transactions_df, price_template_df, aggregates
+            )
+            timings['calculate'] = time.perf_counter() - started
+
+            if save and not portfolio_summary_df.empty:
+                started = time.perf_counter()
+                save_summary_to_excel(
+                    PortfolioCalculator.format_summary(portfolio_summary_df),
+                    path,
+                    "Calculated_Summary"
+                )
+                timings['save'] = time.perf_counter() - started
+
+        result['rows'] = len(transactions_df)
+        result['symbols'] = len(aggregates)
+        result['aggregates'] = aggregates
+        result['prices'] = price_template_df[['Company Symbol', 'Company Name', 'Current Market Price (PKR)']]
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def consolidate(results):
+    """
+    One symbol-level summary over all the workbooks that loaded: the
+    per-company totals are added up, and each company's price (and name)
+    comes from the first workbook that lists it
+    """
+    loaded = [result for result in results if result['error'] is None]
+    if not loaded:
+        return pd.DataFrame()
+    aggregates = PortfolioCalculator.merge_aggregates([result['aggregates'] for result in loaded])
+    prices = pd.concat([result['prices'] for result in loaded], ignore_index=True)
+    prices = prices.dropna(subset=['Company Symbol']).drop_duplicates('Company Symbol', keep='first')
+    return PortfolioCalculator.create_portfolio_summary(None, prices, aggregates)
+
+def timing_report(results):
+    """
+    One row per workbook: size, seconds per step, and the error if it failed
+    """
+    return pd.DataFrame([
+        {
+            'Workbook': result['path'],
+            'Transactions': result['rows'],
+            'Companies': result['symbols'],
+            'Load (s)': round(result['timings'].get('load', 0), 3),
+            'Calculate (s)': round(result['timings'].get('calculate', 0), 3),
+            'Save (s)': round(result['timings'].get('save', 0), 3),
+            'Total (s)': round(sum(result['timings'].values()), 3),
+            'Error': result['error'] or ''
+        }
+        for result in results
+    ])
+
+def run_consolidation(patterns, workers=None, output=consolidated_file, save=True):
+    print("="*60)
+    print("🚀 RUNNING MULTI-WORKBOOK CONSOLIDATION 🚀")
+    print("="*60)
+
+    paths = find_workbooks(patterns, exclude=[output])
+    if not paths:
+        print(f"❌ FATAL ERROR: No workbooks found for {' '.join(patterns)}")
+        return None
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    print(f"✅ {len(paths)} workbooks found, {workers} worker processes.")
+
+    # 1. Load + summarize + save every workbook, in parallel
+    print("\n--- STEP 1: SUMMARIZING WORKBOOKS ---")
+    started = time.perf_counter()
+    if workers == 1:
+        results = [summarize_workbook(path, save) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(summarize_workbook, paths, [save] * len(paths)))
+    elapsed = time.perf_counter() - started
+
+    report = timing_report(results)
+    print(report.to_string(index=False))
+    failed = int((report['Error'] != '').sum())
+    print(f"{'❌' if failed else '✅'} {len(paths) - failed} of {len(paths)} workbooks summarized "
+          f"in {elapsed:.2f}s (sum of per-file times {report['Total (s)'].sum():.2f}s).")
+
+    # 2. Merge the per-workbook aggregates
+    print("\n--- STEP 2: CONSOLIDATING ---")
+    consolidated_df = consolidate(results)
+    if consolidated_df.empty:
+        print("❌ FATAL ERROR: Nothing to consolidate.")
+        return None
+    print(PortfolioCalculator.format_summary(consolidated_df).to_string(index=False))
+
+    # 3. Save the consolidated summary with the timing report next to it
+    if output:
+        print("\n--- STEP 3: SAVING ---")
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            PortfolioCalculator.format_summary(consolidated_df).to_excel(
+                writer, sheet_name="Consolidated_Summary", index=False
+            )
+            report.to_excel(writer, sheet_name="Workbooks", index=False)
+        print(f"✅ Saved the consolidated summary to {output}")
+
+    print("\n" + "="*60)
+    print("✅ CONSOLIDATION COMPLETE.")
+    print("="*60)
+    return consolidated_df
+
 if __name__ == "__main__":
-    run_manual_analysis()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Recalculate portfolio summaries")
+    parser.add_argument('workbooks', nargs='*',
+                        help="Workbooks, folders or glob patterns to consolidate "
+                             "(default: only the main workbook, as before)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU core)")
+    parser.add_argument('--output', default=consolidated_file,
+                        help="Consolidated summary workbook (default: %(default)s)")
+    parser.add_argument('--no-save', action='store_true',
+                        help="Don't write 'Calculated_Summary' into each workbook")
+    args = parser.parse_args()
+
+    if args.workbooks:
+        run_consolidation(args.workbooks, args.workers, args.output, save=not args.no_save)
+    else:
+        run_manual_analysis()
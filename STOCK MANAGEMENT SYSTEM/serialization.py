@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+# Response layouts understood by serialize_frame
+LAYOUTS = ('records', 'columnar')
+
+
+def column_to_list(series):
+    """
+    Converts one column to a list of JSON-native values (int, float, str,
+    bool, None) in bulk. Missing values (NaN, NaT, None) become None.
+    """
+    dtype = series.dtype
+
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iub':
+        # No missing values possible: numpy converts the whole column at once
+        return series.to_numpy().tolist()
+
+    if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+        values = series.to_numpy()
+        result = values.tolist()
+        for i in np.flatnonzero(np.isnan(values)).tolist():
+            result[i] = None
+        return result
+
+    if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+        mask = series.isna().to_numpy()
+        result = series.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object).tolist()
+        for i in np.flatnonzero(mask).tolist():
+            result[i] = None
+        return result
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Each category is converted once, then picked by code (-1: missing)
+        categories = column_to_list(pd.Series(dtype.categories)) + [None]
+        return [categories[code] for code in series.cat.codes.tolist()]
+
+    # A copy: for an object column to_numpy() is a read-only view of the frame
+    values = series.to_numpy(dtype=object, copy=True)
+    values[pd.isna(series).to_numpy()] = None
+    result = values.tolist()
+    if pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        return result
+
+    # Mixed columns are the only ones that can hold numpy scalars or
+    # timestamps in a cell, so only they are checked value by value
+    for i, value in enumerate(result):
+        if isinstance(value, np.generic):
+            result[i] = to_native(value)
+        elif isinstance(value, pd.Timestamp):
+            result[i] = value.strftime('%Y-%m-%d %H:%M:%S')
+    return result
+
+
+def to_native(value):
+    """
+    A single value as a JSON-native type (NaN -> None)
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, list, dict)):
+        return value
+    return None if pd.isna(value) else value
+
+
+def to_records(df):
+    """
+    [{column: value, ...}, ...] with JSON-native values, like
+    to_dict(orient='records') but converted one column at a time
+    """
+    columns = [str(col) for col in df.columns]
+    data = [column_to_list(df[col]) for col in df.columns]
+    return [dict(zip(columns, row)) for row in zip(*data)]
+
+
+def to_columnar(df):
+    """
+    {"columns": [...], "data": {column: [values...]}} - every column name
+    appears once instead of once per row, so wide tables get much smaller
+    """
+    columns = [str(col) for col in df.columns]
+    return {
+        'columns': columns,
+        'data': {name: column_to_list(df[col]) for name, col in zip(columns, df.columns)}
+    }
+
+
+def serialize_frame(df, layout='records'):
+    """
+    Serializes a DataFrame for a JSON response in the given layout
+    ('records' or 'columnar')
+    """
+    if layout == 'columnar':
+        return to_columnar(df)
+    if layout == 'records':
+        return to_records(df)
+    raise ValueError(f"Unknown layout '{layout}' (use 'records' or 'columnar')")
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no file locks, so every worker is its own owner
+    fcntl = None
+
+from calculator import PORTFOLIO_COLUMNS
+from data_loader import TRANSACTION_COLUMNS
+from ledger import IncrementalLedger
+from portfolio_state import PortfolioSnapshot, PortfolioState
+from snapshot_cache import cache_dir_for, read_frame, write_frame
+
+ANALYSIS_COLUMNS = [
+    'total_bought',
+    'total_sold',
+    'net_quantity',
+    'total_buy_quantity',
+    'buy_count',
+    'sell_count'
+]
+
+
+def shared_dir_for(file_path):
+    """
+    Folder the workers share for one workbook: in /dev/shm (RAM) where it
+    exists, otherwise next to the snapshot cache
+    """
+    key = hashlib.blake2b(os.path.abspath(file_path).encode(), digest_size=8).hexdigest()
+    if os.path.isdir('/dev/shm'):
+        return os.path.join('/dev/shm', f"portfolio-{key}")
+    return os.path.join(cache_dir_for(file_path), 'shared')
+
+
+class SharedSnapshotStore:
+    """
+    Portfolio snapshots shared between worker processes through files in
+    shared memory.
+
+    Each published version is a set of column files (written with the
+    snapshot cache's column encoding, so numeric columns are memory-mapped
+    by the readers, not copied) plus manifest.json, which is swapped in
+    atomically. An 8-byte version counter, mapped by every process, lets
+    readers notice a new version without touching the manifest.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.manifest_path = os.path.join(folder, 'manifest.json')
+
+        version_path = os.path.join(folder, 'version')
+        with open(version_path, 'ab') as f:
+            if f.tell() < 8:
+                f.write(b'\0' * (8 - f.tell()))
+        self._version = np.memmap(version_path, dtype='<i8', mode='r+', shape=(1,))
+
+        # Writer side: the transactions at the last rebuild are only written
+        # once, and later versions point at the same files
+        self._base = None
+        self._base_frame = None
+        self._manifests = []
+
+        # Reader side
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return int(self._version[0])
+
+    def publish(self, snapshot):
+        """
+        Writes a snapshot (owner process only) and bumps the version counter
+        """
+        if not self._manifests:
+            # First publish by this process: keep the previous owner's last
+            # version around, readers may still be using it
+            previous = self.read_manifest()
+            self._manifests = [previous] if previous else []
+
+        folder_name = f"v{snapshot.version}-{uuid.uuid4().hex[:8]}"
+        folder = os.path.join(self.folder, folder_name)
+        os.makedirs(folder)
+
+        base = snapshot._transactions_base
+        if base is not self._base:
+            base_folder = f"base-{uuid.uuid4().hex[:8]}"
+            os.makedirs(os.path.join(self.folder, base_folder))
+            frame = write_frame(
+                base if base is not None else pd.DataFrame(columns=TRANSACTION_COLUMNS),
+                os.path.join(self.folder, base_folder)
+            )
+            self._base = base
+            self._base_frame = dict(frame, folder=base_folder)
+
+        new_rows = pd.DataFrame(
+            snapshot._new_rows[:snapshot._new_row_count], columns=TRANSACTION_COLUMNS
+        )
+        analysis = pd.DataFrame.from_dict(
+            snapshot.analysis, orient='index', columns=ANALYSIS_COLUMNS
+        )
+
+        frames = {'transactions_base': self._base_frame}
+        for name, df in (('holdings', snapshot.portfolio_df),
+                         ('transactions_new', new_rows),
+                         ('analysis', analysis)):
+            os.makedirs(os.path.join(folder, name))
+            frames[name] = dict(write_frame(df, os.path.join(folder, name)),
+                                folder=os.path.join(folder_name, name))
+
+        manifest = {
+            'version': snapshot.version,
+            'position': snapshot.position,
+            'epoch': snapshot.epoch,
+            'totals': snapshot.totals,
+            'frames': frames
+        }
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, default=str)
+        os.replace(tmp_path, self.manifest_path)
+        self._version[0] = snapshot.version
+        self._version.flush()
+
+        self._cleanup(manifest)
+
+    def _cleanup(self, manifest):
+        """
+        Deletes the files of versions older than the previous one (a reader
+        may still be opening those); mapped files stay valid after deletion
+        """
+        self._manifests = (self._manifests + [manifest])[-2:]
+        keep = {'manifest.json', 'version', 'owner.lock', 'rebuild.request', 'prices.request'}
+        for kept in self._manifests:
+            for frame in kept['frames'].values():
+                keep.add(frame['folder'].split(os.sep)[0])
+        for name in os.listdir(self.folder):
+            if name not in keep and not name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def current(self):
+        """
+        The latest published snapshot (reader processes), or None if nothing
+        was published yet. Only re-read when the version counter moved.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.version:
+            return snapshot
+
+        with self._snapshot_lock:
+            for _ in range(3):
+                manifest = self.read_manifest()
+                if manifest is None:
+                    return self._snapshot
+                if self._snapshot is not None and self._snapshot.version == manifest['version']:
+                    return self._snapshot
+                try:
+                    self._snapshot = self._load(manifest)
+                    return self._snapshot
+                except (OSError, ValueError):
+                    # The owner removed those files meanwhile; take the newer manifest
+                    continue
+        return self._snapshot
+
+    def _load(self, manifest):
+        frames = {
+            name: read_frame(frame, os.path.join(self.folder, frame['folder']))
+            for name, frame in manifest['frames'].items()
+        }
+        analysis = {
+            symbol: {
+                'total_bought': float(stats['total_bought']),
+                'total_sold': float(stats['total_sold']),
+                'net_quantity': float(stats['net_quantity']),
+                'total_buy_quantity': float(stats['total_buy_quantity']),
+                'buy_count': int(stats['buy_count']),
+                'sell_count': int(stats['sell_count'])
+            }
+            for symbol, stats in frames['analysis'].to_dict(orient='index').items()
+        }
+        new_rows = frames['transactions_new'].to_dict(orient='records')
+        holdings = frames['holdings']
+        if holdings.empty:
+            holdings = pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+        return PortfolioSnapshot(
+            manifest['version'],
+            frames['transactions_base'],
+            new_rows,
+            len(new_rows),
+            holdings,
+            analysis,
+            manifest['position'],
+            manifest['epoch'],
+            totals=manifest.get('totals')
+        )
+
+    def wait_for(self, position, timeout=5.0):
+        """
+        Waits until a published snapshot contains `position`. Returns True
+        if it did within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            manifest = self.read_manifest()
+            if manifest and manifest.get('position') is not None and manifest['position'] >= position:
+                return True
+            time.sleep(0.02)
+        return False
+
+
+class SharedPortfolioState:
+    """
+    PortfolioState for several worker processes (e.g. gunicorn -w 4).
+
+    One worker, the owner (whoever holds the owner.lock file lock), keeps
+    the ledger and publishes every new snapshot into a SharedSnapshotStore.
+    The other workers never load the workbook: they read the owner's
+    snapshots zero-copy. Their writes go straight to the storage (journal or
+    SQLite), and the owner picks them up within `poll_interval` seconds.
+    If the owner exits, another worker takes over.
+    """
+
+    def __init__(self, storage, excel_file, poll_interval=0.2):
+        self.storage = storage
+        self.store = SharedSnapshotStore(shared_dir_for(excel_file))
+        self.poll_interval = poll_interval
+        self.local = None
+        self._owner_file = None
+        self._rebuild_path = os.path.join(self.store.folder, 'rebuild.request')
+        self._rebuild_seen = self._read_request(self._rebuild_path)
+        self._prices_path = os.path.join(self.store.folder, 'prices.request')
+        self._prices_seen = self._read_request(self._prices_path)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='snapshot-sync', daemon=True)
+
+    @property
+    def is_owner(self):
+        return self.local is not None
+
+    @property
+    def snapshot(self):
+        if self.local is not None:
+            return self.local.snapshot
+        return self.store.current() or PortfolioSnapshot.empty()
+
+    def start(self, timeout=60.0):
+        """
+        Becomes the owner if nobody is, otherwise waits for the owner's
+        first snapshot. Then starts the background sync thread.
+        """
+        if not self._try_become_owner():
+            deadline = time.monotonic() + timeout
+            while self.store.current() is None and time.monotonic() < deadline:
+                time.sleep(0.1)
+                if self._try_become_owner():
+                    break
+        self._thread.start()
+
+    def _try_become_owner(self):
+        if self.local is not None:
+            return True
+        if fcntl is not None:
+            lock_file = open(os.path.join(self.store.folder, 'owner.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            # Held (and kept open) for the life of this process
+            self._owner_file = lock_file
+
+        print(f"✓ Worker {os.getpid()} owns the shared portfolio snapshots.")
+        try:
+            # Continue the version numbers of the previous owner, if any
+            local = PortfolioState(self.storage, on_publish=self.store.publish,
+                                   start_version=self.store.version)
+            local.rebuild()
+        except Exception:
+            # Give the lock back, or no worker (this one included: a new
+            # handle can't lock it again) could ever become the owner
+            self._release_owner_lock()
+            raise
+        self.local = local
+        if hasattr(self.storage, 'limit_compaction'):
+            # Journal rows must reach the ledger before they are trimmed
+            self.storage.limit_compaction(lambda: local.position or 0)
+        self.storage.start()
+        return True
+
+    def _release_owner_lock(self):
+        if self._owner_file is not None:
+            # Closing the file releases the owner lock
+            self._owner_file.close()
+            self._owner_file = None
+
+    @staticmethod
+    def _read_request(path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    @staticmethod
+    def _write_request(path):
+        with open(path, 'w') as f:
+            f.write(uuid.uuid4().hex)
+
+    def _run(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                if self.local is None:
+                    self._try_become_owner()
+                    continue
+                request = self._read_request(self._rebuild_path)
+                if request != self._rebuild_seen:
+                    self._rebuild_seen = request
+                    self.local.rebuild()
+                    continue
+                request = self._read_request(self._prices_path)
+                if request != self._prices_seen:
+                    self._prices_seen = request
+                    self.local.reload_prices()
+                self.local.sync()
+            except Exception as e:
+                print(f"❌ Warning: Shared snapshot sync failed. {e}")
+
+    def rebuild(self):
+        """
+        Full rebuild; in a non-owner worker this asks the owner for one and
+        waits until it is published
+        """
+        if self.local is not None:
+            self.local.rebuild()
+            return
+        version = self.store.version
+        self._write_request(self._rebuild_path)
+        self._wait_for_version_after(version)
+
+    def _wait_for_version_after(self, version, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while self.store.version == version and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def update_prices(self, prices):
+        """
+        Stores new prices. A non-owner worker then asks the owner to reprice
+        and, if any held company is affected, waits until it is published.
+        Returns the number of summary rows that change.
+        """
+        if self.local is not None:
+            return self.local.update_prices(prices)
+        version = self.store.version
+        self.storage.update_prices(prices)
+        held = self.snapshot.symbol_index
+        changed = sum(1 for symbol in prices if symbol in held)
+        self._write_request(self._prices_path)
+        if changed:
+            self._wait_for_version_after(version)
+        return changed
+
+    def add_transactions(self, records, on_stored=None):
+        """
+        Stores new transactions and waits until they are in the shared
+        snapshot, so the caller reads its own writes. Returns the number of
+        valid rows. `on_stored(position)` is called once they are durable.
+        """
+        records = list(records)
+        position = self.storage.append_transactions(records)
+        if on_stored is not None:
+            on_stored(position)
+        if self.local is not None:
+            self.local.sync()
+        elif position is not None:
+            self.store.wait_for(position)
+        return sum(1 for record in records if IncrementalLedger.clean_transaction(record) is not None)
+
+    def stop(self):
+        self._stopping.set()
+
+    def close(self):
+        """
+        Stops syncing and, in the owner, hands the ownership back (another
+        worker takes over within `poll_interval`)
+        """
+        self.stop()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.local is not None:
+            self.local.close()
+            self.local = None
+        self._release_owner_lock()
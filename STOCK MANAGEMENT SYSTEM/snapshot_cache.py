@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Bump this when the on-disk layout changes, so old snapshots are ignored
+CACHE_FORMAT_VERSION = 2
+
+
+def cache_dir_for(file_path):
+    """
+    Folder that holds the snapshots for a workbook, next to the workbook:
+    data/Book.xlsx -> data/.Book.xlsx.cache/
+    """
+    folder, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(folder, f".{name}.cache")
+
+
+def file_hash(file_path):
+    """
+    Content hash of a file (read in 1 MB chunks)
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path):
+    """
+    Size, modification time and content hash of the workbook
+    """
+    stat = os.stat(file_path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': file_hash(file_path)
+    }
+
+
+def _encode_column(series, folder, position):
+    """
+    Writes one column as .npy file(s) and returns its description for meta.json.
+    Numbers and dates are saved as-is, text is saved as a fixed-width unicode
+    array plus a null mask (both can be memory-mapped), and categoricals as
+    their codes (memory-mapped) plus the list of categories. Anything else
+    falls back to a pickled object array.
+    """
+    base = os.path.join(folder, f"{position}")
+    column = {'name': series.name, 'dtype': str(series.dtype)}
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        np.save(base + '.npy', series.cat.codes.to_numpy())
+        np.save(base + '.categories.npy', series.cat.categories.to_numpy(dtype=object), allow_pickle=True)
+        column['kind'] = 'category'
+        return column
+
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+        np.save(base + '.npy', series.to_numpy())
+        column['kind'] = 'array'
+        return column
+
+    values = series.to_numpy(dtype=object)
+    mask = pd.isna(series).to_numpy()
+    if pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        text = np.where(mask, '', values)
+        np.save(base + '.npy', text.astype(str) if len(text) else np.array([], dtype='<U1'))
+        np.save(base + '.mask.npy', mask)
+        column['kind'] = 'string'
+        return column
+
+    np.save(base + '.npy', values, allow_pickle=True)
+    column['kind'] = 'object'
+    return column
+
+
+def _load_array(path):
+    """
+    Memory-maps a .npy file (empty arrays can't be mapped, so they are just read)
+    """
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+
+def _decode_column(column, folder, position):
+    """
+    Reads back a column written by _encode_column
+    """
+    base = os.path.join(folder, f"{position}")
+
+    if column['kind'] == 'array':
+        return _load_array(base + '.npy')
+
+    if column['kind'] == 'category':
+        categories = np.load(base + '.categories.npy', allow_pickle=True)
+        return pd.Categorical.from_codes(_load_array(base + '.npy'), categories=pd.Index(categories.tolist()))
+
+    if column['kind'] == 'string':
+        text = _load_array(base + '.npy')
+        mask = _load_array(base + '.mask.npy')
+        values = text.astype(object)
+        values[mask] = np.nan
+        return pd.array(values, dtype=column['dtype'])
+
+    return np.load(base + '.npy', allow_pickle=True)
+
+
+def write_frame(df, folder):
+    """
+    Writes a DataFrame's columns into `folder` (which must exist) with
+    _encode_column, and returns the description needed by read_frame.
+    """
+    columns = [
+        _encode_column(df[col], folder, position)
+        for position, col in enumerate(df.columns)
+    ]
+    if isinstance(df.index, pd.RangeIndex):
+        index = {'start': df.index.start, 'stop': df.index.stop, 'step': df.index.step}
+    else:
+        np.save(os.path.join(folder, 'index.npy'), df.index.to_numpy(), allow_pickle=True)
+        index = None
+
+    return {
+        'rows': len(df),
+        'columns': columns,
+        'range_index': index,
+        'attrs': df.attrs
+    }
+
+
+def read_frame(frame, folder):
+    """
+    Rebuilds the DataFrame described by `frame` (see write_frame) from the
+    files in `folder`. Numeric and date columns stay memory-mapped.
+    """
+    data = {
+        column['name']: _decode_column(column, folder, position)
+        for position, column in enumerate(frame['columns'])
+    }
+    if frame.get('range_index'):
+        index = pd.RangeIndex(**frame['range_index'])
+    else:
+        index = pd.Index(np.load(os.path.join(folder, 'index.npy'), allow_pickle=True))
+
+    df = pd.DataFrame(data, index=index, copy=False)
+    df = df[[column['name'] for column in frame['columns']]]
+    df.attrs.update(frame.get('attrs') or {})
+    return df
+
+
+def write_snapshot(df, file_path, name, fingerprint):
+    """
+    Saves a cleaned DataFrame as a columnar snapshot of the workbook.
+
+    The data goes into a new folder first, and meta.json (which points at
+    that folder) is swapped in with os.replace, so readers never see a
+    half-written snapshot.
+    """
+    cache_dir = cache_dir_for(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    data_folder_name = f"{name}-{uuid.uuid4().hex[:12]}"
+    data_folder = os.path.join(cache_dir, data_folder_name)
+    os.makedirs(data_folder)
+
+    meta = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'source': fingerprint,
+        'data_folder': data_folder_name
+    }
+    meta.update(write_frame(df, data_folder))
+
+    meta_path = _meta_path(file_path, name)
+    old_folder = _read_meta(meta_path, {}).get('data_folder')
+    _write_meta(meta_path, meta)
+
+    # Remove the previous snapshot's data (a reader may still have it mapped)
+    if old_folder and old_folder != data_folder_name:
+        shutil.rmtree(os.path.join(cache_dir, old_folder), ignore_errors=True)
+
+
+def _read_meta(meta_path, default=None):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, default=str)
+    os.replace(tmp_path, meta_path)
+
+
+def _meta_path(file_path, name):
+    return os.path.join(cache_dir_for(file_path), f"{name}.json")
+
+
+def snapshot_is_current(file_path, name):
+    """
+    True if the snapshot was taken from the workbook as it is on disk right now
+    (cheap size + mtime check only)
+    """
+    meta = _read_meta(_meta_path(file_path, name))
+    if not meta or not os.path.exists(file_path):
+        return False
+    stat = os.stat(file_path)
+    return meta['source']['size'] == stat.st_size and meta['source']['mtime_ns'] == stat.st_mtime_ns
+
+
+def rekey_snapshot(file_path, name):
+    """
+    Points an existing snapshot at the workbook's new fingerprint.
+
+    Used after we rewrite a sheet the snapshot doesn't cover (for example
+    Calculated_Summary), so the next startup still gets a cache hit.
+    """
+    meta_path = _meta_path(file_path, name)
+    meta = _read_meta(meta_path)
+    if meta:
+        meta['source'] = file_fingerprint(file_path)
+        _write_meta(meta_path, meta)
+
+
+def read_snapshot(file_path, name):
+    """
+    Returns the cached DataFrame if the workbook has not changed since the
+    snapshot was written, otherwise None.
+
+    Size and modification time are checked first. If only the modification
+    time differs (e.g. the file was copied or touched) the content hash
+    decides, and the snapshot is kept when the content is the same.
+    """
+    cache_dir = cache_dir_for(file_path)
+    meta_path = _meta_path(file_path, name)
+    meta = _read_meta(meta_path)
+    if not meta or meta.get('format_version') != CACHE_FORMAT_VERSION:
+        return None
+
+    stat = os.stat(file_path)
+    source = meta['source']
+    if source['size'] != stat.st_size:
+        return None
+
+    if source['mtime_ns'] != stat.st_mtime_ns:
+        if source['hash'] != file_hash(file_path):
+            return None
+        # Same content, new mtime: remember it so the next check is cheap
+        meta['source'] = dict(source, mtime_ns=stat.st_mtime_ns)
+        try:
+            _write_meta(meta_path, meta)
+        except OSError:
+            pass
+
+    data_folder = os.path.join(cache_dir, meta['data_folder'])
+    try:
+        return read_frame(meta, data_folder)
+    except (OSError, ValueError):
+        return None
+
+
+def cached_load(file_path, name, loader):
+    """
+    Loads a DataFrame through the snapshot cache.
+
+    `loader` is the slow function that parses the workbook; it is only
+    called when there is no valid snapshot, and its result is cached.
+    """
+    if not os.path.exists(file_path):
+        # Nothing to cache; let the loader report the missing file
+        return loader(file_path)
+
+    try:
+        df = read_snapshot(file_path, name)
+    except Exception as e:
+        print(f"❌ Warning: Could not read '{name}' snapshot. {e}")
+        df = None
+
+    if df is not None:
+        print(f"✅ Loaded '{name}' from snapshot cache.")
+        return df
+
+    # Fingerprint *before* parsing, so a change during the parse is caught next time
+    fingerprint = file_fingerprint(file_path)
+    df = loader(file_path)
+
+    if df is not None:
+        try:
+            write_snapshot(df, file_path, name, fingerprint)
+        except Exception as e:
+            print(f"❌ Warning: Could not write '{name}' snapshot. {e}")
+
+    return df
@@ -0,0 +1,441 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from data_loader import (
+    TRANSACTION_COLUMNS,
+    clean_transactions,
+    load_transactions_from_excel,
+    load_portfolio_from_excel,
+    save_summary_to_excel
+)
+from journal import TransactionJournal
+from compactor import JournalCompactor
+
+# Columns of the price list (Sheet2 / prices table)
+PRICE_COLUMNS = ['Company Symbol', 'Company Name', 'Current Market Price (PKR)']
+
+
+class StorageBackend:
+    """
+    Where the transactions and prices are kept.
+
+    app.py only talks to this interface, so every endpoint works the same
+    on the Excel workbook and on SQLite.
+    """
+
+    name = 'storage'
+
+    def load_transactions(self):
+        """
+        All transactions as a cleaned DataFrame (Sheet1 layout).
+        df.attrs['storage_position'] is the position of the last row it
+        contains (see changes_since).
+        """
+        raise NotImplementedError
+
+    def load_prices(self):
+        """
+        The price list as a DataFrame with PRICE_COLUMNS
+        """
+        raise NotImplementedError
+
+    def append_transactions(self, records):
+        """
+        Durably stores new transactions (dicts keyed by TRANSACTION_COLUMNS).
+        Returns the storage position of the last one.
+        """
+        raise NotImplementedError
+
+    def update_prices(self, prices):
+        """
+        Durably stores new current prices ({symbol: price}); symbols without
+        a price yet are added to the price list
+        """
+        raise NotImplementedError
+
+    def changes_since(self, position):
+        """
+        Transactions stored after `position`, by any process, as
+        [(position, record), ...] in the order they were stored
+        """
+        raise NotImplementedError
+
+    def save_summary(self, summary_df):
+        """
+        Stores the formatted portfolio summary (Calculated_Summary layout)
+        """
+        raise NotImplementedError
+
+    def aggregate_transactions(self):
+        """
+        Per-company aggregates in the layout of
+        PortfolioCalculator.aggregate_transactions, or None to let the
+        calculator compute them from the transactions DataFrame.
+        """
+        return None
+
+    def start(self):
+        """
+        Starts any background work (called once the app is ready)
+        """
+
+    def close(self):
+        """
+        Stops background work and releases resources
+        """
+
+
+class ExcelBackend(StorageBackend):
+    """
+    The original workbook storage: Sheet1 holds the transactions, Sheet2 the
+    prices. New transactions and price updates go through the write-ahead
+    journal and are compacted into the workbook in the background.
+    """
+
+    name = 'Excel'
+
+    def __init__(self, excel_file, compact_interval=30.0, compact_rows=200):
+        self.excel_file = excel_file
+        self.journal = TransactionJournal(excel_file)
+        self.compactor = JournalCompactor(
+            self.journal,
+            interval=compact_interval,
+            max_pending=compact_rows
+        )
+        self._unchanged = None
+
+    def load_transactions(self):
+        df = load_transactions_from_excel(self.excel_file)
+        if df is not None:
+            # Positions are journal seqs; everything up to the checkpoint is in the frame
+            df.attrs['storage_position'] = df.attrs.get('journal_checkpoint', 0)
+        return df
+
+    def load_prices(self):
+        return load_portfolio_from_excel(self.excel_file)
+
+    def append_transactions(self, records):
+        records = list(records)
+        seqs = self.journal.append(records)
+        self.compactor.notify(len(records))
+        return seqs[-1] if seqs else None
+
+    def update_prices(self, prices):
+        # Journaled like new transactions: the compactor writes them into Sheet2
+        self.journal.append_prices(prices)
+        self.compactor.notify()
+
+    def changes_since(self, position):
+        # Polled often: skip reading the journal when it hasn't changed
+        # since the last call came back empty for the same position
+        try:
+            stat = os.stat(self.journal.path)
+            key = (position, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            key = (position, None, None)
+        if key == self._unchanged:
+            return []
+        entries = self.journal.read_entries(after_seq=position)
+        self._unchanged = None if entries else key
+        return entries
+
+    def limit_compaction(self, through):
+        """
+        Only compact journal rows up to through() (a callable returning a
+        seq), so rows are not trimmed before a reader has picked them up
+        """
+        self.compactor.limit = through
+
+    def save_summary(self, summary_df):
+        save_summary_to_excel(summary_df, self.excel_file, "Calculated_Summary")
+
+    def start(self):
+        self.compactor.start()
+
+    def close(self):
+        self.compactor.stop()
+        self.compactor.compact_now()
+
+
+def _sql_value(value):
+    """
+    Converts pandas/numpy values into something sqlite3 can store
+    """
+    if value is None:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        if pd.isna(value):
+            return None
+        if value.hour == value.minute == value.second == 0:
+            return value.strftime('%Y-%m-%d')
+        return value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite storage: indexed 'transactions' and 'prices' tables.
+
+    Inserts are single-row INSERTs, and the per-company aggregation is
+    pushed down into SQL (aggregate_transactions).
+    """
+
+    name = 'SQLite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            symbol TEXT,
+            company_name TEXT,
+            type TEXT,
+            quantity NUMERIC,
+            price NUMERIC,
+            total_amount NUMERIC,
+            remarks TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_transactions_symbol ON transactions (symbol);
+        CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+        CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions (type);
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT PRIMARY KEY,
+            company_name TEXT,
+            price NUMERIC
+        );
+    """
+
+    # Sheet1 column -> transactions table column
+    COLUMN_MAP = {
+        'Date': 'date',
+        'Company Symbol': 'symbol',
+        'Company Name': 'company_name',
+        'Transaction Type': 'type',
+        'Quantity': 'quantity',
+        'Price Per Share (pkr)': 'price',
+        'Total Amount(pkr)': 'total_amount',
+        'Remarks': 'remarks'
+    }
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A new connection per call keeps this safe to use from any thread
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def is_empty(self):
+        with self._connect() as conn:
+            count = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM transactions) + (SELECT COUNT(*) FROM prices)"
+            ).fetchone()[0]
+        return count == 0
+
+    def _select_transactions(self, conn, after_id=0):
+        select = ", ".join(f'{sql} AS "{col}"' for col, sql in self.COLUMN_MAP.items())
+        return pd.read_sql_query(
+            f"SELECT id, {select} FROM transactions WHERE id > ? ORDER BY id",
+            conn, params=(after_id,)
+        )
+
+    def load_transactions(self):
+        with self._connect() as conn:
+            df = self._select_transactions(conn)
+        position = int(df['id'].max()) if len(df) else 0
+        df = df.drop(columns='id')
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce', format='ISO8601')
+        df = clean_transactions(df).reset_index(drop=True)
+        # Positions are row ids
+        df.attrs['storage_position'] = position
+        return df
+
+    def changes_since(self, position):
+        with self._connect() as conn:
+            df = self._select_transactions(conn, after_id=position or 0)
+        ids = df.pop('id').tolist()
+        records = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        return list(zip(ids, records))
+
+    def load_prices(self):
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                'SELECT symbol AS "Company Symbol", company_name AS "Company Name", '
+                'price AS "Current Market Price (PKR)" FROM prices ORDER BY rowid',
+                conn
+            )
+        df['Current Market Price (PKR)'] = pd.to_numeric(df['Current Market Price (PKR)'], errors='coerce')
+        return df
+
+    def append_transactions(self, records):
+        rows = [
+            tuple(_sql_value(record.get(col)) for col in TRANSACTION_COLUMNS)
+            for record in records
+        ]
+        columns = ", ".join(self.COLUMN_MAP[col] for col in TRANSACTION_COLUMNS)
+        with self._write_lock, self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO transactions ({columns}) VALUES ({', '.join('?' * len(TRANSACTION_COLUMNS))})",
+                rows
+            )
+            # Same transaction as the inserts, so this is our last row
+            return conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+
+    def replace_prices(self, price_df):
+        rows = [
+            (_sql_value(symbol), _sql_value(name), _sql_value(price))
+            for symbol, name, price in zip(price_df['Company Symbol'],
+                                           price_df['Company Name'],
+                                           price_df['Current Market Price (PKR)'])
+        ]
+        with self._write_lock, self._connect() as conn:
+            conn.execute("DELETE FROM prices")
+            conn.executemany(
+                "INSERT OR IGNORE INTO prices (symbol, company_name, price) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def update_prices(self, prices):
+        rows = [(_sql_value(symbol), _sql_value(price)) for symbol, price in prices.items()]
+        with self._write_lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO prices (symbol, price) VALUES (?, ?) "
+                "ON CONFLICT (symbol) DO UPDATE SET price = excluded.price",
+                rows
+            )
+
+    def save_summary(self, summary_df):
+        with self._write_lock, self._connect() as conn:
+            summary_df.to_sql('calculated_summary', conn, if_exists='replace', index=False)
+
+    def aggregate_transactions(self):
+        """
+        Same result as PortfolioCalculator.aggregate_transactions, computed
+        by SQLite with one GROUP BY (using the symbol index). Rows are
+        filtered with the same rules as clean_transactions.
+        """
+        query = """
+            SELECT
+                symbol AS "Company Symbol",
+                SUM(CASE WHEN type = 'Buy' THEN amount ELSE 0 END) AS total_bought,
+                SUM(CASE WHEN type = 'Sell' THEN amount ELSE 0 END) AS total_sold,
+                SUM(CASE WHEN type = 'Buy' THEN quantity WHEN type = 'Sell' THEN -quantity ELSE 0 END) AS net_quantity,
+                SUM(CASE WHEN type = 'Buy' THEN quantity ELSE 0 END) AS total_buy_quantity,
+                SUM(type = 'Buy') AS buy_count,
+                SUM(type = 'Sell') AS sell_count
+            FROM (
+                SELECT id, symbol, type, quantity,
+                       CASE WHEN typeof(total_amount) IN ('integer', 'real') AND total_amount != 0
+                            THEN total_amount ELSE quantity * price END AS amount
+                FROM transactions
+                WHERE symbol IS NOT NULL
+                  AND typeof(quantity) IN ('integer', 'real')
+                  AND typeof(price) IN ('integer', 'real')
+            )
+            GROUP BY symbol
+            ORDER BY MIN(id)
+        """
+        with self._connect() as conn:
+            df = pd.read_sql_query(query, conn, index_col='Company Symbol')
+        for col in ('buy_count', 'sell_count'):
+            df[col] = df[col].astype('int64')
+        return df
+
+    def import_from_excel(self, excel_file):
+        """
+        One-time import of Sheet1 (transactions) and Sheet2 (prices)
+        """
+        transactions_df = load_transactions_from_excel(excel_file)
+        price_df = load_portfolio_from_excel(excel_file)
+        if transactions_df is None or price_df is None:
+            raise ValueError(f"Could not read {excel_file}")
+
+        self.append_transactions(transactions_df.to_dict(orient='records'))
+        self.replace_prices(price_df)
+        print(f"✅ Imported {len(transactions_df)} transactions and "
+              f"{len(price_df)} prices from {excel_file}.")
+
+    def export_to_excel(self, excel_file):
+        """
+        Writes the data back out in the original workbook layout
+        (title row, header row, data) for Sheet1 and Sheet2
+        """
+        from openpyxl import Workbook
+        wb = Workbook()
+        sheets = [
+            ('Sheet1', 'PSX Transactions', self.load_transactions()[TRANSACTION_COLUMNS]),
+            ('Sheet2', 'Portfolio Summary', self.load_prices()[PRICE_COLUMNS])
+        ]
+        wb.remove(wb.active)
+        for sheet_name, title, df in sheets:
+            ws = wb.create_sheet(sheet_name)
+            ws.append([title])
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False):
+                ws.append([None if pd.isna(value) else value for value in row])
+        wb.save(excel_file)
+        print(f"✅ Exported SQLite data to {excel_file}.")
+
+
+def create_storage(excel_file, backend=None, db_path=None,
+                   compact_interval=30.0, compact_rows=200):
+    """
+    Builds the storage backend picked by `backend` ('excel' or 'sqlite').
+    A new, empty SQLite database is filled from the workbook once.
+    """
+    backend = (backend or 'excel').lower()
+    if backend == 'sqlite':
+        storage = SQLiteBackend(db_path or os.path.splitext(excel_file)[0] + '.db')
+        if storage.is_empty() and os.path.exists(excel_file):
+            storage.import_from_excel(excel_file)
+        return storage
+    if backend == 'excel':
+        return ExcelBackend(excel_file, compact_interval, compact_rows)
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+if __name__ == "__main__":
+    # python storage.py import "data/Book 3 full final.xlsx" data/portfolio.db
+    # python storage.py export data/portfolio.db data/export.xlsx
+    parser = argparse.ArgumentParser(description="Move portfolio data between Excel and SQLite")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="Import a workbook into SQLite")
+    import_parser.add_argument('excel_file')
+    import_parser.add_argument('db_path')
+
+    export_parser = subparsers.add_parser('export', help="Export SQLite data to a workbook")
+    export_parser.add_argument('db_path')
+    export_parser.add_argument('excel_file')
+
+    args = parser.parse_args()
+    storage = SQLiteBackend(args.db_path)
+    if args.command == 'import':
+        storage.import_from_excel(args.excel_file)
+    else:
+        storage.export_to_excel(args.excel_file)
@@ -0,0 +1,96 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from data_loader import TRANSACTION_COLUMNS
+from storage import PRICE_COLUMNS
+
+REMARKS = ['Long-term', 'Short-term', 'Dividend play', None]
+
+
+def generate_ledger(transactions, symbols, sell_ratio=0.3, seed=0, start='2020-01-01'):
+    """
+    A made-up but repeatable portfolio: `transactions` rows spread over
+    `symbols` companies, a `sell_ratio` share of them sales. The same
+    arguments always give the same data.
+
+    Returns (transactions_df, prices_df) in the Sheet1 / Sheet2 layouts.
+    """
+    rng = np.random.default_rng(seed)
+    codes = [f"SYM{i:04d}" for i in range(symbols)]
+    names = [f"Synthetic Company {i}" for i in range(symbols)]
+    base_prices = np.round(rng.uniform(10, 500, symbols), 2)
+
+    company = rng.integers(0, symbols, transactions)
+    is_sell = rng.random(transactions) < sell_ratio
+    quantity = np.where(is_sell, rng.integers(1, 200, transactions), rng.integers(10, 1000, transactions))
+    # Prices drift around each company's base price
+    price = np.round(base_prices[company] * rng.uniform(0.7, 1.3, transactions), 2)
+    days = np.sort(rng.integers(0, 5 * 365, transactions))
+
+    transactions_df = pd.DataFrame({
+        'Date': pd.Timestamp(start) + pd.to_timedelta(days, unit='D'),
+        'Company Symbol': np.array(codes, dtype=object)[company],
+        'Company Name': np.array(names, dtype=object)[company],
+        'Transaction Type': np.where(is_sell, 'Sell', 'Buy'),
+        'Quantity': quantity,
+        'Price Per Share (pkr)': price,
+        'Total Amount(pkr)': np.round(quantity * price, 2),
+        'Remarks': np.array(REMARKS, dtype=object)[rng.integers(0, len(REMARKS), transactions)]
+    }, columns=TRANSACTION_COLUMNS)
+
+    prices_df = pd.DataFrame({
+        'Company Symbol': codes,
+        'Company Name': names,
+        'Current Market Price (PKR)': np.round(base_prices * rng.uniform(0.8, 1.2, symbols), 2)
+    }, columns=PRICE_COLUMNS)
+    return transactions_df, prices_df
+
+
+def write_workbook(file_path, transactions_df, prices_df):
+    """
+    Saves the data in the original workbook layout (title row, header row,
+    data) for Sheet1 and Sheet2
+    """
+    wb = Workbook(write_only=True)
+    sheets = [
+        ('Sheet1', 'PSX Transactions', transactions_df),
+        ('Sheet2', 'Portfolio Summary', prices_df)
+    ]
+    for sheet_name, title, df in sheets:
+        ws = wb.create_sheet(sheet_name)
+        ws.append([title])
+        ws.append(list(df.columns))
+        columns = [
+            df[col].dt.to_pydatetime() if pd.api.types.is_datetime64_any_dtype(df[col])
+            else df[col].to_numpy(dtype=object)
+            for col in df.columns
+        ]
+        for row in zip(*columns):
+            ws.append([None if value is None or value != value else value for value in row])
+    wb.save(file_path)
+
+
+def generate_workbook(file_path, transactions, symbols, sell_ratio=0.3, seed=0):
+    """
+    generate_ledger + write_workbook. Returns (transactions_df, prices_df).
+    """
+    transactions_df, prices_df = generate_ledger(transactions, symbols, sell_ratio, seed)
+    write_workbook(file_path, transactions_df, prices_df)
+    return transactions_df, prices_df
+
+
+if __name__ == "__main__":
+    # python synthetic_data.py data/portfolios/synthetic.xlsx --transactions 100000 --symbols 500
+    parser = argparse.ArgumentParser(description="Write a synthetic portfolio workbook")
+    parser.add_argument('file_path')
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--sell-ratio', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_workbook(args.file_path, args.transactions, args.symbols, args.sell_ratio, args.seed)
+    print(f"✅ Wrote {args.transactions} transactions over {args.symbols} companies to {args.file_path}.")
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules live next to app.py, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import TRANSACTION_COLUMNS, clean_transactions  # noqa: E402
+from synthetic_data import write_workbook  # noqa: E402
+
+
+def transaction(date, symbol, kind, quantity, price, total=None, name=None):
+    """
+    One Sheet1 row as a dict (total defaults to quantity * price)
+    """
+    return {
+        'Date': date,
+        'Company Symbol': symbol,
+        'Company Name': name or f"{symbol} Ltd",
+        'Transaction Type': kind,
+        'Quantity': quantity,
+        'Price Per Share (pkr)': price,
+        'Total Amount(pkr)': quantity * price if total is None else total,
+        'Remarks': None
+    }
+
+
+def transactions_df(rows):
+    """
+    Rows cleaned the way the loader cleans Sheet1
+    """
+    return clean_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+
+@pytest.fixture
+def prices_df():
+    return pd.DataFrame({
+        'Company Symbol': ['AAA', 'BBB', 'CCC', 'DDD'],
+        'Company Name': ['AAA Ltd', 'BBB Ltd', 'CCC Ltd', 'DDD Ltd'],
+        'Current Market Price (PKR)': [140.0, 11.0, 60.0, 25.0]
+    })
+
+
+@pytest.fixture
+def workbook(tmp_path, prices_df):
+    """
+    A small workbook in the original layout (two purchases)
+    """
+    path = str(tmp_path / 'Book.xlsx')
+    rows = [
+        transaction('2024-01-01', 'AAA', 'Buy', 10, 100),
+        transaction('2024-01-02', 'BBB', 'Buy', 5, 10),
+    ]
+    write_workbook(path, pd.DataFrame(rows), prices_df)
+    return path
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """
+    The app module, serving a small workbook of its own: app.py reads
+    data/Book 3 full final.xlsx relative to the working directory, so the
+    tests run from a temporary folder
+    """
+    folder = tmp_path_factory.mktemp('server')
+    os.makedirs(folder / 'data' / 'portfolios')
+    rows = [
+        transaction('2024-01-01', 'AAA', 'Buy', 10, 100),
+        transaction('2024-01-02', 'BBB', 'Buy', 100, 10),
+        transaction('2024-01-03', 'CCC', 'Buy', 4, 50),
+        transaction('2024-01-04', 'DDD', 'Buy', 8, 30),
+        transaction('2024-02-01', 'AAA', 'Sell', 4, 130),
+        transaction('2024-02-02', 'DDD', 'Sell', 2, 20),
+    ]
+    prices = pd.DataFrame({
+        'Company Symbol': ['AAA', 'BBB', 'CCC', 'DDD'],
+        'Company Name': ['AAA Ltd', 'BBB Ltd', 'CCC Ltd', 'DDD Ltd'],
+        'Current Market Price (PKR)': [140.0, 11.0, 50.0, 25.0]
+    })
+    write_workbook(str(folder / 'data' / 'Book 3 full final.xlsx'), pd.DataFrame(rows), prices)
+
+    os.environ['JOURNAL_COMPACT_INTERVAL'] = '3600'
+    previous = os.getcwd()
+    os.chdir(folder)
+    import app
+    assert app.warmup.wait(60)
+    yield app
+    os.chdir(previous)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
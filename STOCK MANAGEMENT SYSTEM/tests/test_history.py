@@ -0,0 +1,64 @@
+import pytest
+
+from calculator import PortfolioCalculator
+
+from conftest import transaction, transactions_df
+
+
+@pytest.fixture
+def history():
+    return PortfolioCalculator.build_history(transactions_df([
+        transaction('2024-01-03', 'AAA', 'Sell', 4, 130),
+        transaction('2024-01-01', 'AAA', 'Buy', 10, 100),
+        transaction('2024-01-03', 'BBB', 'Buy', 5, 10),
+        transaction(None, 'CCC', 'Buy', 1, 1),
+    ]))
+
+
+def test_daily_points(history):
+    totals, holdings = PortfolioCalculator.portfolio_history(history, 'daily')
+
+    assert totals.index.strftime('%Y-%m-%d').tolist() == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert totals['Invested (PKR)'].tolist() == [1000, 1000, 1050]
+    assert totals['Proceeds (PKR)'].tolist() == [0, 0, 520]
+    # 6 AAA left at the average buy price of 100, plus 5 BBB at 10
+    assert totals['Cost Basis (PKR)'].tolist() == [1000, 1000, 650]
+    assert totals.attrs['undated'] == 1
+
+    assert list(holdings.columns) == ['AAA', 'BBB']
+    assert holdings['AAA'].tolist() == [10, 10, 6]
+    assert holdings['BBB'].tolist() == [0, 0, 5]
+
+
+def test_range_and_weekly(history):
+    totals, holdings = PortfolioCalculator.portfolio_history(history, 'daily', '2023-12-31', '2024-01-01')
+    # Before the first transaction everything is 0
+    assert totals['Invested (PKR)'].tolist() == [0, 1000]
+    assert holdings['AAA'].tolist() == [0, 10]
+
+    weekly, _ = PortfolioCalculator.portfolio_history(history, 'weekly', '2024-01-01', '2024-01-10')
+    # Week ends (Sundays), then the unfinished last week up to the end date
+    assert weekly.index.strftime('%Y-%m-%d').tolist() == ['2024-01-07', '2024-01-10']
+    assert weekly['Invested (PKR)'].tolist() == [1050, 1050]
+
+    with pytest.raises(ValueError):
+        PortfolioCalculator.portfolio_history(history, 'hourly')
+
+
+def test_history_endpoint(client):
+    body = client.get('/history').get_json()
+    assert body['freq'] == 'daily' and body['undated'] == 0
+    points = body['points']
+    assert points[0]['Date'] == '2024-01-01'
+    assert points[0]['Invested (PKR)'] == 1000
+    assert [point['Date'] for point in points] == [row['Date'] for row in body['holdings']]
+
+    window = client.get('/history?start=2024-01-02&end=2024-01-03').get_json()
+    assert [point['Date'] for point in window['points']] == ['2024-01-02', '2024-01-03']
+    assert window['holdings'][-1]['CCC'] == 4
+
+    columnar = client.get('/history?freq=weekly&layout=columnar').get_json()
+    assert columnar['points']['columns'][0] == 'Date'
+
+    assert client.get('/history?freq=hourly').status_code == 400
+    assert client.get('/history?start=notadate').status_code == 400
@@ -0,0 +1,36 @@
+def test_unchanged_data_answers_304(client):
+    first = client.get('/holdings')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/holdings', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    # The tag belongs to the snapshot, so every read endpoint shares it
+    assert client.get('/summary', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_new_version_gets_a_new_etag(client, server):
+    first = client.get('/holdings')
+    etag = first.headers['ETag']
+
+    price = client.get('/company/AAA').get_json()['current_price']
+    assert client.post('/api/prices', json={'AAA': price + 1}).status_code == 200
+
+    changed = client.get('/holdings', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.headers['ETag'] == f"\"{server.state.snapshot.epoch}-{server.state.snapshot.version}\""
+    assert changed.get_json() != first.get_json()
+
+
+def test_cached_body_matches_a_fresh_build(client, server):
+    first = client.get('/holdings?sort=pl&order=desc')
+    second = client.get('/holdings?sort=pl&order=desc')
+    assert first.data == second.data
+
+    # Another query string is another body
+    assert client.get('/holdings?sort=pl&order=asc').data != first.data
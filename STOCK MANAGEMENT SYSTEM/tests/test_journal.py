@@ -0,0 +1,108 @@
+from compactor import compact_journal
+from data_loader import append_transactions_to_excel, load_transactions_from_excel
+from journal import TransactionJournal, read_journal_checkpoint
+
+from conftest import transaction, transactions_df
+
+
+def load(path):
+    return load_transactions_from_excel(path, use_cache=False)
+
+
+def symbols(df):
+    return df['Company Symbol'].astype(str).tolist()
+
+
+def test_sequence_numbers_continue(workbook):
+    journal = TransactionJournal(workbook)
+
+    assert journal.append([transaction('2024-02-01', 'AAA', 'Buy', 1, 100)]) == [1]
+    assert journal.append([transaction('2024-02-02', 'CCC', 'Buy', 2, 50)] * 2) == [2, 3]
+
+    assert [seq for seq, _ in journal.read_entries()] == [1, 2, 3]
+    assert [seq for seq, _ in journal.read_entries(after_seq=2)] == [3]
+
+    # Trimming keeps the numbering and the later entries
+    journal.truncate_through(1)
+    assert [seq for seq, _ in journal.read_entries()] == [2, 3]
+    assert journal.append([transaction('2024-02-03', 'AAA', 'Sell', 1, 110)]) == [4]
+
+
+def test_torn_tail_is_dropped(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'AAA', 'Buy', 1, 100)])
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 2, "row": {"Company Sym')
+
+    assert [seq for seq, _ in journal.read_entries()] == [1]
+    # Opening the journal again repairs the file, so numbering goes on from 1
+    assert TransactionJournal(workbook).append([transaction('2024-02-02', 'AAA', 'Buy', 1, 100)]) == [2]
+
+
+def test_replay_before_compaction(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+
+    df = load(workbook)
+    assert symbols(df) == ['AAA', 'BBB', 'CCC']
+    assert df.attrs['journal_checkpoint'] == 1
+    assert load_transactions_from_excel(workbook, use_cache=False, include_journal=False).shape[0] == 2
+
+
+def test_compaction_moves_rows(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+    journal.append([transaction('2024-02-02', 'AAA', 'Sell', 4, 150)])
+
+    assert compact_journal(journal) == 2
+    assert read_journal_checkpoint(workbook) == 2
+    assert journal.read_entries() == []
+
+    # Everything is in Sheet1 itself now
+    df = load_transactions_from_excel(workbook, use_cache=False, include_journal=False)
+    assert symbols(df) == ['AAA', 'BBB', 'CCC', 'AAA']
+
+    assert compact_journal(journal) == 0
+    assert journal.append([transaction('2024-02-03', 'BBB', 'Sell', 1, 12)]) == [3]
+
+
+def test_compaction_stops_at_through_seq(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+    journal.append([transaction('2024-02-02', 'DDD', 'Buy', 1, 25)])
+
+    assert compact_journal(journal, through_seq=1) == 1
+    assert [seq for seq, _ in journal.read_entries()] == [2]
+    assert symbols(load(workbook)) == ['AAA', 'BBB', 'CCC', 'DDD']
+
+
+def test_crash_before_trim_does_not_double_count(workbook):
+    journal = TransactionJournal(workbook)
+    rows = [transaction('2024-02-01', 'CCC', 'Buy', 2, 50)]
+    journal.append(rows)
+
+    # The workbook was saved with the checkpoint, then the process died
+    # before the journal was trimmed
+    append_transactions_to_excel(workbook, rows, journal_seq=1)
+    assert len(journal.read_entries()) == 1
+
+    assert symbols(load(workbook)) == ['AAA', 'BBB', 'CCC']
+    assert compact_journal(journal) == 0
+    assert symbols(load(workbook)) == ['AAA', 'BBB', 'CCC']
+
+
+def test_replayed_rows_match_the_sheet(workbook):
+    journal = TransactionJournal(workbook)
+    rows = [transaction('2024-02-01', 'CCC', 'Buy', 2, 50.5), transaction('2024-02-02', 'AAA', 'Sell', 3, 120)]
+    journal.append(rows)
+    before = load(workbook)
+
+    compact_journal(journal)
+    after = load(workbook)
+
+    # Excel may read whole numbers back as ints: the values must be the same
+    assert symbols(after) == symbols(before)
+    assert after['Transaction Type'].astype(str).tolist() == before['Transaction Type'].astype(str).tolist()
+    for col in ['Quantity', 'Price Per Share (pkr)', 'Total Amount(pkr)']:
+        assert after[col].astype(float).tolist() == before[col].astype(float).tolist()
+    assert after.tail(2)['Total Amount(pkr)'].tolist() == transactions_df(rows)['Total Amount(pkr)'].tolist()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from leaderboard import LEADERBOARD_METRICS, Leaderboard
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(3)
+    values = {column: rng.integers(-50, 50, 40).astype(float) for column in LEADERBOARD_METRICS.values()}
+    # Ties and a missing value, which is left out of the ranking
+    values['Profit/Loss (PKR)'][[5, 6, 7]] = 49.0
+    values['Market Value (PKR)'][2] = np.nan
+    return pd.DataFrame(values)
+
+
+def expected_top(df, column, n):
+    return df[column].dropna().nlargest(n).index.tolist()
+
+
+def expected_bottom(df, column, n):
+    return df[column].dropna().nsmallest(n).index.tolist()
+
+
+@pytest.mark.parametrize('metric', list(LEADERBOARD_METRICS))
+def test_matches_a_full_sort(table, metric):
+    board = Leaderboard.from_frame(table)
+    column = LEADERBOARD_METRICS[metric]
+    for n in (0, 1, 3, 10, 100):
+        assert board.top(metric, n) == expected_top(table, column, n)
+        assert board.bottom(metric, n) == expected_bottom(table, column, n)
+
+
+def test_updates_keep_it_sorted(table):
+    board = Leaderboard.from_frame(table)
+    rng = np.random.default_rng(4)
+    for _ in range(200):
+        pos = int(rng.integers(0, len(table)))
+        for column in LEADERBOARD_METRICS.values():
+            table.loc[pos, column] = float(rng.integers(-60, 60))
+        if rng.random() < 0.1:
+            table.loc[pos, 'Profit/Loss %'] = np.nan
+        board.update(pos, table.loc[pos].to_dict())
+
+    for metric, column in LEADERBOARD_METRICS.items():
+        assert board.top(metric, 5) == expected_top(table, column, 5)
+        assert board.bottom(metric, 5) == expected_bottom(table, column, 5)
+
+
+def test_frozen_copy_does_not_follow_updates(table):
+    board = Leaderboard.from_frame(table)
+    frozen = board.frozen_copy()
+    before = frozen.top('pl', 3)
+
+    row = table.loc[0].to_dict()
+    row['Profit/Loss (PKR)'] = 1000.0
+    board.update(0, row)
+    assert board.top('pl', 1) == [0]
+    assert frozen.top('pl', 3) == before
+
+
+def test_top_performers_endpoint(client):
+    holdings = client.get('/holdings').get_json()
+    by_symbol = {row['Company Symbol']: row for row in holdings}
+    ranked = sorted(by_symbol, key=lambda symbol: -by_symbol[symbol]['Profit/Loss (PKR)'])
+
+    top = client.get('/top-performers?n=2').get_json()
+    assert [row['Company Symbol'] for row in top] == ranked[:2]
+
+    bottom = client.get('/top-performers?n=1&direction=bottom&metric=value').get_json()
+    lowest = min(by_symbol, key=lambda symbol: by_symbol[symbol]['Market Value (PKR)'])
+    assert [row['Company Symbol'] for row in bottom] == [lowest]
+    assert 'Market Value (PKR)' in bottom[0]
+
+    assert client.get('/top-performers?metric=luck').status_code == 400
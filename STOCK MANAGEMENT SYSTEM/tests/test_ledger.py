@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+from calculator import PortfolioCalculator
+from data_loader import concat_transactions
+from ledger import IncrementalLedger
+
+from conftest import transaction, transactions_df
+
+BASE_ROWS = [
+    transaction('2024-01-01', 'AAA', 'Buy', 10, 100),
+    transaction('2024-01-02', 'AAA', 'Buy', 10, 120),
+    transaction('2024-01-03', 'BBB', 'Buy', 100, 9.5),
+    transaction('2024-01-04', 'AAA', 'Sell', 5, 130),
+]
+
+NEW_ROWS = [
+    transaction('2024-02-01', 'AAA', 'Sell', 3, 135),
+    transaction('2024-02-02', 'BBB', 'Buy', 20, 10, total=0),  # 0 -> Quantity * Price
+    transaction('2024-02-03', 'CCC', 'Buy', 7, 55),  # a company the summary didn't have
+    transaction('2024-02-04', 'BBB', 'Sell', 50, 11, total=float('nan')),  # missing: the same
+    transaction('2024-02-05', 'CCC', 'Sell', 2, 58),
+]
+
+
+def summary_by_symbol(df):
+    return df.sort_values('Company Symbol').reset_index(drop=True)
+
+
+def assert_same_as_calculator(ledger, rows, prices_df):
+    expected = PortfolioCalculator.create_portfolio_summary(transactions_df(rows), prices_df)
+    pd.testing.assert_frame_equal(summary_by_symbol(ledger.portfolio_df), summary_by_symbol(expected))
+
+    everything = transactions_df(rows)
+    assert ledger.totals['total_investment'] == pytest.approx(
+        PortfolioCalculator.calculate_total_investment(everything))
+    assert ledger.totals['total_sales'] == pytest.approx(
+        PortfolioCalculator.calculate_total_sales(everything))
+
+
+def test_apply_transactions_matches_rebuild(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+
+    assert ledger.apply_transactions(NEW_ROWS) == len(NEW_ROWS)
+    assert_same_as_calculator(ledger, BASE_ROWS + NEW_ROWS, prices_df)
+
+
+def test_apply_transaction_one_by_one(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+
+    for n, row in enumerate(NEW_ROWS, start=1):
+        assert ledger.apply_transaction(row)
+        assert_same_as_calculator(ledger, BASE_ROWS + NEW_ROWS[:n], prices_df)
+
+
+def test_whole_share_counts_stay_integers(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+    ledger.apply_transaction(transaction('2024-02-01', 'AAA', 'Buy', 4, 100))
+    assert ledger.portfolio_df['Net Shares'].dtype.kind == 'i'
+
+    # A fractional quantity widens the column, as a rebuild would
+    ledger.apply_transaction(transaction('2024-02-02', 'AAA', 'Buy', 0.5, 100))
+    assert ledger.portfolio_df['Net Shares'].dtype.kind == 'f'
+    row = ledger.portfolio_df.set_index('Company Symbol').loc['AAA']
+    assert row['Net Shares'] == 19.5
+
+
+def test_transactions_df_includes_applied_rows(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+    ledger.apply_transactions(NEW_ROWS)
+
+    expected = concat_transactions([transactions_df(BASE_ROWS), transactions_df(NEW_ROWS)])
+    combined = ledger.transactions_df
+    assert len(combined) == len(BASE_ROWS) + len(NEW_ROWS)
+    assert combined['Company Symbol'].astype(str).tolist() == expected['Company Symbol'].astype(str).tolist()
+
+
+def test_invalid_rows_are_skipped(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+    bad = transaction('2024-02-01', 'AAA', 'Buy', 'lots', 100)
+
+    assert not ledger.apply_transaction(bad)
+    assert_same_as_calculator(ledger, BASE_ROWS, prices_df)
+
+
+def test_update_prices_reprices_only_the_summary(prices_df):
+    ledger = IncrementalLedger(transactions_df(BASE_ROWS), prices_df)
+    ledger.apply_transactions(NEW_ROWS)
+
+    assert ledger.update_prices({'AAA': 150.0, 'ZZZ': 1.0}) == 1
+    new_prices = prices_df.assign(**{
+        'Current Market Price (PKR)': prices_df['Company Symbol'].map({'AAA': 150.0}).fillna(
+            prices_df['Current Market Price (PKR)'])
+    })
+    assert_same_as_calculator(ledger, BASE_ROWS + NEW_ROWS, new_prices)
@@ -0,0 +1,79 @@
+import pytest
+
+from calculator import PortfolioCalculator
+
+from conftest import transaction, transactions_df
+
+
+@pytest.fixture
+def ledger():
+    return transactions_df([
+        # The sale comes first in the ledger but is matched by date
+        transaction('2024-03-01', 'AAA', 'Sell', 15, 130),
+        transaction('2024-01-01', 'AAA', 'Buy', 10, 100),
+        transaction('2024-02-01', 'AAA', 'Buy', 10, 120),
+        # Sells 3 more shares than were ever bought
+        transaction('2024-01-05', 'BBB', 'Buy', 5, 10),
+        transaction('2024-01-06', 'BBB', 'Sell', 8, 12),
+        # The undated buy is matched after every dated row
+        transaction(None, 'CCC', 'Buy', 4, 50),
+        transaction('2024-01-01', 'CCC', 'Buy', 2, 40),
+        transaction('2024-01-02', 'CCC', 'Sell', 2, 45),
+    ])
+
+
+@pytest.mark.parametrize('method, realized, lots', [
+    # 1950 - (10 * 100 + 5 * 120)
+    ('fifo', 350.0, [{'date': '2024-02-01', 'quantity': 5.0, 'unit_cost': 120.0, 'cost': 600.0}]),
+    # 1950 - (10 * 120 + 5 * 100)
+    ('lifo', 250.0, [{'date': '2024-01-01', 'quantity': 5.0, 'unit_cost': 100.0, 'cost': 500.0}]),
+    # 1950 - 15 * 110 (20 shares pooled at 2200)
+    ('average', 300.0, [{'date': '2024-01-01', 'quantity': 5.0, 'unit_cost': 110.0, 'cost': 550.0}]),
+])
+def test_cost_methods(ledger, method, realized, lots):
+    company = PortfolioCalculator.match_lots(ledger, method).company('AAA', price=140.0)
+
+    assert company['method'] == method
+    assert company['realized_pl'] == pytest.approx(realized)
+    assert company['lots'] == lots
+    assert company['open_quantity'] == 5.0
+    assert company['unrealized_pl'] == pytest.approx(5 * 140.0 - lots[0]['cost'])
+    assert company['unmatched_sell_quantity'] == 0.0
+
+
+@pytest.mark.parametrize('method', ['fifo', 'lifo', 'average'])
+def test_oversold_shares_are_unmatched(ledger, method):
+    company = PortfolioCalculator.match_lots(ledger, method).company('BBB')
+
+    # Only the 5 shares held are realized: 5 * 12 - 50
+    assert company['realized_pl'] == pytest.approx(10.0)
+    assert company['unmatched_sell_quantity'] == 3.0
+    assert company['lots'] == []
+    assert company['unrealized_pl'] is None
+
+
+def test_undated_rows_are_matched_last(ledger):
+    company = PortfolioCalculator.match_lots(ledger, 'fifo').company('CCC', price=60.0)
+
+    # The sale used the dated lot (2 * 45 - 2 * 40), not the undated one
+    assert company['realized_pl'] == pytest.approx(10.0)
+    assert company['lots'] == [{'date': None, 'quantity': 4.0, 'unit_cost': 50.0, 'cost': 200.0}]
+    assert company['unrealized_pl'] == pytest.approx(4 * 60.0 - 200.0)
+
+
+def test_totals_and_symbol_filter(ledger):
+    book = PortfolioCalculator.match_lots(ledger, 'fifo')
+    totals = book.totals({'AAA': 140.0, 'CCC': 60.0})
+
+    assert totals['realized_pl'] == pytest.approx(350.0 + 10.0 + 10.0)
+    assert totals['cost_basis'] == pytest.approx(600.0 + 200.0)
+    assert totals['unrealized_pl'] == pytest.approx((700.0 - 600.0) + (240.0 - 200.0))
+
+    only_aaa = PortfolioCalculator.match_lots(ledger, 'fifo', symbols=['AAA', 'ZZZ'])
+    assert list(only_aaa.companies) == ['AAA']
+    assert only_aaa.company('AAA') == book.company('AAA')
+
+
+def test_unknown_method(ledger):
+    with pytest.raises(ValueError):
+        PortfolioCalculator.match_lots(ledger, 'hifo')
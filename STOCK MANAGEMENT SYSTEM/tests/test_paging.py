@@ -0,0 +1,81 @@
+import pytest
+
+
+def symbols(page):
+    return [row['Company Symbol'] for row in page['items']]
+
+
+@pytest.mark.parametrize('query', [
+    'limit=abc',
+    'limit=2&offset=xyz',
+    'limit=',
+    'limit=-1',
+    'offset=-3',
+    'limit=1.5',
+    'order=sideways',
+    'sort=nope',
+    'pl=maybe',
+])
+def test_bad_parameters_get_a_json_400(client, query):
+    response = client.get(f'/holdings?{query}')
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['success'] is False
+    assert body['error']
+
+
+def test_pages_follow_each_other(client):
+    first = client.get('/holdings?sort=symbol&limit=3').get_json()
+    assert first['total'] == 4
+    assert first['offset'] == 0 and first['limit'] == 3
+    assert symbols(first) == ['AAA', 'BBB', 'CCC']
+    assert first['next_offset'] == 3
+
+    last = client.get('/holdings?sort=symbol&limit=3&offset=3').get_json()
+    assert symbols(last) == ['DDD']
+    assert last['next_offset'] is None
+
+
+def test_edge_pages(client):
+    empty = client.get('/holdings?limit=0').get_json()
+    assert empty['items'] == [] and empty['total'] == 4 and empty['next_offset'] == 0
+
+    past_the_end = client.get('/holdings?offset=10').get_json()
+    assert past_the_end['items'] == [] and past_the_end['next_offset'] is None
+
+    # Only offset: everything from there on
+    rest = client.get('/holdings?sort=symbol&offset=1').get_json()
+    assert symbols(rest) == ['BBB', 'CCC', 'DDD'] and rest['limit'] is None
+
+
+def test_sort_and_filters(client):
+    descending = client.get('/holdings?sort=symbol&order=desc').get_json()
+    assert symbols(descending) == ['DDD', 'CCC', 'BBB', 'AAA']
+
+    by_pl = client.get('/holdings?sort=pl&order=desc').get_json()
+    pl = [row['Profit/Loss (PKR)'] for row in by_pl['items']]
+    assert pl == sorted(pl, reverse=True)
+
+    assert symbols(client.get('/holdings?prefix=c').get_json()) == ['CCC']
+    assert symbols(client.get('/holdings?pl=negative').get_json()) == ['DDD']
+    assert symbols(client.get('/holdings?pl=zero').get_json()) == ['CCC']
+
+
+def test_columnar_page(client):
+    page = client.get('/holdings?sort=symbol&limit=2&layout=columnar').get_json()
+    assert page['items']['data']['Company Symbol'] == ['AAA', 'BBB']
+
+
+def test_transactions_paging(client):
+    page = client.get('/transactions?sort=symbol&order=desc&limit=2').get_json()
+    assert [row['symbol'] for row in page['items']] == ['DDD', 'CCC']
+    assert page['total'] == 4
+
+    response = client.get('/transactions?pl=positive')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_no_paging_parameters_keep_the_plain_list(client):
+    assert isinstance(client.get('/holdings').get_json(), list)
+    assert isinstance(client.get('/transactions').get_json(), dict)
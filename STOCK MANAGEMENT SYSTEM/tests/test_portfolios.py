@@ -0,0 +1,109 @@
+import pandas as pd
+import pytest
+
+from portfolios import PortfolioRegistry
+from synthetic_data import write_workbook
+
+from conftest import transaction
+
+
+@pytest.fixture
+def folder(tmp_path, prices_df):
+    """
+    Three portfolios, a, b and c, with one purchase each
+    """
+    for portfolio_id in ('a', 'b', 'c'):
+        rows = [transaction('2024-01-01', 'AAA', 'Buy', 10, 100)]
+        write_workbook(str(tmp_path / f'{portfolio_id}.xlsx'), pd.DataFrame(rows), prices_df)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def registry(folder):
+    registries = []
+
+    def open_registry(**options):
+        options.setdefault('idle_timeout', 3600.0)
+        registry = PortfolioRegistry(folder, compact_interval=3600, **options)
+        registries.append(registry)
+        return registry
+
+    yield open_registry
+    for registry in registries:
+        registry.close()
+
+
+def loaded_ids(registry):
+    return [entry['id'] for entry in registry.stats()['loaded']]
+
+
+def test_least_recently_used_is_unloaded(registry):
+    portfolios = registry(max_loaded=2)
+    portfolios.get('a')
+    portfolios.get('b')
+    portfolios.get('a')
+    portfolios.get('c')
+    assert loaded_ids(portfolios) == ['a', 'c']
+
+
+def test_unknown_portfolio(registry):
+    portfolios = registry()
+    with pytest.raises(KeyError):
+        portfolios.get('missing')
+    with pytest.raises(KeyError):
+        portfolios.get('../a')
+
+
+def test_checked_out_portfolio_stays_loaded(registry):
+    evicted = []
+    portfolios = registry(max_loaded=1, on_evict=lambda loaded: evicted.append(loaded.portfolio_id))
+    a = portfolios.checkout('a')
+    portfolios.get('b')
+    # a is in use, so b (just loaded) is kept as well until the next sweep
+    assert loaded_ids(portfolios) == ['a', 'b']
+
+    portfolios.checkin(a)
+    portfolios.sweep()
+    assert loaded_ids(portfolios) == ['b']
+    assert evicted == ['a']
+
+
+def test_idle_portfolio_is_unloaded(registry):
+    portfolios = registry(idle_timeout=0.0)
+    loaded = portfolios.checkout('a')
+    portfolios.sweep()
+    assert loaded_ids(portfolios) == ['a']
+
+    portfolios.checkin(loaded)
+    portfolios.sweep()
+    assert loaded_ids(portfolios) == []
+
+
+def test_writes_count_towards_the_memory_limit(registry):
+    portfolios = registry()
+    loaded = portfolios.checkout('a')
+    size = loaded.size
+    assert size > 0
+
+    rows = [transaction('2024-02-01', 'AAA', 'Buy', 1, 100 + n) for n in range(50)]
+    loaded.state.add_transactions(rows)
+    portfolios.checkin(loaded)
+    assert loaded.size > size
+
+    # The sweep sees the new size: over the limit now, so the portfolio goes
+    portfolios.max_bytes = size
+    portfolios.sweep()
+    assert loaded_ids(portfolios) == []
+
+
+def test_sweep_measures_before_picking(registry):
+    portfolios = registry()
+    loaded = portfolios.get('a')
+    size = loaded.size
+
+    # Written to without a checkout (e.g. by another worker's snapshot)
+    loaded.state.add_transactions([transaction('2024-02-01', 'AAA', 'Buy', 1, 100 + n) for n in range(50)])
+    assert loaded.size == size
+    portfolios.max_bytes = size
+    portfolios.sweep()
+    assert loaded_ids(portfolios) == []
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from compactor import compact_journal
+from data_loader import load_portfolio_from_excel
+from journal import TransactionJournal, read_journal_checkpoint
+from portfolio_state import PortfolioState
+from prices import price_pairs, validate_prices
+from storage import ExcelBackend
+
+from conftest import transaction
+
+
+def price_of(path, symbol, include_journal=True):
+    df = load_portfolio_from_excel(path, use_cache=False, include_journal=include_journal)
+    return df.set_index('Company Symbol').loc[symbol, 'Current Market Price (PKR)']
+
+
+def test_validation():
+    prices, rejected = validate_prices(price_pairs({'prices': [
+        {'symbol': ' aaa ', 'price': '12.5'},
+        {'Company Symbol': 'BBB', 'Current Market Price (PKR)': 3},
+        {'symbol': 'CCC', 'price': -1},
+        {'symbol': 'DDD', 'price': 'n/a'},
+        {'price': 4},
+    ]}))
+    assert prices == {'AAA': 12.5, 'BBB': 3.0}
+    assert [rejection['symbol'] for rejection in rejected] == ['CCC', 'DDD', None]
+
+    with pytest.raises(ValueError):
+        price_pairs("12.5")
+
+
+def test_updates_are_journaled_not_written(workbook):
+    storage = ExcelBackend(workbook, compact_interval=3600)
+    before = os.stat(workbook).st_mtime_ns
+
+    storage.update_prices({'AAA': 150.0, 'NEW': 3.0})
+    storage.update_prices({'AAA': 155.0})
+
+    # The workbook itself is only written by the compactor
+    assert os.stat(workbook).st_mtime_ns == before
+    assert price_of(workbook, 'AAA', include_journal=False) == 140.0
+    assert price_of(workbook, 'AAA') == 155.0
+    assert price_of(workbook, 'NEW') == 3.0
+    assert storage.journal.read_prices() == [(1, {'AAA': 150.0, 'NEW': 3.0}), (2, {'AAA': 155.0})]
+
+
+def test_compaction_writes_rows_and_prices(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+    journal.append_prices({'AAA': 150.0})
+    journal.append_prices({'AAA': 155.0, 'NEW': 3.0})
+
+    assert compact_journal(journal) == 3
+    assert read_journal_checkpoint(workbook) == 3
+    assert journal.read_entries() == [] and journal.read_prices() == []
+    assert price_of(workbook, 'AAA', include_journal=False) == 155.0
+    assert price_of(workbook, 'NEW', include_journal=False) == 3.0
+
+
+def test_compaction_limit_keeps_later_prices(workbook):
+    journal = TransactionJournal(workbook)
+    journal.append([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+    journal.append_prices({'AAA': 150.0})
+
+    assert compact_journal(journal, through_seq=1) == 1
+    assert journal.read_prices() == [(2, {'AAA': 150.0})]
+    assert price_of(workbook, 'AAA', include_journal=False) == 140.0
+    assert price_of(workbook, 'AAA') == 150.0
+
+
+def test_state_reprices_without_reaggregating(workbook):
+    state = PortfolioState(ExcelBackend(workbook, compact_interval=3600))
+    state.rebuild()
+    before = state.snapshot
+
+    assert state.update_prices({'AAA': 150.0, 'ZZZ': 1.0}) == 1
+    after = state.snapshot
+    assert after.version == before.version + 1
+    assert after.analysis is before.analysis
+    row = after.symbol_index['AAA']
+    assert row['Current Market Price (PKR)'] == 150.0
+    assert row['Market Value (PKR)'] == 10 * 150.0
+
+    # A rebuild reads the journaled prices back
+    state.rebuild()
+    assert state.snapshot.symbol_index['AAA']['Current Market Price (PKR)'] == 150.0
+
+
+def test_prices_endpoint(client):
+    response = client.post('/api/prices', json={'bbb': 12.0})
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True, 'updated': 1, 'changed': 1}
+    assert client.get('/company/BBB').get_json()['current_price'] == 12.0
+
+    # All or nothing
+    rejected = client.post('/api/prices', json={'BBB': 13.0, 'CCC': 'free'})
+    assert rejected.status_code == 400
+    assert rejected.get_json()['rejected'] == [{'symbol': 'CCC', 'reason': "Invalid price: 'free'"}]
+    assert client.get('/company/BBB').get_json()['current_price'] == 12.0
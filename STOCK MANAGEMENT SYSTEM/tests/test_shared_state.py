@@ -0,0 +1,75 @@
+import shutil
+
+import pytest
+
+from shared_state import SharedPortfolioState, shared_dir_for
+from storage import ExcelBackend
+
+from conftest import transaction
+
+
+class FlakyStorage(ExcelBackend):
+    """
+    An Excel storage whose first `failures` loads raise
+    """
+
+    def __init__(self, excel_file, failures=0):
+        super().__init__(excel_file, compact_interval=3600)
+        self.failures = failures
+
+    def load_transactions(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("workbook unreadable")
+        return super().load_transactions()
+
+
+@pytest.fixture
+def shared(workbook):
+    states = []
+
+    def open_state(failures=0):
+        state = SharedPortfolioState(FlakyStorage(workbook, failures), workbook, poll_interval=0.05)
+        states.append(state)
+        return state
+
+    yield open_state
+    for state in states:
+        state.close()
+    shutil.rmtree(shared_dir_for(workbook), ignore_errors=True)
+
+
+def test_failed_rebuild_gives_the_owner_lock_back(shared):
+    first = shared(failures=1)
+    with pytest.raises(OSError):
+        first._try_become_owner()
+    assert not first.is_owner
+
+    # The lock was released, so another worker can take over
+    second = shared()
+    assert second._try_become_owner()
+    assert second.snapshot.version == 1
+
+
+def test_owner_retries_after_a_failed_rebuild(shared):
+    state = shared(failures=1)
+    with pytest.raises(OSError):
+        state._try_become_owner()
+
+    assert state._try_become_owner()
+    assert state.is_owner
+    assert set(state.snapshot.portfolio_df['Company Symbol']) == {'AAA', 'BBB'}
+
+
+def test_reader_sees_the_owners_snapshots(shared):
+    owner = shared()
+    owner.start()
+    reader = shared()
+    reader.start(timeout=5)
+    assert owner.is_owner and not reader.is_owner
+    assert reader.snapshot.version == owner.snapshot.version
+
+    # A reader's write goes to the storage; it returns once the owner has published it
+    reader.add_transactions([transaction('2024-02-01', 'CCC', 'Buy', 2, 50)])
+    assert 'CCC' in set(reader.snapshot.portfolio_df['Company Symbol'].astype(str))
+    assert reader.snapshot.version == owner.snapshot.version
@@ -0,0 +1,36 @@
+import pytest
+
+
+def test_plain_summary_has_no_lot_split(client):
+    data = client.get('/summary').get_json()
+    assert 'realized_profit_loss' not in data
+    assert 'unrealized_profit_loss' not in data
+
+
+@pytest.mark.parametrize('method', ['fifo', 'lifo', 'average'])
+def test_lot_split_adds_up_to_the_net_profit(client, method):
+    plain = client.get('/summary').get_json()
+    data = client.get(f'/summary?method={method}').get_json()
+
+    assert data['cost_method'] == method
+    for key, value in plain.items():
+        assert data[key] == pytest.approx(value)
+    assert data['realized_profit_loss'] + data['unrealized_profit_loss'] == pytest.approx(
+        data['net_profit_loss'])
+
+
+def test_fifo_realized_profit(client):
+    # AAA: 4 sold at 130 out of the lot at 100; DDD: 2 sold at 20 out of the lot at 30
+    data = client.get('/summary?method=fifo').get_json()
+    assert data['realized_profit_loss'] == pytest.approx(4 * (130 - 100) + 2 * (20 - 30))
+
+
+def test_lot_summary_is_kept_per_version(server):
+    snapshot = server.state.snapshot
+    assert snapshot.lot_summary('fifo') is snapshot.lot_summary('fifo')
+    assert 'realized_profit_loss' not in snapshot.summary
+
+
+def test_unknown_method_is_rejected(client):
+    response = client.get('/summary?method=newest')
+    assert response.status_code == 400
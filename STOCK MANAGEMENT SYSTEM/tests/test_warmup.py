@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from warmup import WarmUp
+
+
+@pytest.fixture
+def loading(server, monkeypatch):
+    """
+    Puts the app back in its loading phase: the warm-up job waits until
+    the event is set
+    """
+    release = threading.Event()
+    warmup = WarmUp(release.wait, name='test-warm-up').start()
+    monkeypatch.setattr(server, 'warmup', warmup)
+    yield release
+    release.set()
+    warmup.wait(5)
+
+
+def test_retries_until_the_job_succeeds():
+    calls = []
+
+    def job():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError("workbook locked")
+
+    warmup = WarmUp(job, retry_interval=0.01).start()
+    assert warmup.wait(5)
+    status = warmup.status()
+    assert status['ready'] and status['attempts'] == 3 and status['error'] is None
+
+
+def test_data_endpoints_answer_503_while_loading(client, loading):
+    response = client.get('/summary')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(response.get_json()['retry_after'])
+    assert response.get_json()['success'] is False
+
+
+def test_readyz_follows_the_warm_up(client, server, loading):
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert response.get_json()['ready'] is False
+
+    loading.set()
+    assert server.warmup.wait(5)
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+    assert client.get('/summary').status_code == 200
+
+
+def test_exempt_endpoints_answer_while_loading(client, loading):
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+    assert client.get('/').status_code == 200
+    assert client.get('/metrics').status_code == 200
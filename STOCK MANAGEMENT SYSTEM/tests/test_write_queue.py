@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+from write_queue import DURABLE, FAILED, QUEUED, TransactionQueue
+
+from conftest import transaction
+
+
+class Snapshot:
+    def __init__(self, version):
+        self.version = version
+
+
+class FakeState:
+    """
+    Stands in for a PortfolioState: stores rows in a list, and can fail
+    before storing (store_error) or after it (apply_error)
+    """
+
+    def __init__(self, store_error=None, apply_error=None):
+        self.rows = []
+        self.snapshot = Snapshot(1)
+        self.store_error = store_error
+        self.apply_error = apply_error
+
+    def add_transactions(self, records, on_stored=None):
+        if self.store_error:
+            raise self.store_error
+        self.rows.extend(records)
+        if on_stored is not None:
+            on_stored(len(records))
+        if self.apply_error:
+            raise self.apply_error
+        self.snapshot = Snapshot(self.snapshot.version + 1)
+        return len(records)
+
+
+@pytest.fixture
+def queue():
+    return TransactionQueue()
+
+
+def row(n=1):
+    return transaction('2024-02-01', 'AAA', 'Buy', n, 100)
+
+
+def test_queued_then_durable(queue):
+    state = FakeState()
+    txn_id = queue.submit(state, row())
+
+    status = queue.wait(txn_id, 5)
+    assert status['status'] == DURABLE
+    assert status['applied'] and status['version'] == 2 and status['error'] is None
+    assert status['stored_at'] is not None
+    assert state.rows == [row()]
+
+
+def test_failed_when_nothing_was_stored(queue):
+    txn_id = queue.submit(FakeState(store_error=OSError("disk full")), row())
+
+    status = queue.wait(txn_id, 5)
+    assert status['status'] == FAILED
+    assert status['error'] == "disk full"
+    assert status['stored_at'] is None and status['version'] is None
+
+
+def test_durable_but_not_applied(queue):
+    txn_id = queue.submit(FakeState(apply_error=ValueError("bad price")), row())
+
+    status = queue.wait(txn_id, 5)
+    assert status['status'] == DURABLE
+    assert not status['applied']
+    assert status['error'] == "bad price"
+
+
+def test_failing_callback_does_not_stop_the_writer(queue):
+    state = FakeState()
+    done = []
+
+    def broken():
+        raise RuntimeError("checkin failed")
+
+    first = queue.submit(state, row(1), on_done=broken)
+    assert queue.wait(first, 5)['status'] == DURABLE
+
+    second = queue.submit(state, row(2), on_done=lambda: done.append(True))
+    assert queue.wait(second, 5)['status'] == DURABLE
+    assert done == [True]
+    assert len(state.rows) == 2
+
+
+def test_failing_snapshot_still_finishes_the_batch(queue):
+    class NoSnapshot(FakeState):
+        @property
+        def snapshot(self):
+            raise RuntimeError("no snapshot")
+
+        @snapshot.setter
+        def snapshot(self, value):
+            pass
+
+    released = threading.Event()
+    txn_id = queue.submit(NoSnapshot(), row(), on_done=released.set)
+    status = queue.wait(txn_id, 5)
+    assert status['status'] == DURABLE and not status['applied']
+    assert released.wait(5)
+
+    # The writer is still running
+    assert queue.wait(queue.submit(FakeState(), row()), 5)['status'] == DURABLE
+
+
+def test_only_finished_ids_are_forgotten(monkeypatch):
+    queue = TransactionQueue(max_finished=2)
+    # No writer thread: the test runs the batches itself
+    monkeypatch.setattr(queue, '_ensure_started', lambda: None)
+    state = FakeState()
+    old = queue.submit(state, row())
+    for _ in range(5):
+        queue.submit(state, row())
+
+    batch = list(queue._queue)
+    queue._store(batch[1:])
+
+    assert queue.status(old)['status'] == QUEUED
+    assert [queue.status(txn_id) is not None for txn_id, _, _, _ in batch[1:]] == [False] * 3 + [True] * 2
+
+
+def test_add_transaction_becomes_durable(client):
+    before = client.get('/summary').get_json()['total_investment']
+    response = client.post('/api/add_transaction', json={
+        'date': '2024-03-01', 'symbol': 'CCC', 'companyName': 'CCC Ltd', 'transactionType': 'Buy',
+        'quantity': 2, 'price': 50, 'totalAmount': 100, 'remarks': None
+    })
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data['status'] == QUEUED
+    assert data['status_url'] == f"/api/transactions/{data['transaction_id']}"
+
+    status = client.get(data['status_url'] + '?wait=5').get_json()
+    assert status['status'] == DURABLE and status['applied']
+    assert client.get('/summary').get_json()['total_investment'] == pytest.approx(before + 100)
+
+
+def test_rejected_and_unknown_transactions(client):
+    response = client.post('/api/add_transaction', json={
+        'date': '2024-03-01', 'symbol': 'CCC', 'companyName': 'CCC Ltd', 'transactionType': 'Buy',
+        'quantity': 'two', 'price': 50, 'totalAmount': 100, 'remarks': None
+    })
+    assert response.status_code == 400
+    assert client.get('/api/transactions/nope').status_code == 404
+    assert client.get('/api/transactions/nope?wait=soon').status_code == 400
@@ -0,0 +1,67 @@
+import threading
+import time
+
+
+class WarmUp:
+    """
+    Runs the slow start-up work (loading the portfolio) on a background
+    thread, so the server can answer requests right away. If the work
+    fails, it is tried again every `retry_interval` seconds.
+    """
+
+    def __init__(self, job, retry_interval=10.0, name='warm-up'):
+        self.job = job
+        self.retry_interval = retry_interval
+        self.attempts = 0
+        self.error = None
+        self._started = None
+        self._finished = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the warm-up is done (for scripts and tests).
+        Returns False if `timeout` ran out first.
+        """
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while True:
+            self.attempts += 1
+            try:
+                self.job()
+            except Exception as e:
+                self.error = str(e)
+                print(f"❌ Warm-up failed (attempt {self.attempts}), retrying in {self.retry_interval:.0f}s. {e}")
+                time.sleep(self.retry_interval)
+                continue
+            self.error = None
+            self._finished = time.monotonic()
+            self._ready.set()
+            print(f"✓ Warm-up finished in {self._finished - self._started:.2f}s.")
+            return
+
+    def status(self):
+        """
+        {'ready', 'seconds' (load time, or time spent so far), 'attempts', 'error'}
+        """
+        if self._started is None:
+            seconds = 0.0
+        else:
+            seconds = (self._finished or time.monotonic()) - self._started
+        return {
+            'ready': self.ready,
+            'seconds': round(seconds, 3),
+            'attempts': self.attempts,
+            'error': self.error
+        }
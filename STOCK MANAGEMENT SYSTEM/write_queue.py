@@ -0,0 +1,160 @@
+import datetime
+import threading
+import uuid
+from collections import OrderedDict, deque
+
+from metrics import metrics
+
+# What a transaction id can report
+QUEUED = 'queued'
+DURABLE = 'durable'
+FAILED = 'failed'
+
+
+class TransactionQueue:
+    """
+    Write-behind queue for new transactions.
+
+    A request only enqueues its row and gets a transaction id back. One
+    background writer thread takes everything queued so far and stores it
+    with a single add_transactions() call per portfolio (one journal write,
+    one recompute, one new snapshot), so simultaneous submissions never race
+    on the files and bursts are coalesced. Callers that need the row to be
+    durable ask status() or wait() for its id.
+
+    A row is 'durable' once the storage has it, even if applying it
+    afterwards failed ('applied' False, with the error): it is loaded again
+    on the next rebuild, so retrying it would add it twice. 'failed' means
+    it was not stored.
+
+    Ids are known to the process that accepted them; the most recent
+    `max_finished` finished ones are remembered.
+    """
+
+    def __init__(self, max_finished=10000):
+        self.max_finished = max_finished
+        self._queue = deque()  # (txn_id, state, record, on_done)
+        self._status = OrderedDict()  # txn_id -> status dict, oldest first
+        self._finished = deque()  # finished txn_ids, oldest first
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='transaction-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, state, record, on_done=None):
+        """
+        Queues one transaction for `state` and returns its id. `on_done()`
+        is called once the writer is finished with it (stored or not).
+        """
+        txn_id = uuid.uuid4().hex
+        with self._changed:
+            self._ensure_started()
+            self._status[txn_id] = {
+                'id': txn_id,
+                'status': QUEUED,
+                'queued_at': datetime.datetime.now().isoformat(timespec='milliseconds'),
+                'stored_at': None,
+                'applied': False,
+                'version': None,
+                'error': None
+            }
+            self._queue.append((txn_id, state, record, on_done))
+            metrics.set('portfolio_write_queue_depth', len(self._queue))
+            self._changed.notify_all()
+        return txn_id
+
+    def status(self, txn_id):
+        """
+        {'id', 'status' (queued/durable/failed), 'queued_at', 'stored_at',
+        'applied' (in the served data), 'version' (first snapshot that
+        contains it), 'error'}, or None for an unknown id
+        """
+        with self._changed:
+            status = self._status.get(txn_id)
+            return dict(status) if status is not None else None
+
+    def wait(self, txn_id, timeout):
+        """
+        Like status(), but first waits up to `timeout` seconds while the
+        transaction is still queued
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: txn_id not in self._status or self._status[txn_id]['status'] != QUEUED,
+                timeout=timeout
+            )
+            status = self._status.get(txn_id)
+            return dict(status) if status is not None else None
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._queue)
+                batch = list(self._queue)
+                self._queue.clear()
+                metrics.set('portfolio_write_queue_depth', 0)
+            # Nothing may stop the writer thread: later submissions would
+            # stay queued forever
+            try:
+                self._store(batch)
+            except Exception as e:
+                print(f"❌ Error in the transaction writer: {e}")
+
+    def _store(self, batch):
+        # One add_transactions() per portfolio, rows kept in submission order
+        by_state = OrderedDict()
+        for txn_id, state, record, _ in batch:
+            by_state.setdefault(id(state), (state, []))[1].append((txn_id, record))
+
+        try:
+            for state, items in by_state.values():
+                self._store_one(state, items)
+        finally:
+            for _, _, _, on_done in batch:
+                if on_done is None:
+                    continue
+                try:
+                    on_done()
+                except Exception as e:
+                    print(f"❌ Warning: Queued transaction callback failed. {e}")
+
+    def _store_one(self, state, items):
+        # Every id of the batch is finished, whatever goes wrong
+        error = None
+        version = None
+        stored = []
+        try:
+            with metrics.span('queue.store'):
+                state.add_transactions([record for _, record in items], on_stored=stored.append)
+            version = state.snapshot.version
+        except Exception as e:
+            print(f"❌ Error storing {len(items)} queued transactions: {e}")
+            error = str(e)
+        finally:
+            self._finish([txn_id for txn_id, _ in items], version, error, bool(stored))
+
+    def _finish(self, txn_ids, version, error, stored):
+        stored_at = datetime.datetime.now().isoformat(timespec='milliseconds')
+        applied = error is None
+        with self._changed:
+            for txn_id in txn_ids:
+                status = self._status.get(txn_id)
+                if status is None:
+                    continue
+                status['status'] = DURABLE if stored else FAILED
+                status['stored_at'] = stored_at if stored else None
+                status['applied'] = applied
+                status['version'] = version if applied else None
+                status['error'] = error
+                self._finished.append(txn_id)
+            self._forget_old()
+            self._changed.notify_all()
+
+    def _forget_old(self):
+        # Only finished ids are dropped: one that waits long in the queue
+        # doesn't keep the ones finished after it
+        while len(self._finished) > self.max_finished:
+            self._status.pop(self._finished.popleft(), None)